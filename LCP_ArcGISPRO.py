@@ -5,177 +5,460 @@
     path between them, in whichever unit the user specified through use of a cost function, and the linear distance of
     the least cost path between them."""
 
+import csv
+import itertools
+import os
+import shutil
+
 import arcpy
+import numpy
 from arcpy.sa import *
 from time import *
 
+import lcp_cache
+import lcp_costs
+import lcp_engine
+import lcp_grids
+import lcp_journal
+import lcp_log
+import lcp_matrix
+import lcp_results
+import lcp_stream
+import lcp_timing
+
 _author_ = "Ian Jorgeson <ijorgeson@mail.smu.edu>"
 
 # Function that calculates pathdistance raster and backlink raster from digital elevation model (DEM), point class
 # shapefile, and vertical factor derived from calorie cost, time cost, or other cost model.
 def path_distance(feature_class, dem, vf, file_name_1):
     try:
-        out_distance_raster = PathDistance(feature_class, "", dem, "", "", dem, vf, "",
-                                           directory + r'\backlink\bl_' + file_name_1)
-        out_distance_raster.save(directory + r'\pathdis\pd_' + file_name_1)
+        with timer.stage('path_distance', source=file_name_1):
+            out_distance_raster = PathDistance(feature_class, "", dem, "", "", dem, vf, max_cost if max_cost else "",
+                                               directory + r'\backlink\bl_' + file_name_1)
+            out_distance_raster.save(directory + r'\pathdis\pd_' + file_name_1)
         return out_distance_raster
     except arcpy.ExecuteError:
-        error = arcpy.GetMessages(2)
-        print(str(error))
-        log.write(asctime() + ': Failed to generate pathdistance and backlink rasters for  ' + loc_one_name
-                  + '.\n' + str(error) +
-                  '------------------------------------------------------------------------------------------' + '\n')
+        log.error('Failed to generate pathdistance and backlink rasters for ' + loc_one_name + '.',
+                  source=loc_one_name, stage='path_distance', error=arcpy.GetMessages(2))
     except Exception as error:
-        print('Failed to generate pathdistance and backlink rasters for ' + loc_one_name)
-        log.write(asctime() + ': Failed to generate pathdistance and backlink rasters for  ' + loc_one_name
-                  + '.\n' + str(error) +
-                  '------------------------------------------------------------------------------------------' + '\n')
+        log.error('Failed to generate pathdistance and backlink rasters for ' + loc_one_name + '.',
+                  source=loc_one_name, stage='path_distance', error=error)
+
+# Function that reads every location in a feature class in a single pass. Returns a list of (name, file name, cell)
+# tuples in the order of the feature class, and a dictionary with the geometry of each location by file name, which is
+# handed to PathDistance and CostPath directly. With the numpy backend, cell is the (row, column) of the DEM cell
+# holding the location, and locations outside the extent of the DEM are logged and left out; with the arcpy backend
+# cell is None. Stops the analysis if two locations share a file name, since their output files would overwrite each
+# other.
+def read_locations(feature_class, name_field, filename_field):
+    names, file_names, x, y = [], [], [], []
+    geometries = {}
+    duplicates = []
+    with arcpy.da.SearchCursor(feature_class, [name_field, filename_field, 'SHAPE@', 'SHAPE@XY']) as location_cursor:
+        for location_row in location_cursor:
+            if location_row[1] in geometries:
+                duplicates.append(location_row[1])
+            names.append(location_row[0])
+            file_names.append(location_row[1])
+            geometries[location_row[1]] = location_row[2]
+            x.append(location_row[3][0])
+            y.append(location_row[3][1])
+    if duplicates:
+        raise ValueError('Short names ' + ', '.join(str(name) for name in sorted(set(duplicates))) + ' in field '
+                         + filename_field + ' of ' + feature_class + ' are used by more than one location. Short '
+                         'names need to be unique.')
+    if backend != 'numpy':
+        return [(name, file_name, None) for name, file_name in zip(names, file_names)], geometries
+    inside = lcp_engine.xy_inside(x, y, dem_xmin, dem_ymax, dem_cellsize, dem_shape).tolist()
+    for name, keep in zip(names, inside):
+        if not keep:
+            log.warning('Location ' + str(name) + ' in ' + feature_class + ' falls outside the extent of the DEM. '
+                        'It is left out of the analysis.', source=name, stage='read_locations')
+    names, file_names, x, y = ([value for value, keep in zip(values, inside) if keep]
+                               for values in (names, file_names, x, y))
+    rows, cols = lcp_engine.xy_to_cells(x, y, dem_xmin, dem_ymax, dem_cellsize, dem_shape)
+    return list(zip(names, file_names, zip(rows.tolist(), cols.tolist()))), geometries
+
+# Function that adds the results of the pair of locations with the given key (source feature class, source short name,
+# destination short name) to the results file, and to the cost and distance matrices of the source feature class if
+# save_matrix is True and there is one. row holds the values written to the master table, or None for a pair with no
+# least cost path, which only goes in the matrices.
+def add_result(key, row):
+    if row is not None:
+        result_buffer.add(*row)
+    if key[0] in matrices:
+        matrices[key[0]].set(key[1], key[2], None if row is None else row[2], None if row is None else row[3])
+
+# Function that returns True if the pair of locations with the given key, (source feature class, source short name,
+# destination short name) as recorded in the progress journal, still has to be calculated: it was not finished by an
+# earlier run, and is listed in pairs_file if that is set.
+def pending_pair(key):
+    if journal.is_done(key):
+        return False
+    names = (key[1], key[2]) if key[0] == fc_one else (key[2], key[1])
+    return pair_names is None or names in pair_names
+
+# Function that returns the extent of all locations in fc_one and fc_two, enlarged by buffer_distance on every side and
+# limited to dem_extent, as the "xmin ymin xmax ymax" rectangle used by Clip_management.
+def clip_rectangle(dem_extent, buffer_distance):
+    extents = [arcpy.Describe(fc_one).extent, arcpy.Describe(fc_two).extent]
+    xmin = max(min(extent.XMin for extent in extents) - buffer_distance, dem_extent.XMin)
+    ymin = max(min(extent.YMin for extent in extents) - buffer_distance, dem_extent.YMin)
+    xmax = min(max(extent.XMax for extent in extents) + buffer_distance, dem_extent.XMax)
+    ymax = min(max(extent.YMax for extent in extents) + buffer_distance, dem_extent.YMax)
+    return ' '.join(str(value) for value in (xmin, ymin, xmax, ymax))
+
+# Function that reads the DEM for the numpy backend into a memory mapped .npy file, block_rows rows at a time, with
+# NoData as NaN. Neither the DEM nor anything calculated from it has to fit in memory at once; the operating system only
+# loads the parts of the file the analysis reads. A 64 bit floating point DEM keeps its precision; any other DEM is held
+# as float32, which is exact for 16 bit integer and 32 bit floating point DEMs and leaves room for NaN.
+def numpy_dem(raster, dem_file, block_rows=1024):
+    rows, cols = raster.height, raster.width
+    dtype = 'float64' if raster.pixelType == 'F64' else 'float32'
+    dem = numpy.lib.format.open_memmap(dem_file, mode='w+', dtype=dtype, shape=(rows, cols))
+    for top in range(0, rows, block_rows):
+        block_height = min(block_rows, rows - top)
+        lower_left = arcpy.Point(dem_xmin, dem_ymax - (top + block_height) * dem_cellsize)
+        block = arcpy.RasterToNumPyArray(raster, lower_left, cols, block_height)
+        # NoData is found in the values as read, before casting could round another elevation onto it
+        nodata = None if raster.noDataValue is None else block == raster.noDataValue
+        block = block.astype(dtype)
+        if nodata is not None:
+            block[nodata] = numpy.nan
+        dem[top:top + block_height] = block
+    dem.flush()
+    return dem
+
+# Function that runs the numpy backend for every pair of locations in sources and destinations, lists of (name, file
+# name, cell) tuples as returned by read_locations, with lcp_stream.least_cost_paths. Pathdistance and backlink grids
+# are calculated by lcp_batch, in parallel if workers is greater than one, and handed back in the order of sources so
+# the master table is filled in the same order as a serial run. With symmetric = True, each pair of locations is only
+# calculated once. With reverse_search = True, searches start from whichever of sources and destinations has fewer
+# locations. Grids kept in grid_cache by earlier runs are reused, and pairs already in the progress journal for
+# source_fc are skipped.
+def numpy_analysis(sources, destinations, source_fc, symmetric=False):
+    completed = set((source[1], destination[1]) for source in sources for destination in destinations
+                    if journal.is_done((source_fc, source[1], destination[1])))
+    results = lcp_stream.least_cost_paths(dem_array, dem_cellsize, vf_array, sources, destinations, workers=workers,
+                                          max_cost=max_cost, stop_at_destinations=stop_at_destinations,
+                                          symmetric=symmetric, reverse=reverse_search,
+                                          surface_distance=surface_distance is True, cache_folder=grid_cache_folder,
+                                          cache_limit_gb=grid_cache_limit_gb, compress_grids=compress_grids,
+                                          memory_limit_gb=memory_limit_gb, scratch=directory + r'\scratch',
+                                          timer=timer, on_error=numpy_error, weights=dem_weights,
+                                          fingerprint=dem_fingerprint, completed=completed,
+                                          on_grids=lambda source, grid_file: save_numpy_rasters(grid_file, source[1]),
+                                          with_paths=True)
+    numpy_cost_paths(results, source_fc)
+
+# Function that runs the numpy backend for a list of (source, destination) pairs of locations, as returned by
+# lcp_stream.read_pairs, answering each pair with its own A* search guided by landmarks instead of a search over the
+# whole DEM from each source. The landmarks are kept in grid_cache, if it is set, and reused by every later run with
+# the same DEM and cost model. Pairs already in the progress journal for source_fc are skipped.
+def numpy_pair_analysis(pairs, source_fc):
+    completed = set((source[1], destination[1]) for source, destination in pairs
+                    if journal.is_done((source_fc, source[1], destination[1])))
+    results = lcp_stream.least_cost_paths(dem_array, dem_cellsize, vf_array, pairs=pairs, workers=workers,
+                                          max_cost=max_cost, landmarks=landmarks,
+                                          surface_distance=surface_distance is True, cache_folder=grid_cache_folder,
+                                          cache_limit_gb=grid_cache_limit_gb, compress_grids=compress_grids,
+                                          scratch=directory + r'\scratch', timer=timer, on_error=numpy_error,
+                                          weights=dem_weights, fingerprint=dem_fingerprint, completed=completed,
+                                          with_paths=True)
+    numpy_cost_paths(results, source_fc)
+
+# Function that logs a search of the numpy backend that failed, as reported by lcp_stream.least_cost_paths, which then
+# carries on with the next search. name_2 is None if the search from name_1 to every destination failed.
+def numpy_error(name_1, name_2, error):
+    if name_2 is None:
+        log.error('Failed to calculate some or all of the least cost paths from ' + name_1 + '.', source=name_1,
+                  stage='path_distance', error=error)
+    else:
+        log.error('Failed to calculate the least cost path between ' + name_1 + ' and ' + name_2 + '.',
+                  source=name_1, destination=name_2, stage='astar', error=error)
+
+# Function used by the numpy backend when allocation is True. Finds the location in sources with the least cost path to
+# each location in destinations with a single search started from every source at once, and stores the names, cost, and
+# length of that path for each destination in the master table and the cost and distance matrices, where a destination
+# that no source can reach gets an infinite cost from every source. Saves the
+# allocation raster, with the number of the nearest source to every cell (its position in sources, counting from 1;
+# allocation_values.csv lists the locations by number), and the pathdistance raster of the search, with the cost from
+# the nearest source to every cell. The rows of each destination are recorded in the progress journal, and when every
+# destination was finished by an earlier run, nothing is calculated again.
+def numpy_allocation(sources, destinations, source_fc):
+    finished = set(key[2] for key in journal.completed if key[0] == source_fc)
+    if all(destination[1] in finished for destination in destinations):
+        log.info('Every location was allocated to its nearest source by an earlier run.')
+        return
+    allocation_grid, accumulated, results = lcp_stream.nearest_sources(dem_array, dem_cellsize, vf_array, sources,
+                                                                       destinations, weights=dem_weights,
+                                                                       max_cost=max_cost,
+                                                                       surface_distance=surface_distance is True,
+                                                                       timer=timer, with_paths=True)
+    with timer.stage('raster_save'):
+        lower_left = arcpy.Point(dem_xmin, dem_ymax - dem_array.shape[0] * dem_cellsize)
+        out_allocation_raster = arcpy.NumPyArrayToRaster(allocation_grid + 1, lower_left, dem_cellsize, dem_cellsize, 0)
+        out_allocation_raster.save(directory + r'\allocation')
+        out_distance_raster = arcpy.NumPyArrayToRaster(numpy.where(numpy.isfinite(accumulated), accumulated,
+                                                                   -1).astype('float32'), lower_left, dem_cellsize,
+                                                       dem_cellsize, -1)
+        out_distance_raster.save(directory + r'\pathdis\pd_alloc')
+        with open(directory + r'\allocation_values.csv', 'w', newline='') as values_file:
+            values_writer = csv.writer(values_file)
+            values_writer.writerow(['Value', 'Short_Name', 'Name'])
+            for number, (name, file_name, cell) in enumerate(sources, 1):
+                values_writer.writerow([number, file_name, name])
+    with timer.stage('table_write'):
+        for result in results:
+            name_2, file_name_2 = result.destination[0], result.destination[1]
+            # destinations finished by an earlier run are already in the results
+            if file_name_2 in finished:
+                continue
+            if result.source is None:
+                log.warning('No least cost path to ' + name_2 + ' from any location. Destination cannot be reached '
+                            'with this DEM and cost table.', destination=name_2)
+                # the destination has no least cost path from any source, which the matrices record as infinity
+                for source in sources:
+                    add_result((source_fc, source[1], file_name_2), None)
+                    journal.record((source_fc, source[1], file_name_2), None)
+                continue
+            row = (str(result.source[0]), str(name_2), result.cost, result.distance)
+            add_result((source_fc, result.source[1], file_name_2), row)
+            journal.record((source_fc, result.source[1], file_name_2), row)
+    if save_matrix is True:
+        matrices[source_fc].flush()
+    log.info('Allocated ' + str(sum(result.source is not None for result in results)) + ' of '
+             + str(len(destinations)) + ' locations to their nearest source.')
+
+# Function used by the numpy backend when corridor_percent is set. For each (source, destination) pair of locations in
+# pairs, saves the least cost corridor as a raster in the corridor folder, holding the cost of the best path through
+# every cell that costs no more than corridor_percent above the least cost path, and adds the least cost path to the
+# master table and the cost and distance matrices. Up to alternative_paths diverse paths within the corridor, starting
+# with the least cost path itself, are listed in alternatives.csv with their rank, cost, length, and the fraction of
+# their cells they share with the paths ranked above them, and saved as polylines if save_polylines is True. The
+# searches from each location are kept in grid_cache_folder, or in a temporary cache for the run if it is not set, so
+# each location is searched at most once. The least cost path of each pair is recorded in the progress journal, and
+# pairs finished by an earlier run are skipped, keeping their rows in alternatives.csv.
+def numpy_corridors(pairs, source_fc):
+    os.makedirs(directory + r'\corridor', exist_ok=True)
+    lower_left = arcpy.Point(dem_xmin, dem_ymax - dem_array.shape[0] * dem_cellsize)
+    pending = [(source, destination) for source, destination in pairs
+               if not journal.is_done((source_fc, source[1], destination[1]))]
+    resumed = len(pending) < len(pairs) and os.path.exists(directory + r'\alternatives.csv')
+    with open(directory + r'\alternatives.csv', 'a' if resumed else 'w', newline='') as alternatives_file:
+        alternatives_writer = csv.writer(alternatives_file)
+        if not resumed:
+            alternatives_writer.writerow(['Source', 'Dest', 'Rank', 'PathCost', 'Distance', 'Overlap'])
+        results = lcp_stream.corridors(dem_array, dem_cellsize, vf_array, pending, corridor_percent / 100.0,
+                                       alternative_paths, alternative_overlap, weights=dem_weights, max_cost=max_cost,
+                                       surface_distance=surface_distance is True, cache_folder=grid_cache_folder,
+                                       cache_limit_gb=grid_cache_limit_gb, compress_grids=compress_grids,
+                                       scratch=directory + r'\scratch', timer=timer)
+        # corridors() yields one result for each pair, in the order of pairs
+        for (source, destination), result in zip(pending, results):
+            file_name_1, file_name_2 = source[1], destination[1]
+            key = (source_fc, file_name_1, file_name_2)
+            if not result.paths:
+                log.warning('No least cost path between ' + result.source + ' and ' + result.destination + '. '
+                            'Destination cannot be reached from source with this DEM and cost table.',
+                            source=result.source, destination=result.destination)
+                add_result(key, None)
+                journal.record(key, None)
+                continue
+            try:
+                with timer.stage('raster_save', source=file_name_1, destination=file_name_2):
+                    out_corridor_raster = arcpy.NumPyArrayToRaster(numpy.where(numpy.isfinite(result.corridor),
+                                                                               result.corridor, numpy.float32(-1)),
+                                                                   lower_left, dem_cellsize, dem_cellsize, -1)
+                    out_corridor_raster.save(directory + r'\corridor\co_' + file_name_1 + '_' + file_name_2)
+                for alternative in result.paths:
+                    alternatives_writer.writerow([result.source, result.destination, alternative.rank,
+                                                  alternative.cost, alternative.distance, alternative.overlap])
+                    if save_polylines is True and len(alternative.path) > 1:
+                        with timer.stage('vectorize', source=file_name_1, destination=file_name_2):
+                            vertices = lcp_engine.path_vertices(alternative.path, dem_xmin, dem_ymax, dem_cellsize,
+                                                                dem_array.shape[1])
+                            polyline = arcpy.Polyline(arcpy.Array([arcpy.Point(x, y) for x, y in vertices]),
+                                                      dem_raster.spatialReference)
+                            arcpy.CopyFeatures_management(polyline, directory + r'\polylines\pl_' + file_name_1 + '_'
+                                                          + file_name_2 + '_' + str(alternative.rank) + '.shp')
+                with timer.stage('table_write', source=file_name_1, destination=file_name_2):
+                    row = (str(result.source), str(result.destination), result.paths[0].cost,
+                           result.paths[0].distance)
+                    add_result(key, row)
+                    journal.record(key, row)
+            except Exception as error:
+                log.error('Failed to save the least cost corridor between ' + result.source + ' and '
+                          + result.destination + '. Script will continue with next iteration.', source=result.source,
+                          destination=result.destination, stage='corridor', error=error)
+                continue
+            log.progress('Finished least cost corridor between ' + result.source + ' and ' + result.destination
+                         + ' with ' + str(len(result.paths)) + ' paths.', source=result.source,
+                         destination=result.destination)
+    if save_matrix is True:
+        matrices[source_fc].flush()
+
+# Function that saves the pathdistance and backlink grids written by lcp_batch as rasters aligned with the DEM, in the
+# same locations as the output of path_distance, and deletes the temporary grid file. Pathdistance is saved as 32 bit
+# floating point, like the output of PathDistance.
+def save_numpy_rasters(grid_file, file_name_1):
+    with timer.stage('raster_save', source=file_name_1):
+        accumulated, backlink = lcp_grids.load_grids(grid_file)
+        lower_left = arcpy.Point(dem_xmin, dem_ymax - dem_array.shape[0] * dem_cellsize)
+        out_backlink_raster = arcpy.NumPyArrayToRaster(backlink, lower_left, dem_cellsize, dem_cellsize,
+                                                       lcp_engine.BACKLINK_NODATA)
+        out_backlink_raster.save(directory + r'\backlink\bl_' + file_name_1)
+        out_distance_raster = arcpy.NumPyArrayToRaster(numpy.where(numpy.isfinite(accumulated), accumulated,
+                                                                   numpy.float32(-1)), lower_left, dem_cellsize,
+                                                       dem_cellsize, -1)
+        out_distance_raster.save(directory + r'\pathdis\pd_' + file_name_1)
+    os.remove(grid_file)
+
+# Function used by the numpy backend in place of cost_path and convert. Takes the least cost paths traced by
+# lcp_stream.least_cost_paths, TracedPath tuples that come grouped by source, with their length measured directly
+# from the traced cells, and stores the names, cost, and length of each path in the master table, the cost and
+# distance matrices, and the progress journal. Paths are only saved as polylines if save_polylines is True.
+def numpy_cost_paths(results, source_fc):
+    start_time = time()
+    for (name_1, file_name_1, cell_1), source_results in itertools.groupby(results, key=lambda result: result.source):
+        for result in source_results:
+            name_2, file_name_2 = result.destination[0], result.destination[1]
+            start_subtime = time()
+            if result.path is None:
+                log.warning('No least cost path between ' + name_1 + ' and ' + name_2 + '. Destination cannot be '
+                            'reached from source with this DEM and cost table.', source=name_1, destination=name_2)
+                add_result((source_fc, file_name_1, file_name_2), None)
+                journal.record((source_fc, file_name_1, file_name_2), None)
+                continue
+            try:
+                # a path within a single cell has a length of zero, as with error 010151 in convert()
+                if save_polylines is True and len(result.path) > 1:
+                    with timer.stage('vectorize', source=file_name_1, destination=file_name_2):
+                        vertices = lcp_engine.path_vertices(result.path, dem_xmin, dem_ymax, dem_cellsize,
+                                                            dem_array.shape[1])
+                        polyline = arcpy.Polyline(arcpy.Array([arcpy.Point(x, y) for x, y in vertices]),
+                                                  dem_raster.spatialReference)
+                        arcpy.CopyFeatures_management(polyline, directory + r'\polylines\pl_' + file_name_1 + '_'
+                                                      + file_name_2 + '.shp')
+                with timer.stage('table_write', source=file_name_1, destination=file_name_2):
+                    row = (str(name_1), str(name_2), result.cost, result.distance)
+                    add_result((source_fc, file_name_1, file_name_2), row)
+                    journal.record((source_fc, file_name_1, file_name_2), row)
+            except Exception as error:
+                log.error('Failed to properly save data for least cost path between ' + name_1 + ' and ' + name_2 +
+                          ' in master table. Script will continue with next iteration.', source=name_1,
+                          destination=name_2, stage='table_write', error=error)
+                continue
+            subtime = time() - start_subtime
+            log.progress('Finished generating least cost path between ' + name_1 + ' and ' + name_2 + ' in '
+                         + str(subtime) + ' seconds.', source=name_1, destination=name_2, seconds=subtime)
+        log.progress('Calculated least cost paths for site: ' + name_1, source=name_1, seconds=time() - start_time)
+        start_time = time()
+    if save_matrix is True:
+        matrices[source_fc].flush()
 
 # Function that calculates least cost path from a location in a referenced in a point, line, or polygon class shapefile
 # back to the location for which the pathdistance raster was previously calculated.
 def cost_path(feature_class, out_distance_raster, back_link):
     try:
-        out_cost_path = CostPath(feature_class, out_distance_raster, back_link)
+        with timer.stage('cost_path'):
+            out_cost_path = CostPath(feature_class, out_distance_raster, back_link)
         return out_cost_path
     except arcpy.ExecuteError:
-        error = arcpy.GetMessages(2)
-        print(str(error))
-        log.write(asctime() + ': Failed to calculate least cost path between ' + loc_one_name + ' and '
-                  + loc_two_name + '.\n' + str(error) +
-                  '------------------------------------------------------------------------------------------' + '\n')
+        log.error('Failed to calculate least cost path between ' + loc_one_name + ' and ' + loc_two_name + '.',
+                  source=loc_one_name, destination=loc_two_name, stage='cost_path', error=arcpy.GetMessages(2))
     except Exception as error:
-        print('Failed to calculate least cost path between ' + loc_one_name + ' and ' + loc_two_name + '.')
-        print('Script will continue with next iteration.  See error message for more details.')
-        print(error)
-        print('\n')
-        log.write(asctime() + ': Something went wrong while working with costpath raster between '
-                  + loc_one_name + ' and ' + loc_two_name + '.\n'
-                  + 'Script continued with next iteration.  See error message for more details.\n'
-                  + str(error) + '\n'
-                  + '------------------------------------------------------------------------------------------'
-                  + '\n')
+        log.error('Failed to calculate least cost path between ' + loc_one_name + ' and ' + loc_two_name + '. '
+                  'Script will continue with next iteration.  See error message for more details.',
+                  source=loc_one_name, destination=loc_two_name, stage='cost_path', error=error)
 
 # Function that converts resulting least cost path into simplified polyline; calculates length of the resulting
-# polyline; and stores that length, names of source and destination locations, and cost of path in table.
-def convert(costpath, file_name_1, file_name_2, name_1, name_2):
+# polyline; and stores that length, names of source and destination locations, and cost of path in table. If key is
+# given, the stored values are also recorded under it in the progress journal.
+def convert(costpath, file_name_1, file_name_2, name_1, name_2, key=None):
     try:
-        arcpy.RasterToPolyline_conversion(costpath, directory + '\polylines\pl_' + file_name_1 + '_' + file_name_2,
-                                          "ZERO", 10, "SIMPLIFY")
+        with timer.stage('vectorize', source=file_name_1, destination=file_name_2):
+            arcpy.RasterToPolyline_conversion(costpath, directory + '\polylines\pl_' + file_name_1 + '_' + file_name_2,
+                                              "ZERO", 10, "SIMPLIFY")
         distance = 0
-        with arcpy.da.SearchCursor(directory + '\polylines\pl_' + file_name_1 + '_' + file_name_2 + '.shp',
-                                   ['SHAPE@LENGTH']) as poly_cursor:
-            for row in poly_cursor:
-                distance += row[0]  # sum distance for each polyline segment
+        with timer.stage('length', source=file_name_1, destination=file_name_2):
+            with arcpy.da.SearchCursor(directory + '\polylines\pl_' + file_name_1 + '_' + file_name_2 + '.shp',
+                                       ['SHAPE@LENGTH']) as poly_cursor:
+                for row in poly_cursor:
+                    distance += row[0]  # sum distance for each polyline segment
     except arcpy.ExecuteError:
         error = arcpy.GetMessages(2)
-        str_error = str(error)
-        if str_error.startswith('ERROR 010151'):
-            print('\nCannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name +
-                  ' to a valid polyline, but rest of data should be saved properly.  Source and destination may be too'
-                  'close to each other.')
-            print('Linear distance between source and destination set to zero in output table.')
-            print(str(error))
-            log.write(asctime() + ': Cannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name +
-                      ' to a valid polyline, but rest of data should be saved properly.\n'
-                      + 'Linear distance between source and destination set to zero in output table.\n' + str(error) +
-                      '------------------------------------------------------------------------------------------'
-                      + '\n')
+        if lcp_log.error_code(error) == '010151':
+            log.warning('Cannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name + ' to a '
+                        'valid polyline, but rest of data should be saved properly.  Source and destination may be '
+                        'too close to each other. Linear distance between source and destination set to zero in '
+                        'output table.', source=loc_one_name, destination=loc_two_name, stage='vectorize',
+                        error=error)
             distance = 0
         else:
-            print('\nCannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name +
-                  ' to a valid polyline, but rest of data should be saved properly.')
-            print('Linear distance between source and destination not calculated.')
-            print(str(error))
-            log.write(asctime() + ': Cannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name +
-                      ' to a valid polyline, but rest of data should be saved properly.\n'
-                      + 'Linear distance between source and destination not calculated.\n' + str(error) +
-                      '------------------------------------------------------------------------------------------'
-                      + '\n')
+            log.error('Cannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name + ' to a '
+                      'valid polyline, but rest of data should be saved properly. Linear distance between source and '
+                      'destination not calculated.', source=loc_one_name, destination=loc_two_name, stage='vectorize',
+                      error=error)
             distance = 'NA'
     except Exception as error:
-        print('\nCannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name +
-              ' to a valid polyline.')
-        print('Linear distance between source and destination not calculated.')
-        print(str(error))
-        log.write(asctime() + ': Cannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name +
-                  ' to a valid polyline, but rest of data should be saved properly.\n'
-                  + 'Linear distance between source and destination not calculated.\n' + str(error) +
-                  '------------------------------------------------------------------------------------------'
-                  + '\n')
+        log.error('Cannot convert cost path raster between ' + loc_one_name + ' and ' + loc_two_name + ' to a valid '
+                  'polyline. Linear distance between source and destination not calculated.', source=loc_one_name,
+                  destination=loc_two_name, stage='vectorize', error=error)
         distance = 0
 
     try:
-        arcpy.AddField_management(costpath, 'Source', 'TEXT')
-        arcpy.AddField_management(costpath, 'Destination', 'TEXT')
-        arcpy.AddField_management(costpath, 'Linear_Distance', 'FLOAT')
-        arcpy.CalculateField_management(costpath, 'Source', "'" + name_1 + "'")
-        arcpy.CalculateField_management(costpath, 'Destination', "'" + name_2 + "'")
-        arcpy.CalculateField_management(costpath, 'Linear_Distance', distance)
-        arcpy.MakeTableView_management(costpath, 'table')
-        with arcpy.da.SearchCursor('table', ['SOURCE', 'DESTINATION', 'PATHCOST',
-                                             'LINEAR_DISTANCE', 'Rowid']) as table_cursor:
-            for entry in table_cursor:
-                if entry[4] != 0:
-                    in_cursor = arcpy.da.InsertCursor(table, fields)
-                    in_cursor.insertRow((str(entry[0]), str(entry[1]), entry[2], entry[3]))
-                    del in_cursor
+        # Names and distance are only added to the cost path raster itself when it is saved as a .csv table below
+        if int_data is True:
+            arcpy.AddField_management(costpath, 'Source', 'TEXT')
+            arcpy.AddField_management(costpath, 'Destination', 'TEXT')
+            arcpy.AddField_management(costpath, 'Linear_Distance', 'FLOAT')
+            arcpy.CalculateField_management(costpath, 'Source', "'" + name_1 + "'")
+            arcpy.CalculateField_management(costpath, 'Destination', "'" + name_2 + "'")
+            arcpy.CalculateField_management(costpath, 'Linear_Distance', distance)
+        with timer.stage('table_write', source=file_name_1, destination=file_name_2):
+            arcpy.MakeTableView_management(costpath, 'table')
+            with arcpy.da.SearchCursor('table', ['PATHCOST', 'Rowid']) as table_cursor:
+                for entry in table_cursor:
+                    if entry[1] != 0:
+                        row = (str(name_1), str(name_2), entry[0], distance)
+                        if key is not None:
+                            add_result(key, row)
+                            journal.record(key, row)
+                        else:
+                            result_buffer.add(*row)
 
         if int_data is True:
             try:
-                arcpy.CopyRows_management(costpath, directory + r'\tables\tb_' + file_name_1 + '_' + file_name_2
-                                          + '.csv')
+                with timer.stage('intermediate_save', source=file_name_1, destination=file_name_2):
+                    arcpy.CopyRows_management(costpath, directory + r'\tables\tb_' + file_name_1 + '_' + file_name_2
+                                              + '.csv')
             except Exception as error:
-                print('\nFailed to save data for cost path between ' + loc_one_name + ' and ' + loc_two_name
-                      + ' in .csv table. See error message for more details.')
-                print('Linear distance between source and destination not calculated.')
-                print(str(error))
-                log.write(asctime() + ': Failed to save data for cost path between ' + loc_one_name + ' and '
-                          + loc_two_name + ' in .csv table. See error message for more details.\n' + str(error) +
-                          '------------------------------------------------------------------------------------------'
-                          + '\n')
+                log.error('Failed to save data for cost path between ' + loc_one_name + ' and ' + loc_two_name
+                          + ' in .csv table. See error message for more details.', source=loc_one_name,
+                          destination=loc_two_name, stage='intermediate_save', error=error)
 
             try:
-                costpath.save(directory + r'\costpath\cp_' + file_name_1 + '_' + file_name_2)
+                with timer.stage('intermediate_save', source=file_name_1, destination=file_name_2):
+                    costpath.save(directory + r'\costpath\cp_' + file_name_1 + '_' + file_name_2)
             except Exception as error:
-                str_error = str(error)
-                if str_error.startswith('ERROR 010240'):
-                    print('\nCould not save cost path raster cp_' + file_name_1 + '_'
-                          + file_name_2 + ', but rest of data should be saved properly.')
-                    print('Combination of file names for fc one and fc two likely exceeds 13 characters. '
-                          'See help file for more information.')
-                    log.write(asctime() + ': Could not save cost path raster cp_' + file_name_1 + '_'
-                              + file_name_2 + ', but rest of data should be saved properly.\n'
-                              + 'Combination of file names for fc one and fc two likely exceed 13 characters. '
-                                'See help file for more information.\n' + str(error) + '\n'
-                              + '----------------------------------------------------'
-                                '--------------------------------------'
-                              + '\n')
+                if lcp_log.error_code(error) == '010240':
+                    log.warning('Could not save cost path raster cp_' + file_name_1 + '_' + file_name_2 + ', but rest '
+                                'of data should be saved properly. Combination of file names for fc one and fc two '
+                                'likely exceeds 13 characters. See help file for more information.',
+                                source=loc_one_name, destination=loc_two_name, stage='intermediate_save', error=error)
                 else:
-                    print('\nCould not save cost path raster cp_' + file_name_1 + '_' + file_name_2 +
-                          ', but rest of data should be saved properly. See error message for more details')
-                    print(str(error))
-                    log.write(asctime() + ': Could not save cost path raster cp_' + file_name_1 + '_' + file_name_2 +
-                              ', but rest of data should be saved properly. See error message for more details.\n' +
-                              '-------------------------------------------------------'
-                              '-----------------------------------'
-                              + '\n')
+                    log.error('Could not save cost path raster cp_' + file_name_1 + '_' + file_name_2 + ', but rest of '
+                              'data should be saved properly. See error message for more details.',
+                              source=loc_one_name, destination=loc_two_name, stage='intermediate_save', error=error)
     except arcpy.ExecuteError:
-        error = arcpy.GetMessages(2)
-        print('\nFailed to properly save data for least cost path between ' + loc_one_name + ' and ' + loc_two_name +
-              ' in master table. Script will continue with next iteration.')
-        print(str(error))
-        log.write(asctime() + ': Failed to properly save data for least cost path between ' + loc_one_name + ' and '
-                  + loc_two_name + ' in master table. Script continued with next iteration.'
-                  + '.\n' + str(error) +
-                  '------------------------------------------------------------------------------------------' + '\n')
+        log.error('Failed to properly save data for least cost path between ' + loc_one_name + ' and ' + loc_two_name
+                  + ' in master table. Script will continue with next iteration.', source=loc_one_name,
+                  destination=loc_two_name, stage='table_write', error=arcpy.GetMessages(2))
     except Exception as error:
-        print('\nFailed to properly save data for least cost path between ' + loc_one_name + ' and ' + loc_two_name +
-              ' in master table. Script will continue with next iteration.')
-        print(str(error))
-        log.write(asctime() + ': Failed to properly save data for least cost path between ' + loc_one_name + ' and '
-                  + loc_two_name + ' in master table. Script continued with next iteration.'
-                  + '.\n' + str(error) +
-                  '------------------------------------------------------------------------------------------' + '\n')
+        log.error('Failed to properly save data for least cost path between ' + loc_one_name + ' and ' + loc_two_name
+                  + ' in master table. Script will continue with next iteration.', source=loc_one_name,
+                  destination=loc_two_name, stage='table_write', error=error)
 
     # except RuntimeError as error:
     #     str_error = str(error)
@@ -245,7 +528,7 @@ fc_two = r'C:\PATH_TO_FILE\My_Feature_Class'
 # Path to digital elevation model.  Size of the DEM raster is primary determinant for how long it takes to calculate
 # each pathdistance and backlink raster. Reducing resolution of DEM, or decreasing size of area covered, will
 # decrease runtime. It is especially helpful to clip DEM to only a slightly larger than covers all the locations in
-#  fc_one and fc_two.
+#  fc_one and fc_two, which the script can do itself (see clip_buffer below).
 digital_elevation_model = r'C:\PATH_TO_FILE\My_DEM'
 
 # fc_one and fc_two need to have a field with short names for the locations, with a max of four characters. This is due
@@ -282,182 +565,519 @@ int_data = False
 # function). Any table relating a cost value to a slope value is acceptable.
 cost_table = r'C:\PATH_TO_FILE\Cost_Table.txt'
 
-# Converts cost_table into vertical factor
-vertical_factor = VfTable(cost_table)
-
-# Sets workspace to working_directory variable inputted above
-arcpy.env.workspace = working_directory
-
-# Sets folder names for output folders
-subdir = working_directory + '\\' + output_folder
-subdir_fc1 = working_directory + '\\' + output_folder + '\\fc_one_output'
-subdir_fc2 = working_directory + '\\' + output_folder + '\\fc_two_output'
-folder1, folder2, folder3, folder4, folder5, folder6 = output_folder, 'pathdis', 'backlink', 'polylines', \
-                                                       'costpath', 'tables'
-# Creates output folders
-if fc_one == fc_two or round_trip is False:
-    if not arcpy.Exists(folder1):
-        print('Creating ' + folder1 + ' and subdirectories in ' + working_directory)
-        arcpy.CreateFolder_management(working_directory, folder1)
-        arcpy.CreateFolder_management(subdir, folder2)
-        arcpy.CreateFolder_management(subdir, folder3)
-        arcpy.CreateFolder_management(subdir, folder4)
-        if int_data is True:
-            arcpy.CreateFolder_management(subdir, folder5)
-            arcpy.CreateFolder_management(subdir, folder6)
-    else:
-        if not arcpy.Exists(subdir + r'\pathdis'):
+# Name of a built in cost function to use instead of cost_table: 'tobler' (Tobler's hiking function, time in hours),
+# 'pandolf' (Pandolf's equation with the Santee downhill correction, energy in kilocalories) or 'minetti' (Minetti's
+# gradient polynomial, energy in J per kg of body mass). The numpy backend calculates every move from the published
+# formula. The arcpy backend uses a slope/cost table sampled from it at every degree of slope, which is saved in the
+# output folder. Set to None to use cost_table.
+cost_function = None
+
+# Parameters of cost_function, such as {'load': 20.0, 'speed': 1.1} for 'pandolf'. See lcp_costs.py for the parameters
+# of each function and their default values.
+cost_function_parameters = {}
+
+# Format of the file the results of every pair are written to as the analysis runs: 'csv', 'parquet' or 'feather'. The
+# parquet and feather formats are faster and smaller for large analyses, but need the pyarrow package.
+results_format = 'csv'
+
+# If export_dbf = True, all results are also copied into maintable.dbf and master.xls once the analysis is finished.
+# Note that .xls files cannot hold more than 65,536 rows.
+export_dbf = True
+
+# Sets which engine calculates the pathdistance and backlink rasters. 'arcpy' uses PathDistance from Spatial Analyst.
+# 'numpy' uses lcp_engine.py (in the same folder as this script), which reads the DEM and cost_table directly and runs
+# the search in python, so the most time consuming step of the analysis does not need a Spatial Analyst license.
+backend = 'arcpy'
+
+# Number of worker processes the numpy backend uses to calculate least cost paths, one source location at a time per
+# process. Each worker writes its intermediate grids to its own folder inside OUTPUT\scratch. Results are added to the
+# master table in the same order as with a single process. Has no effect with the arcpy backend.
+workers = 1
+
+# If save_polylines = True, the numpy backend saves every least cost path as a polyline shapefile in the polylines
+# folder. The length of each path is measured directly from the cells it passes through either way, so the shapefiles
+# are only needed to view or further analyse the paths. The arcpy backend always saves polylines.
+save_polylines = False
+
+# If surface_distance = True, the numpy backend measures the length of each path over the surface of the DEM, including
+# the rise and fall of every step, rather than in plan view like the polylines.
+surface_distance = False
+
+# If stop_at_destinations = True, the numpy backend stops calculating the pathdistance raster for a source as soon as
+# the least cost to every destination is known, instead of covering the whole DEM. The saved pathdistance and backlink
+# rasters are then only filled in around the source. Has no effect with the arcpy backend.
+stop_at_destinations = False
+
+# Maximum accumulated cost searched from each source, in the units of the cost table. Cells that cost more than this to
+# reach are left as NoData, and destinations beyond it get no least cost path. Set to None to search the whole DEM.
+max_cost = None
+
+# If reverse_search = True, the numpy backend calculates paths from each location in fc_one to the locations in fc_two
+# by searching outward from the locations in fc_two over the DEM with every move reversed, whenever fc_two has fewer
+# locations than fc_one. With round_trip = True, both directions of travel are then calculated from searches that start
+# at the locations of the smaller feature class, instead of from every location in both. Pathdistance and backlink
+# rasters are not saved for reversed searches.
+reverse_search = False
+
+# If resume = True and an earlier run with the same fc_one, fc_two, DEM, and cost_table was interrupted, pairs it
+# already finished (listed in progress.jsonl in the output folder) are not calculated again, and their results are
+# copied into the new master table. A run with other allocation, corridor_percent, pairs_file, symmetric or previous_dem
+# settings starts over instead. Set to False to start the analysis over from the beginning.
+resume = True
+
+# Folder where the numpy backend keeps the pathdistance and backlink grids of every source location between runs. When
+# the DEM, cost_table, and location are unchanged, the grids are read back from this folder instead of being calculated
+# again, so that adding destinations to a finished study only requires tracing the new paths. Set to None to turn the
+# cache off. Grids from runs with stop_at_destinations = True are not cached. The cost of every move over the DEM, which
+# only depends on the DEM and cost_table, is kept in this folder too, and reused by later runs with the same DEM and
+# cost_table. With clip_buffer set, the DEM the cache sees is the clipped one, which changes whenever a location is
+# added or moved outside the area of the earlier run, and so does every search over it, as paths cannot leave the
+# clipped area; such a run starts the cache afresh. Leave clip_buffer set to None for studies whose locations change
+# between runs that share the cache.
+grid_cache_folder = None
+
+# Maximum size of grid_cache_folder in gigabytes. Once it is exceeded, the grids that have gone unused the longest are
+# deleted. Set to None for no limit.
+grid_cache_limit_gb = 50
+
+# If symmetric = True and fc_one and fc_two are the same feature class, the numpy backend calculates the least cost path
+# between each pair of locations only once, and uses it for both directions of travel. Paths from a location to itself
+# are skipped, and no pathdistance or backlink raster is saved for the last location. Only use this with a cost_table
+# that gives the same cost going uphill and downhill at the same slope; with any other table it is ignored.
+symmetric = False
+
+# If clip_buffer is set to a distance in the map units of the DEM, the DEM is clipped to the smallest rectangle holding
+# every location in fc_one and fc_two, enlarged by clip_buffer on every side, before the analysis starts. The clipped
+# DEM is saved as dem_clip.tif in the output folder and used in place of digital_elevation_model. Least cost paths
+# cannot leave the clipped area, so the buffer needs to be wide enough for any detour a path might take around steep
+# ground. Set to None to use the whole DEM.
+clip_buffer = None
+
+# If compress_grids = True, the pathdistance and backlink grids the numpy backend keeps in OUTPUT\scratch and in
+# grid_cache_folder are compressed. They take up less disk space, but are slower to save and read back.
+compress_grids = False
+
+# Most memory in gigabytes the numpy backend may use for the searches its worker processes run at the same time. If
+# workers searches over the whole DEM would need more than this, fewer workers are started. Set to None for no limit.
+memory_limit_gb = None
+
+# Path to a .csv file listing the pairs of locations to calculate, one pair per row: the short name (see
+# fc_one_loc_filename) of a location in fc_one, then the short name of a location in fc_two. Only the listed pairs are
+# calculated, in both directions if round_trip = True. The numpy backend answers each pair with its own goal directed
+# search, which only covers the area between the two locations, instead of a search over the whole DEM for every
+# source. Set to None to calculate every pair of locations in fc_one and fc_two.
+pairs_file = None
+
+# Number of landmark locations the numpy backend picks for goal directed searches in pairs_file runs. Each landmark
+# takes two searches over the whole DEM before the first pair, and makes every pair after that faster. For only a few
+# pairs, set it to 0 to skip the landmarks. With grid_cache_folder set, the landmarks are built once for each DEM and
+# cost model and kept in the cache, so later pairs_file runs start answering pairs straight away, whatever their
+# locations. Pairs from sources whose grids are in the cache from an earlier run are traced from those grids.
+landmarks = 8
+
+# If allocation = True, the numpy backend only finds the location in fc_one with the least cost path to each location
+# in fc_two, using a single search started from every location in fc_one at once instead of a search from each of
+# them. The master table then holds one row per location in fc_two, with its nearest location in fc_one. The
+# allocation raster in the output folder gives the number of the nearest location in fc_one to every cell of the DEM
+# (allocation_values.csv lists the locations by number), and pathdis\pd_alloc the cost from it. With round_trip = True,
+# the nearest location in fc_two to each location in fc_one is found too. Has no effect with the arcpy backend.
+allocation = False
+
+# If corridor_percent is set, the numpy backend calculates the least cost corridor between every pair of locations (or
+# every pair in pairs_file) instead of just the least cost path: every cell through which the pair can be joined at no
+# more than corridor_percent percent above the least cost. Each corridor is saved in the corridor folder as co_ followed
+# by the two short names, holding the cost of the best path through each of its cells. The corridor is the sum of the
+# pathdistance rasters from both locations, which are kept in grid_cache_folder if it is set and reused by later runs.
+# Set to None to calculate least cost paths only.
+corridor_percent = None
+
+# Number of diverse paths within each corridor listed in alternatives.csv in the output folder, including the least
+# cost path itself, and saved as polylines if save_polylines is True.
+alternative_paths = 3
+
+# Largest fraction of its cells a path in alternatives.csv may share with the paths listed before it.
+alternative_overlap = 0.5
+
+# Path to the DEM that an earlier run with the same grid_cache_folder, cost_table and max_cost was made with, when
+# digital_elevation_model is an edited copy of it, such as one with a new road or reservoir burnt in. The numpy backend
+# then repairs the cached grids of every location around the edited cells only, instead of searching the whole DEM
+# again, which makes trying out such scenarios much faster. Both DEMs need the same extent and cell size. Set to None
+# when the DEM has not been edited.
+previous_dem = None
+
+# If trace = True, the time taken by each stage of the analysis (pathdistance, cost path, polyline conversion, length
+# measurement, writing results, saving intermediate files) is written to trace.jsonl in the output folder, one line of
+# JSON per stage, with the number of cells it expanded and bytes it wrote where those are known. The lines are written
+# in batches, and the last of them when the run ends.
+# A summary of the time spent in each stage is printed and added to the log at the end of the run either way.
+trace = True
+
+# Lowest level of event written to the log file in the output folder: 'debug' (every event, including a line for each
+# finished pair), 'info', 'warning' (pairs without a least cost path, and conversions that could only be partly
+# saved) or 'error'. Errors and warnings are always printed as well.
+log_level = 'info'
+
+# If log_json = True, each event is written to the log file as a line of JSON, with the pair of locations, stage,
+# ArcGIS error code and time taken as separate fields, instead of as a line of text.
+log_json = False
+
+# Shortest time in seconds between two progress messages printed for finished pairs. The other progress messages are
+# only counted, so that printing does not slow down analyses with many pairs. Set to 0 to print every one of them.
+progress_interval = 1.0
+
+# If save_matrix = True, the cost and distance of every pair are also saved as a dense matrix with a row for every
+# location in fc_one and a column for every location in fc_two (matrix_cost.npy and matrix_distance.npy in the output
+# folder, with the short and long names of the locations in matrix_labels.json), which is filled in as each source
+# location is finished. The matrices are float32 numpy arrays that other programs can open as memory maps, without
+# reading them into memory, and have no limit on their size. Pairs not calculated are NaN, and pairs with no least cost
+# path have an infinite cost. With round_trip = True, the matrix for the paths from fc_two to fc_one is saved in the
+# fc_two_output folder.
+save_matrix = True
+
+# Everything below runs only when the script itself is run, and not when the worker processes started by the numpy
+# backend import it.
+if __name__ == '__main__':
+    # Sets workspace to working_directory variable inputted above
+    arcpy.env.workspace = working_directory
+
+    # Sets folder names for output folders
+    subdir = working_directory + '\\' + output_folder
+    subdir_fc1 = working_directory + '\\' + output_folder + '\\fc_one_output'
+    subdir_fc2 = working_directory + '\\' + output_folder + '\\fc_two_output'
+    folder1, folder2, folder3, folder4, folder5, folder6 = output_folder, 'pathdis', 'backlink', 'polylines', \
+                                                           'costpath', 'tables'
+    # Creates output folders
+    if fc_one == fc_two or round_trip is False:
+        if not arcpy.Exists(folder1):
+            print('Creating ' + folder1 + ' and subdirectories in ' + working_directory)
+            arcpy.CreateFolder_management(working_directory, folder1)
             arcpy.CreateFolder_management(subdir, folder2)
-        if not arcpy.Exists(subdir + r'\backlink'):
             arcpy.CreateFolder_management(subdir, folder3)
-        if not arcpy.Exists(subdir + r'\polylines'):
             arcpy.CreateFolder_management(subdir, folder4)
-        if int_data is True:
-            if not arcpy.Exists(subdir + r'\costpath'):
+            if int_data is True:
                 arcpy.CreateFolder_management(subdir, folder5)
-            if not arcpy.Exists(subdir + r'\tables'):
                 arcpy.CreateFolder_management(subdir, folder6)
+        else:
+            if not arcpy.Exists(subdir + r'\pathdis'):
+                arcpy.CreateFolder_management(subdir, folder2)
+            if not arcpy.Exists(subdir + r'\backlink'):
+                arcpy.CreateFolder_management(subdir, folder3)
+            if not arcpy.Exists(subdir + r'\polylines'):
+                arcpy.CreateFolder_management(subdir, folder4)
+            if int_data is True:
+                if not arcpy.Exists(subdir + r'\costpath'):
+                    arcpy.CreateFolder_management(subdir, folder5)
+                if not arcpy.Exists(subdir + r'\tables'):
+                    arcpy.CreateFolder_management(subdir, folder6)
 
-if fc_one != fc_two and round_trip is True:
-    if not arcpy.Exists(folder1):
-        print('Creating ' + folder1 + ' and subdirectories in ' + working_directory)
-        arcpy.CreateFolder_management(working_directory, folder1)
-        arcpy.CreateFolder_management(subdir, '\\fc_one_output')
-        arcpy.CreateFolder_management(subdir, '\\fc_two_output')
-        arcpy.CreateFolder_management(subdir_fc1, folder2)
-        arcpy.CreateFolder_management(subdir_fc2, folder2)
-        arcpy.CreateFolder_management(subdir_fc1, folder3)
-        arcpy.CreateFolder_management(subdir_fc2, folder3)
-        arcpy.CreateFolder_management(subdir_fc1, folder4)
-        arcpy.CreateFolder_management(subdir_fc2, folder4)
-        arcpy.CreateFolder_management(subdir_fc1, folder5)
-        arcpy.CreateFolder_management(subdir_fc2, folder5)
-        arcpy.CreateFolder_management(subdir_fc1, folder6)
-        arcpy.CreateFolder_management(subdir_fc2, folder6)
-
-    else:
-        if not arcpy.Exists(subdir_fc1):
+    if fc_one != fc_two and round_trip is True:
+        if not arcpy.Exists(folder1):
+            print('Creating ' + folder1 + ' and subdirectories in ' + working_directory)
+            arcpy.CreateFolder_management(working_directory, folder1)
             arcpy.CreateFolder_management(subdir, '\\fc_one_output')
+            arcpy.CreateFolder_management(subdir, '\\fc_two_output')
             arcpy.CreateFolder_management(subdir_fc1, folder2)
+            arcpy.CreateFolder_management(subdir_fc2, folder2)
             arcpy.CreateFolder_management(subdir_fc1, folder3)
+            arcpy.CreateFolder_management(subdir_fc2, folder3)
             arcpy.CreateFolder_management(subdir_fc1, folder4)
+            arcpy.CreateFolder_management(subdir_fc2, folder4)
             arcpy.CreateFolder_management(subdir_fc1, folder5)
+            arcpy.CreateFolder_management(subdir_fc2, folder5)
             arcpy.CreateFolder_management(subdir_fc1, folder6)
+            arcpy.CreateFolder_management(subdir_fc2, folder6)
+
         else:
-            if not arcpy.Exists(subdir_fc1 + '\\' + folder2):
+            if not arcpy.Exists(subdir_fc1):
+                arcpy.CreateFolder_management(subdir, '\\fc_one_output')
                 arcpy.CreateFolder_management(subdir_fc1, folder2)
-            if not arcpy.Exists(subdir_fc1 + '\\' + folder3):
                 arcpy.CreateFolder_management(subdir_fc1, folder3)
-            if not arcpy.Exists(subdir_fc1 + '\\' + folder4):
                 arcpy.CreateFolder_management(subdir_fc1, folder4)
-            if not arcpy.Exists(subdir_fc1 + '\\' + folder5):
                 arcpy.CreateFolder_management(subdir_fc1, folder5)
-            if not arcpy.Exists(subdir_fc1 + '\\' + folder6):
                 arcpy.CreateFolder_management(subdir_fc1, folder6)
+            else:
+                if not arcpy.Exists(subdir_fc1 + '\\' + folder2):
+                    arcpy.CreateFolder_management(subdir_fc1, folder2)
+                if not arcpy.Exists(subdir_fc1 + '\\' + folder3):
+                    arcpy.CreateFolder_management(subdir_fc1, folder3)
+                if not arcpy.Exists(subdir_fc1 + '\\' + folder4):
+                    arcpy.CreateFolder_management(subdir_fc1, folder4)
+                if not arcpy.Exists(subdir_fc1 + '\\' + folder5):
+                    arcpy.CreateFolder_management(subdir_fc1, folder5)
+                if not arcpy.Exists(subdir_fc1 + '\\' + folder6):
+                    arcpy.CreateFolder_management(subdir_fc1, folder6)
 
-        if not arcpy.Exists(subdir_fc2):
-            arcpy.CreateFolder_management(subdir, '\\fc_two_output')
-            arcpy.CreateFolder_management(subdir_fc2, folder2)
-            arcpy.CreateFolder_management(subdir_fc2, folder3)
-            arcpy.CreateFolder_management(subdir_fc2, folder4)
-            arcpy.CreateFolder_management(subdir_fc2, folder5)
-            arcpy.CreateFolder_management(subdir_fc2, folder6)
-        else:
-            if not arcpy.Exists(subdir_fc2 + '\\' + folder2):
+            if not arcpy.Exists(subdir_fc2):
+                arcpy.CreateFolder_management(subdir, '\\fc_two_output')
                 arcpy.CreateFolder_management(subdir_fc2, folder2)
-            if not arcpy.Exists(subdir_fc2 + '\\' + folder3):
                 arcpy.CreateFolder_management(subdir_fc2, folder3)
-            if not arcpy.Exists(subdir_fc2 + '\\' + folder4):
                 arcpy.CreateFolder_management(subdir_fc2, folder4)
-            if not arcpy.Exists(subdir_fc2 + '\\' + folder5):
                 arcpy.CreateFolder_management(subdir_fc2, folder5)
-            if not arcpy.Exists(subdir_fc2 + '\\' + folder6):
                 arcpy.CreateFolder_management(subdir_fc2, folder6)
+            else:
+                if not arcpy.Exists(subdir_fc2 + '\\' + folder2):
+                    arcpy.CreateFolder_management(subdir_fc2, folder2)
+                if not arcpy.Exists(subdir_fc2 + '\\' + folder3):
+                    arcpy.CreateFolder_management(subdir_fc2, folder3)
+                if not arcpy.Exists(subdir_fc2 + '\\' + folder4):
+                    arcpy.CreateFolder_management(subdir_fc2, folder4)
+                if not arcpy.Exists(subdir_fc2 + '\\' + folder5):
+                    arcpy.CreateFolder_management(subdir_fc2, folder5)
+                if not arcpy.Exists(subdir_fc2 + '\\' + folder6):
+                    arcpy.CreateFolder_management(subdir_fc2, folder6)
+
+    if fc_one == fc_two or round_trip is False:
+        directory = subdir
+    else:
+        directory = subdir_fc1
+
+    # Converts cost_table into vertical factor. A built in cost function is first written out as a slope/cost table.
+    cost_model = None
+    vf_table_file = cost_table
+    if cost_function is not None:
+        cost_model = lcp_costs.cost_function(cost_function, **cost_function_parameters)
+        vf_table_file = lcp_costs.write_vf_table(cost_model, subdir + r'\cost_table_' + cost_function + '.txt')
+    vertical_factor = VfTable(vf_table_file)
+
+    # Clips the DEM to the area around the locations if clip_buffer is set. The cells of the clipped DEM line up with
+    # the cells of the original. The grid cache is keyed on the clipped DEM, whose searches differ from those over any
+    # other window of the original, so grids are only reused by runs over the same window.
+    input_dem = digital_elevation_model
+    if clip_buffer is not None:
+        dem_clip = subdir + r'\dem_clip.tif'
+        arcpy.env.snapRaster = input_dem
+        arcpy.Clip_management(input_dem, clip_rectangle(arcpy.Raster(input_dem).extent, clip_buffer), dem_clip, '',
+                              '', 'NONE', 'NO_MAINTAIN_EXTENT')
+        digital_elevation_model = dem_clip
+
+    # Reads the extent and cell size of the DEM, used to find the cell of each location.
+    dem_raster = arcpy.Raster(digital_elevation_model)
+    dem_cellsize = dem_raster.meanCellWidth
+    dem_xmin, dem_ymax = dem_raster.extent.XMin, dem_raster.extent.YMax
+    dem_shape = (dem_raster.height, dem_raster.width)
+
+    # Reads DEM and cost_table once for the numpy backend, and precalculates the cost of every move on the DEM, which is
+    # the same for every source location. Both are kept in memory mapped files, which worker processes share, and only
+    # the parts of them a search reaches are read from disk. With grid_cache_folder set, the costs are kept there and
+    # only calculated the first time the DEM is used with cost_table; otherwise they go in the numpy_dem folder.
+    if backend == 'numpy':
+        numpy_dem_folder = subdir + r'\numpy_dem'
+        os.makedirs(numpy_dem_folder, exist_ok=True)
+        dem_array = numpy_dem(dem_raster, numpy_dem_folder + r'\dem.npy')
+        vf_array = cost_model if cost_model is not None else lcp_engine.read_vf_table(cost_table)
+        grid_cache = dem_fingerprint = None
+        if grid_cache_folder is not None:
+            grid_cache = lcp_cache.GridCache(grid_cache_folder, None if grid_cache_limit_gb is None
+                                             else int(grid_cache_limit_gb * 1024 ** 3), compress_grids)
+            dem_fingerprint = grid_cache.edge_cost_key(dem_array, dem_cellsize, vf_array)
+            dem_weights = grid_cache.edge_costs(dem_array, dem_cellsize, vf_array, dem_fingerprint)
+        else:
+            dem_weights = lcp_engine.edge_costs(dem_array, dem_cellsize, vf_array, out=numpy.lib.format.open_memmap(
+                numpy_dem_folder + r'\weights.npy', mode='w+', dtype=lcp_engine.WEIGHTS_DTYPE,
+                shape=(8, dem_array.size)))
+            dem_weights.flush()
+
+    # Creates buffer that collects the results of each pairwise iteration of the analysis, and writes them to the
+    # results file in batches.
+    result_buffer = lcp_results.ResultBuffer(directory + r'\results.' + results_format)
+
+    # Creates timer that records the time taken by each stage of the analysis
+    timer = lcp_timing.StageTimer(directory + r'\trace.jsonl' if trace is True else None)
+
+    # Creates log file, which is written by a background thread
+    log = lcp_log.EventLog(directory + '\log' + str(int(time()))[-8:] + ('.jsonl' if log_json is True else '.txt'),
+                           log_level, log_json, progress_interval)
+    log.header(lcp_log.SEPARATOR, 'Event log for least cost path analysis between locations in: ', fc_one, fc_two,
+               'Event log created: ' + asctime(), lcp_log.SEPARATOR)
+
+    # Opens the progress journal, which records every finished pair as soon as it is done. The results of pairs
+    # finished by an earlier, interrupted run with the same inputs are copied into the results once the locations are
+    # read below. The settings that choose what kind of analysis is run are part of the inputs, so that the results of
+    # an earlier run of another kind, such as an allocation after a run over every pair, are never copied in.
+    journal_file = directory + r'\progress.jsonl'
+    if resume is False and os.path.exists(journal_file):
+        os.remove(journal_file)
+    journal = lcp_journal.Journal(journal_file, {'fc_one': fc_one, 'fc_two': fc_two, 'dem': input_dem,
+                                                 'cost_table': cost_table, 'backend': backend, 'max_cost': max_cost,
+                                                 'clip_buffer': clip_buffer,
+                                                 'cost_function': None if cost_model is None
+                                                 else lcp_costs.describe(cost_model),
+                                                 'allocation': allocation, 'corridor_percent': corridor_percent,
+                                                 'pairs_file': pairs_file, 'symmetric': symmetric,
+                                                 'previous_dem': previous_dem})
 
-if fc_one == fc_two or round_trip is False:
-    directory = subdir
-else:
-    directory = subdir_fc1
-
-# Creates dummy table to store results of each pairwise iteration of the analysis.
-table = arcpy.CreateTable_management(directory, 'maintable.dbf')
-arcpy.AddField_management(table, 'Source', 'TEXT')
-arcpy.AddField_management(table, 'Dest', 'TEXT')
-arcpy.AddField_management(table, 'PathCost', 'FLOAT')
-arcpy.AddField_management(table, 'Distance', 'FLOAT')
-
-fields = ['Source', 'Dest', 'PathCost', 'Distance']
-
-# Creates log file
-log = open(directory + '\log' + str(int(time()))[-8:] + '.txt', 'a+')
-log.write('------------------------------------------------------------------------------------------' + '\n')
-log.write('Event log for least cost path analysis between locations in: ' + '\n')
-log.write(fc_one + '\n')
-log.write(fc_two + '\n')
-log.write('Event log created: ' + asctime() + '\n')
-log.write('------------------------------------------------------------------------------------------' + '\n')
-
-# Starts analysis, computing pathdistance and backlink rasters for each location in fc_one, and then the cost_path from
-# each locaiton in fc_two back to each location in fc_one.
-with arcpy.da.SearchCursor(fc_one, [fc_one_loc_name, fc_one_loc_filename]) as cursor:
-    for row in cursor:
-        loc_one_name = row[0]
-        loc_one_filename = row[1]
-        print('Calculating path distance and backlink raster for site: ' + loc_one_name)
-        arcpy.MakeFeatureLayer_management(fc_one, 'source',
-                                          '"{}" = \'{}\''.format(fc_one_loc_filename, loc_one_filename))
-        pd_raster = path_distance('source', digital_elevation_model, vertical_factor, loc_one_filename)
-        in_cost_backlink_raster = directory + r'\backlink\bl_' + loc_one_filename
-
-        with arcpy.da.SearchCursor(fc_two, [fc_two_loc_name, fc_two_loc_filename]) as cursor:
-            for row in cursor:
+    # Starts analysis, computing pathdistance and backlink rasters for each location in fc_one, and then the cost_path
+    # from each locaiton in fc_two back to each location in fc_one. The numpy backend traces all cost paths for a source
+    # at once. Both feature classes are read once, up front, and the geometry of each location is handed to the tools
+    # directly rather than selected into a feature layer for every pair.
+    fc_one_locations, fc_one_geometries = read_locations(fc_one, fc_one_loc_name, fc_one_loc_filename)
+    fc_two_locations, fc_two_geometries = read_locations(fc_two, fc_two_loc_name, fc_two_loc_filename)
+    pairs = None
+    pair_names = None
+    if pairs_file is not None:
+        pairs = lcp_stream.read_pairs(pairs_file, fc_one_locations, fc_two_locations)
+        pair_names = set((source[1], destination[1]) for source, destination in pairs)
+
+    # Creates the cost and distance matrices for each direction of travel, keeping those of an interrupted run that is
+    # resumed, and copies the results of pairs finished by that run into the results.
+    matrices = {}
+    if save_matrix is True:
+        matrices[fc_one] = lcp_matrix.CostMatrix(directory + r'\matrix', [location[1] for location in fc_one_locations],
+                                                 [location[1] for location in fc_two_locations],
+                                                 [location[0] for location in fc_one_locations],
+                                                 [location[0] for location in fc_two_locations],
+                                                 resume=bool(journal.completed))
+        if fc_one != fc_two and round_trip is True:
+            matrices[fc_two] = lcp_matrix.CostMatrix(subdir_fc2 + r'\matrix',
+                                                     [location[1] for location in fc_two_locations],
+                                                     [location[1] for location in fc_one_locations],
+                                                     [location[0] for location in fc_two_locations],
+                                                     [location[0] for location in fc_one_locations],
+                                                     resume=bool(journal.completed))
+    if journal.completed:
+        log.info('Resuming analysis. ' + str(len(journal.completed)) + ' pairs were finished by an earlier run.')
+        for record in journal.records:
+            add_result(record['key'], record['row'])
+
+    # Repairs the grids kept in grid_cache_folder for previous_dem, so that they hold the searches from each location
+    # over the edited DEM. Only the cells where the two DEMs differ, and the cells whose paths pass through them, are
+    # searched again.
+    if backend == 'numpy' and previous_dem is not None:
+        if grid_cache_folder is None:
+            log.warning('previous_dem is only used with grid_cache_folder set, and was ignored.')
+        else:
+            previous_input = previous_dem
+            if clip_buffer is not None:
+                previous_input = subdir + r'\previous_dem_clip.tif'
+                arcpy.Clip_management(previous_dem, clip_rectangle(arcpy.Raster(input_dem).extent, clip_buffer),
+                                      previous_input, '', '', 'NONE', 'NO_MAINTAIN_EXTENT')
+            previous_array = numpy_dem(arcpy.Raster(previous_input), numpy_dem_folder + r'\previous_dem.npy')
+            repair_cells = [location[2] for location in fc_one_locations]
+            if fc_one != fc_two and round_trip is True:
+                repair_cells += [location[2] for location in fc_two_locations]
+            try:
+                repaired = lcp_stream.repair_cached_grids(previous_array, dem_array, dem_cellsize, vf_array,
+                                                          repair_cells, grid_cache_folder, grid_cache_limit_gb,
+                                                          compress_grids, max_cost, timer=timer)
+                log.info('Repaired the cached grids of ' + str(repaired) + ' locations for the edited DEM.',
+                         stage='repair')
+            except ValueError as error:
+                log.error('Could not repair the cached grids for the edited DEM; searching again instead.',
+                          stage='repair', error=error)
+            del previous_array
+
+    if backend == 'numpy' and allocation is True:
+        numpy_allocation(fc_one_locations, fc_two_locations, fc_one)
+    elif backend == 'numpy' and corridor_percent is not None:
+        numpy_corridors(pairs if pairs is not None else [(source, destination) for source in fc_one_locations
+                                                         for destination in fc_two_locations], fc_one)
+    elif backend == 'numpy' and pairs is not None:
+        numpy_pair_analysis(pairs, fc_one)
+    elif backend == 'numpy':
+        use_symmetric = symmetric and fc_one == fc_two and lcp_engine.is_symmetric(vf_array)
+        if symmetric and not use_symmetric:
+            log.warning('symmetric = True ignored. It needs fc_one and fc_two to be identical and a cost_table with '
+                        'the same cost uphill and downhill.')
+        numpy_analysis(fc_one_locations, fc_two_locations, fc_one, use_symmetric)
+    else:
+        for loc_one_name, loc_one_filename, loc_one_cell in fc_one_locations:
+            if not any(pending_pair((fc_one, loc_one_filename, location[1])) for location in fc_two_locations):
+                print('No least cost paths left to calculate for site ' + loc_one_name)
+                continue
+            print('Calculating path distance and backlink raster for site: ' + loc_one_name)
+            pd_raster = path_distance(fc_one_geometries[loc_one_filename], digital_elevation_model, vertical_factor,
+                                      loc_one_filename)
+            in_cost_backlink_raster = directory + r'\backlink\bl_' + loc_one_filename
+
+            for loc_two_name, loc_two_filename, loc_two_cell in fc_two_locations:
                 start_subtime = time()
-                loc_two_name = row[0]
-                loc_two_filename = row[1]
-                arcpy.MakeFeatureLayer_management(fc_two, 'destination', '"{}" = \'{}\''.format(fc_two_loc_filename,
-                                                                                                loc_two_filename))
-                out_cost_path = cost_path('destination', pd_raster, in_cost_backlink_raster)
-                convert(out_cost_path, loc_one_filename, loc_two_filename, loc_one_name, loc_two_name)
+                if not pending_pair((fc_one, loc_one_filename, loc_two_filename)):
+                    continue
+                out_cost_path = cost_path(fc_two_geometries[loc_two_filename], pd_raster, in_cost_backlink_raster)
+                convert(out_cost_path, loc_one_filename, loc_two_filename, loc_one_name, loc_two_name,
+                        (fc_one, loc_one_filename, loc_two_filename))
                 end_subtime = time()
                 subtime = end_subtime - start_subtime
-                print('Finished generating least cost path between ' + loc_one_name + ' and ' + loc_two_name +
-                      ' in ' + str(subtime) + ' seconds.')
-
-# The following portion of script runs if feature class 1 and feature class 2 are different and round_trip is set to
-# True.  In that case, script repeats entire process from above, swapping feature class 1 and feature class 2, to
-# derive all outputs in the reverse direction of travel. If feature class 1 and 2 are identical, there is no reason
-# to run process again, as all pairwise combinations, in both directions, are derived from first run
-if fc_one != fc_two and round_trip is True:
-    directory = subdir_fc2
-    with arcpy.da.SearchCursor(fc_two, [fc_two_loc_name, fc_two_loc_filename]) as cursor:
-        for row in cursor:
-            loc_two_name = row[0]
-            loc_two_filename = row[1]
-            print('Calculating path distance and backlink raster for site: ' + loc_two_name)
-            arcpy.MakeFeatureLayer_management(fc_two, 'source',
-                                              '"{}" = \'{}\''.format(fc_two_loc_filename, loc_two_filename))
-            pd_raster = path_distance('source', digital_elevation_model, vertical_factor, loc_two_filename)
-            in_cost_backlink_raster = directory + r'\backlink\bl_' + loc_two_filename
-
-            with arcpy.da.SearchCursor(fc_one, [fc_one_loc_name, fc_one_loc_filename]) as cursor:
-                for row in cursor:
+                log.progress('Finished generating least cost path between ' + loc_one_name + ' and ' + loc_two_name +
+                             ' in ' + str(subtime) + ' seconds.', source=loc_one_name, destination=loc_two_name,
+                             seconds=subtime)
+            if save_matrix is True:
+                matrices[fc_one].flush()
+
+    # The following portion of script runs if feature class 1 and feature class 2 are different and round_trip is set to
+    # True.  In that case, script repeats entire process from above, swapping feature class 1 and feature class 2, to
+    # derive all outputs in the reverse direction of travel. If feature class 1 and 2 are identical, there is no reason
+    # to run process again, as all pairwise combinations, in both directions, are derived from first run
+    if fc_one != fc_two and round_trip is True:
+        directory = subdir_fc2
+        if backend == 'numpy' and allocation is True:
+            numpy_allocation(fc_two_locations, fc_one_locations, fc_two)
+        elif backend == 'numpy' and corridor_percent is not None:
+            numpy_corridors([(destination, source) for source, destination in pairs] if pairs is not None else
+                            [(source, destination) for source in fc_two_locations for destination in fc_one_locations],
+                            fc_two)
+        elif backend == 'numpy' and pairs is not None:
+            numpy_pair_analysis([(destination, source) for source, destination in pairs], fc_two)
+        elif backend == 'numpy':
+            numpy_analysis(fc_two_locations, fc_one_locations, fc_two)
+        else:
+            for loc_two_name, loc_two_filename, loc_two_cell in fc_two_locations:
+                if not any(pending_pair((fc_two, loc_two_filename, location[1])) for location in fc_one_locations):
+                    print('No least cost paths left to calculate for site ' + loc_two_name)
+                    continue
+                print('Calculating path distance and backlink raster for site: ' + loc_two_name)
+                pd_raster = path_distance(fc_two_geometries[loc_two_filename], digital_elevation_model,
+                                          vertical_factor, loc_two_filename)
+                in_cost_backlink_raster = directory + r'\backlink\bl_' + loc_two_filename
+
+                for loc_one_name, loc_one_filename, loc_one_cell in fc_one_locations:
                     start_subtime = time()
-                    loc_one_name = row[0]
-                    loc_one_filename = row[1]
-                    arcpy.MakeFeatureLayer_management(fc_one, 'destination', '"{}" = \'{}\''.format(fc_one_loc_filename,
-                                                                                                    loc_one_filename))
-                    out_cost_path = cost_path('destination', pd_raster, in_cost_backlink_raster)
-                    convert(out_cost_path, loc_two_filename, loc_one_filename, loc_two_name, loc_one_name)
+                    if not pending_pair((fc_two, loc_two_filename, loc_one_filename)):
+                        continue
+                    out_cost_path = cost_path(fc_one_geometries[loc_one_filename], pd_raster, in_cost_backlink_raster)
+                    convert(out_cost_path, loc_two_filename, loc_one_filename, loc_two_name, loc_one_name,
+                            (fc_two, loc_two_filename, loc_one_filename))
                     end_subtime = time()
                     subtime = end_subtime - start_subtime
-                    print('Finished generating least cost path between ' + loc_two_name + ' and ' + loc_one_name +
-                          ' in ' + str(subtime) + ' seconds.')
+                    log.progress('Finished generating least cost path between ' + loc_two_name + ' and '
+                                 + loc_one_name + ' in ' + str(subtime) + ' seconds.', source=loc_two_name,
+                                 destination=loc_one_name, seconds=subtime)
+                if save_matrix is True:
+                    matrices[fc_two].flush()
+
+    # Writes the remaining results to the results file, and copies all of them into maintable.dbf and master.xls if
+    # export_dbf is True.
+    with timer.stage('table_write') as record:
+        result_buffer.close()
+        record['bytes_written'] = os.path.getsize(result_buffer.path)
+        for matrix in matrices.values():
+            matrix.close()
+    if export_dbf is True:
+        with timer.stage('export'):
+            table = arcpy.CreateTable_management(os.path.dirname(result_buffer.path), 'maintable.dbf')
+            arcpy.AddField_management(table, 'Source', 'TEXT')
+            arcpy.AddField_management(table, 'Dest', 'TEXT')
+            arcpy.AddField_management(table, 'PathCost', 'FLOAT')
+            arcpy.AddField_management(table, 'Distance', 'FLOAT')
+            with arcpy.da.InsertCursor(table, lcp_results.FIELDS) as in_cursor:
+                for result in lcp_results.read_results(result_buffer.path):
+                    in_cursor.insertRow(result)
+            arcpy.MakeTableView_management(table, 'tableview')
+            arcpy.TableToExcel_conversion('tableview', directory + r'\master.xls')
+
+    # Removes the memory mapped DEM and edge costs of the numpy backend, which are many times larger than the DEM.
+    if backend == 'numpy':
+        del dem_array, dem_weights
+        shutil.rmtree(numpy_dem_folder, ignore_errors=True)
 
-arcpy.MakeTableView_management(table, 'tableview')
-arcpy.TableToExcel_conversion('tableview', directory + r'\master.xls')
+    # Prints and logs the time spent in each stage of the analysis
+    print('\n'.join(timer.summary()))
+    log.header('Time spent in each stage of the analysis:', *(timer.summary() + [lcp_log.SEPARATOR]))
+    timer.close()
 
-log.close()
-end_time = time()
-print(end_time)
-time_taken = end_time - start_time  # time_taken is in seconds
-print('Script took ' + str(time_taken) + ' seconds to complete.')
\ No newline at end of file
+    journal.close()
+    log.close()
+    end_time = time()
+    print(end_time)
+    time_taken = end_time - start_time  # time_taken is in seconds
+    print('Script took ' + str(time_taken) + ' seconds to complete.')
\ No newline at end of file
@@ -0,0 +1,392 @@
+"""python module that runs the numpy backend of the least cost path analysis for many source locations, one source per
+    task, either in the current process or sharded across a pool of worker processes. Each task calculates the
+    pathdistance and backlink grids for one source with lcp_engine and traces the least cost paths from every
+    destination back to it. Locations are (name, file name, (row, column)) tuples, as read from the feature classes by
+    the main script. Results are returned in the order of the sources, whatever the number of workers, so that tables
+    built from them are identical between serial and parallel runs. For lists of particular pairs of locations,
+    run_pairs answers each pair with its own goal directed search instead."""
+
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import lcp_engine
+import lcp_grids
+import lcp_timing
+
+# Settings shared by every task run in a process. Filled in by _init_worker, either in each worker process or, for
+# serial runs, in the calling process.
+_worker = {}
+
+
+# Function run in a worker process for each task. The first time the process sees settings_file, it is prepared by
+# calling init with the settings pickled in it; then func is run on task. This stands in for the initializer argument
+# of ProcessPoolExecutor, which needs python 3.7, so that the pool also runs on the python 3.6 of ArcGIS Pro 2.x.
+def _pool_task(init, settings_file, func, task):
+    if _worker.get('settings_file') != settings_file:
+        _worker.clear()
+        with open(settings_file, 'rb') as pickled:
+            init(*pickle.load(pickled))
+        _worker['settings_file'] = settings_file
+    return func(task)
+
+
+# Generator that runs func on every task in a pool of workers processes, each prepared by init with settings, and
+# yields the results in the order of tasks. The settings are pickled once to a file in scratch instead of being sent
+# with every task. Tasks not yet started when the generator is closed are cancelled.
+def _pool_map(workers, init, settings, func, tasks, scratch):
+    settings_file = os.path.join(scratch, 'settings_' + uuid.uuid4().hex + '.pkl')
+    with open(settings_file, 'wb') as pickled:
+        pickle.dump(settings, pickled, pickle.HIGHEST_PROTOCOL)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    futures = []
+    try:
+        futures = [executor.submit(_pool_task, init, settings_file, func, task) for task in tasks]
+        for future in futures:
+            yield future.result()
+    finally:
+        # shutdown(cancel_futures=True) needs python 3.9
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+        os.remove(settings_file)
+
+
+# Function that prepares a process to run tasks. dem_file and weights_file are .npy files written by run_sources, which
+# are memory mapped rather than copied so that all workers share a single copy of the DEM and edge costs. Each process
+# gets its own scratch workspace inside scratch for the grids it saves. cache is a lcp_cache.GridCache or None, and
+# fingerprint the key of the edge costs that grids are looked up under in it.
+def _init_worker(dem_file, weights_file, destinations, scratch, stop_at_destinations, max_cost, save_grids,
+                 compress_grids, cache, fingerprint):
+    workspace = os.path.join(scratch, 'worker_' + str(os.getpid()))
+    os.makedirs(workspace, exist_ok=True)
+    _worker.update(dem=np.load(dem_file, mmap_mode='r'), weights=np.load(weights_file, mmap_mode='r'),
+                   destinations=destinations,
+                   workspace=workspace, stop_at_destinations=stop_at_destinations, max_cost=max_cost,
+                   save_grids=save_grids, compress_grids=compress_grids, cache=cache, fingerprint=fingerprint)
+
+
+# Function run for each source location, with the indices of the destinations to trace paths from. Returns a tuple of
+# (source index, destination indices, traced paths, costs, grid file, error, stages), where grid file is the .npz file
+# holding the pathdistance and backlink grids, saved with lcp_grids in the worker's scratch workspace, or None if
+# save_grids is False or there was nothing to calculate, error is None unless the source failed, and stages is a list
+# of the lcp_timing records of the stages run for the source.
+def _solve_source(task):
+    source_index, source, destination_indices = task
+    destinations = [_worker['destinations'][j] for j in destination_indices]
+    if not destinations:
+        return source_index, destination_indices, [], np.empty(0), None, None, []
+    timer = lcp_timing.StageTimer(keep_records=True)
+    try:
+        accumulated, backlink = _source_grids(source[2], destinations, timer)
+        with timer.stage('trace_paths') as record:
+            paths, costs = lcp_engine.trace_paths(accumulated, backlink, [location[2] for location in destinations])
+            record['cells'] = sum(len(path) for path in paths if path is not None)
+        grid_file = None
+        if _worker['save_grids']:
+            with timer.stage('grid_save') as record:
+                grid_file = os.path.join(_worker['workspace'], 'grids_' + str(source[1]) + '.npz')
+                lcp_grids.save_grids(grid_file, accumulated, backlink, _worker['compress_grids'])
+                record['bytes_written'] = os.path.getsize(grid_file)
+        return source_index, destination_indices, paths, costs, grid_file, None, timer.records
+    except Exception as error:
+        return source_index, destination_indices, None, None, None, error, timer.records
+
+
+# Function that returns the pathdistance and backlink grids for a source cell, from the grid cache if they are in it.
+# Grids from searches that stopped at the destinations only cover part of the DEM, so they are never cached. The time
+# taken is recorded in timer, a lcp_timing.StageTimer, with the number of cells the search settled.
+def _source_grids(source_cell, destinations, timer):
+    cache = _worker['cache']
+    if _worker['stop_at_destinations']:
+        cache = None
+        targets = [location[2] for location in destinations]
+    else:
+        targets = None
+    if cache is not None:
+        key = cache.key(_worker['fingerprint'], source_cell, _worker['max_cost'])
+        with timer.stage('grid_cache_load'):
+            grids = cache.load(key)
+        if grids is not None:
+            return grids
+    with timer.stage('path_distance') as record:
+        accumulated, backlink = lcp_engine.path_distance(_worker['dem'], None, None, [source_cell],
+                                                         weights=_worker['weights'], targets=targets,
+                                                         max_cost=_worker['max_cost'], scratch=_worker['workspace'])
+        record['cells'] = int(np.count_nonzero(backlink != lcp_engine.BACKLINK_NODATA))
+    if cache is not None:
+        with timer.stage('grid_cache_save'):
+            cache.save(key, accumulated, backlink)
+    return accumulated, backlink
+
+
+# Function that completes the results of a symmetric run. Paths calculated from source i to every later location j are
+# held back, reversed, until the result for source j comes up, and are then merged into it in destination order.
+def _mirror_results(results):
+    mirrored = {}
+    for source_index, destination_indices, paths, costs, grid_file, error, stages in results:
+        if error is None:
+            for j, path, cost in zip(destination_indices, paths, costs):
+                mirrored.setdefault(j, []).append((source_index, None if path is None else path[::-1], cost))
+            earlier = mirrored.pop(source_index, [])
+            destination_indices = [entry[0] for entry in earlier] + list(destination_indices)
+            paths = [entry[1] for entry in earlier] + list(paths)
+            costs = np.concatenate(([entry[2] for entry in earlier], costs))
+        yield source_index, destination_indices, paths, costs, grid_file, error, stages
+
+
+# Function that regroups the results of a reversed run, where each task searched from one destination over reversed
+# edge costs and traced a path from every source, into one result per source in the usual form. Paths are turned
+# around so that they run from the destination back to the source, as with a forward search. All destinations have
+# to be finished before the first source can be handed back. A destination whose search failed is left out of every
+# source, and its error is attached to each source result. The stages of every search are handed back with the first
+# source.
+def _regroup_reversed(results, source_count):
+    paths = [[] for _ in range(source_count)]
+    costs = [[] for _ in range(source_count)]
+    destination_indices = [[] for _ in range(source_count)]
+    errors = []
+    all_stages = []
+    for destination_index, source_indices, root_paths, root_costs, grid_file, error, stages in results:
+        all_stages.extend(stages)
+        if error is not None:
+            errors.append('destination ' + str(destination_index) + ': ' + str(error))
+            continue
+        for i, path, cost in zip(source_indices, root_paths, root_costs):
+            destination_indices[i].append(destination_index)
+            paths[i].append(None if path is None else path[::-1])
+            costs[i].append(cost)
+    error = '; '.join(errors) if errors else None
+    for i in range(source_count):
+        yield i, destination_indices[i], paths[i], np.asarray(costs[i], dtype='float64'), None, error, all_stages
+        all_stages = []
+
+
+# Function that returns a .npy file workers can memory map to read array. An array that is already memory mapped from
+# a whole .npy file, such as a DEM read in windows by the main script, is shared as it is. Anything else is saved to
+# path first. Returns the file and whether it was written here.
+def _shared_file(array, path):
+    file_name = getattr(array, 'filename', None)
+    if file_name is not None and file_name.endswith('.npy') and os.path.exists(file_name):
+        array.flush()
+        on_disk = np.load(file_name, mmap_mode='r')
+        if on_disk.shape == np.shape(array) and on_disk.dtype == array.dtype:
+            return file_name, False
+    np.save(path, array)
+    return path, True
+
+
+# Function that checks that a grid cache comes with the key of the edge costs its grids are stored under.
+def _check_fingerprint(cache, fingerprint):
+    if cache is not None and fingerprint is None:
+        raise ValueError('A grid cache needs the fingerprint of the edge costs, from GridCache.edge_cost_key.')
+
+
+# Function that removes pairs listed in completed, a set of (source index, destination index) tuples, from results.
+def _drop_completed(results, completed):
+    for source_index, destination_indices, paths, costs, grid_file, error, stages in results:
+        if paths is not None:
+            keep = [n for n, j in enumerate(destination_indices) if (source_index, j) not in completed]
+            destination_indices = [destination_indices[n] for n in keep]
+            paths = [paths[n] for n in keep]
+            costs = np.asarray(costs)[keep]
+        yield source_index, destination_indices, paths, costs, grid_file, error, stages
+
+
+# Function that calculates least cost paths from every source to every destination. Yields one tuple per source, in
+# the order of sources, as described for _solve_source. weights are the edge costs from lcp_engine.edge_costs for
+# dem. workers sets the number of processes; with workers = 1 everything runs in the calling process. scratch is the
+# folder holding the worker workspaces. dem and weights can be memory mapped .npy arrays, which the workers then read
+# directly instead of from copies. Shared files written to scratch are deleted when all sources are done, and so is
+# scratch itself if it was created here.
+# symmetric = True is for runs where sources and destinations are the same list and the cost of moving between two
+# cells is the same in both directions (see lcp_engine.is_symmetric). Each unordered pair is then calculated only once,
+# from the source that comes first, and the reversed path is handed back again with the later source. Pairs of a
+# location with itself are skipped.
+# reverse = True gives the same results, but calculates them with one search per destination over reversed edge costs
+# instead of one search per source, which is faster when there are fewer destinations than sources. No grids are saved
+# in a reversed run, and results are only handed back once every destination is done. Grids of reversed searches are
+# kept in cache under their own key, so they are never mistaken for the grids of a forward search.
+# cache is an optional lcp_cache.GridCache. Grids found in it are reused instead of searching again, and new grids are
+# added to it, under fingerprint, the key of the edge costs from GridCache.edge_cost_key. compress_grids = True
+# compresses the grids saved for each source.
+# memory_limit is the most memory in bytes that searches running at the same time may use. It lowers the number of
+# workers if that many searches over the DEM would not fit, or is ignored if None.
+# completed is an optional set of (source index, destination index) tuples for pairs finished by an earlier run. Those
+# pairs are left out of the results, and sources with no pairs left are not searched at all.
+def run_sources(dem, weights, sources, destinations, workers=1, scratch=None, stop_at_destinations=False,
+                max_cost=None, save_grids=False, symmetric=False, reverse=False, cache=None, completed=None,
+                compress_grids=False, memory_limit=None, fingerprint=None):
+    _check_fingerprint(cache, fingerprint)
+    completed = set(completed) if completed else set()
+    if symmetric and len(sources) != len(destinations):
+        raise ValueError('Symmetric runs need the same list of locations as sources and destinations.')
+    created_scratch = scratch is None
+    if created_scratch:
+        scratch = tempfile.mkdtemp(prefix='lcp_')
+    os.makedirs(scratch, exist_ok=True)
+    shared_files = []
+    if reverse:
+        source_count = len(sources)
+        completed = set((j, i) for i, j in completed)
+        # written straight to disk, so that reversing the edge costs never holds a second copy of them in memory
+        reversed_file = os.path.join(scratch, 'weights_reversed.npy')
+        shared_files.append(reversed_file)
+        weights = lcp_engine.reverse_edge_costs(weights, np.shape(dem), out=np.lib.format.open_memmap(
+            reversed_file, mode='w+', dtype=weights.dtype, shape=np.shape(weights)))
+        sources, destinations, save_grids, symmetric = destinations, sources, False, False
+        # grids of searches over reversed edge costs are cached apart from the forward grids of the same cells, under
+        # the key lcp_stream.corridors uses for them
+        if fingerprint is not None:
+            fingerprint += '|reversed'
+    dem_file, written = _shared_file(dem, os.path.join(scratch, 'dem.npy'))
+    if written:
+        shared_files.append(dem_file)
+    weights_file, written = _shared_file(weights, os.path.join(scratch, 'weights.npy'))
+    if written:
+        shared_files.append(weights_file)
+    settings = (dem_file, weights_file, list(destinations), scratch, stop_at_destinations, max_cost, save_grids,
+                compress_grids, cache, fingerprint)
+    if memory_limit is not None:
+        workers = min(workers, lcp_grids.searches_in_memory(np.shape(dem), memory_limit))
+    if symmetric:
+        tasks = [(i, source, [j for j in range(i + 1, len(destinations))
+                              if (i, j) not in completed or (j, i) not in completed])
+                 for i, source in enumerate(sources)]
+    else:
+        tasks = [(i, source, [j for j in range(len(destinations)) if (i, j) not in completed])
+                 for i, source in enumerate(sources)]
+    pool = None
+    try:
+        if workers <= 1:
+            _init_worker(*settings)
+            results = map(_solve_source, tasks)
+        else:
+            # results come back in submission order, so the merge is deterministic
+            results = pool = _pool_map(workers, _init_worker, settings, _solve_source, tasks, scratch)
+        if symmetric:
+            results = _mirror_results(results)
+            results = _drop_completed(results, completed)
+        if reverse:
+            results = _regroup_reversed(results, source_count)
+        for result in results:
+            yield result
+    finally:
+        if pool is not None:
+            pool.close()
+        _worker.clear()
+        # the memory map of the reversed edge costs has to be closed before its file can be removed on Windows
+        weights = None
+        if created_scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+        else:
+            for shared_file in shared_files:
+                if os.path.exists(shared_file):
+                    os.remove(shared_file)
+
+
+# Function that prepares a process to answer pairs for run_pairs. landmark_file holds the landmark costs from
+# lcp_engine.build_landmarks, or is None for searches without landmarks. cache and fingerprint are as for _init_worker.
+def _init_pair_worker(dem_file, weights_file, landmark_file, max_cost, cache, fingerprint):
+    landmarks = np.load(landmark_file, mmap_mode='r') if landmark_file is not None else None
+    _worker.update(dem=np.load(dem_file, mmap_mode='r'), weights=np.load(weights_file, mmap_mode='r'),
+                   landmarks=landmarks, max_cost=max_cost, cache=cache, fingerprint=fingerprint)
+
+
+# Function run for each pair of locations. Returns a tuple of (pair index, path, cost, error, stages), with the path as
+# returned by lcp_engine.astar_path, error None unless the search failed, and stages as for _solve_source. A pair whose
+# source already has grids in the grid cache, from an earlier run over every destination, is traced from those grids
+# without searching.
+def _solve_pair(task):
+    pair_index, source, destination = task
+    timer = lcp_timing.StageTimer(keep_records=True)
+    try:
+        if _worker['cache'] is not None:
+            with timer.stage('grid_cache_load'):
+                grids = _worker['cache'].load(_worker['cache'].key(_worker['fingerprint'], source[2],
+                                                                   _worker['max_cost']))
+            if grids is not None:
+                with timer.stage('trace_paths') as record:
+                    paths, costs = lcp_engine.trace_paths(grids[0], grids[1], [destination[2]])
+                    record['cells'] = 0 if paths[0] is None else len(paths[0])
+                return pair_index, paths[0], float(costs[0]), None, timer.records
+        with timer.stage('astar') as record:
+            path, cost, record['cells'] = lcp_engine.astar_path(_worker['dem'], _worker['weights'], source[2],
+                                                                destination[2], _worker['landmarks'],
+                                                                _worker['max_cost'])
+        return pair_index, path, cost, None, timer.records
+    except Exception as error:
+        return pair_index, None, None, error, timer.records
+
+
+# Function that calculates the least cost path of each (source, destination) pair of locations in pairs, with an A*
+# search per pair guided by landmarks (ALT). Yields one tuple per pair, in the order of pairs, as described for
+# _solve_pair. landmarks is the number of landmark cells; each one costs two searches over the whole DEM up front, and
+# makes every pair search after that cheaper. With landmarks = 0, each pair is a Dijkstra search that stops at the
+# destination. completed is an optional set of indices of pairs finished by an earlier run, which are skipped. workers,
+# scratch and max_cost work as for run_sources.
+# cache is an optional lcp_cache.GridCache, with fingerprint as for run_sources. The landmarks are kept in it and only
+# built the first time a DEM and cost model are used, and pairs from sources with grids in it are traced from those
+# grids.
+def run_pairs(dem, weights, pairs, workers=1, scratch=None, landmarks=8, max_cost=None, completed=None, cache=None,
+              fingerprint=None):
+    _check_fingerprint(cache, fingerprint)
+    completed = set(completed) if completed else set()
+    tasks = [(n, source, destination) for n, (source, destination) in enumerate(pairs) if n not in completed]
+    created_scratch = scratch is None
+    if created_scratch:
+        scratch = tempfile.mkdtemp(prefix='lcp_')
+    os.makedirs(scratch, exist_ok=True)
+    shared_files = []
+    landmark_file = None
+    if tasks and landmarks > 0:
+        landmark_costs = cache.load_landmarks(fingerprint, landmarks) if cache is not None else None
+        if landmark_costs is None:
+            reversed_file = os.path.join(scratch, 'weights_reversed.npy')
+            shared_files.append(reversed_file)
+            reversed_weights = lcp_engine.reverse_edge_costs(weights, np.shape(dem), out=np.lib.format.open_memmap(
+                reversed_file, mode='w+', dtype=weights.dtype, shape=np.shape(weights)))
+            _, forward, backward = lcp_engine.build_landmarks(dem, weights, reversed_weights, landmarks)
+            reversed_weights = None
+            if cache is not None:
+                cache.save_landmarks(fingerprint, forward, backward)
+                landmark_costs = cache.load_landmarks(fingerprint, landmarks)
+            if landmark_costs is None:
+                # no cache, or another run sharing it has already evicted the landmarks again
+                landmark_costs = np.stack((forward, backward))
+            forward = backward = None
+        landmark_file, written = _shared_file(landmark_costs, os.path.join(scratch, 'landmarks.npy'))
+        if written:
+            shared_files.append(landmark_file)
+        landmark_costs = None
+    dem_file, written = _shared_file(dem, os.path.join(scratch, 'dem.npy'))
+    if written:
+        shared_files.append(dem_file)
+    weights_file, written = _shared_file(weights, os.path.join(scratch, 'weights.npy'))
+    if written:
+        shared_files.append(weights_file)
+    settings = (dem_file, weights_file, landmark_file, max_cost, cache, fingerprint)
+    pool = None
+    try:
+        if workers <= 1:
+            _init_pair_worker(*settings)
+            results = map(_solve_pair, tasks)
+        else:
+            results = pool = _pool_map(workers, _init_pair_worker, settings, _solve_pair, tasks, scratch)
+        for result in results:
+            yield result
+    finally:
+        if pool is not None:
+            pool.close()
+        _worker.clear()
+        if created_scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+        else:
+            for shared_file in shared_files:
+                if os.path.exists(shared_file):
+                    os.remove(shared_file)
@@ -0,0 +1,206 @@
+"""python script that benchmarks the numpy backend of the least cost path analysis without ArcGIS, so that changes
+    to the engine can be measured on any machine, including headless Linux servers. For each DEM size it generates a
+    synthetic fractal terrain and random sets of source and destination locations, runs every pair through the same
+    steps as the main script (edge costs, pathdistance and backlink grids, traced paths, path lengths, and the results
+    file), and reports pairs per second, peak memory and the time spent in each stage. Each case runs in its own
+    process so that its peak memory is measured on its own. Results can be saved as a baseline, and later runs are
+    compared against it to flag regressions.
+
+    Example:  python lcp_benchmark.py --sizes 1024 4096 --sources 8 --destinations 8 --baseline baseline.json"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import lcp_costs
+import lcp_results
+import lcp_stream
+import lcp_timing
+
+CELLSIZE = 10.0
+RELIEF = 800.0  # metres between the lowest and highest cell of a synthetic DEM
+
+
+# Function that generates a square fractal DEM of size x size cells by spectral synthesis: random phases with
+# amplitudes falling off as frequency ** -beta, which gives terrain with realistic ridges and valleys for beta between
+# 2 and 3. The same seed always gives the same DEM. Elevations run from 0 to RELIEF metres.
+def fractal_dem(size, seed, beta=2.6):
+    rng = np.random.default_rng(seed)
+    fy = np.fft.fftfreq(size)[:, None]
+    fx = np.fft.rfftfreq(size)[None, :]
+    frequency = np.sqrt(fx * fx + fy * fy)
+    frequency[0, 0] = 1.0
+    amplitude = frequency ** (-beta / 2.0)
+    amplitude[0, 0] = 0.0
+    spectrum = amplitude * np.exp(2j * np.pi * rng.random(amplitude.shape))
+    dem = np.fft.irfft2(spectrum, s=(size, size))
+    dem -= dem.min()
+    dem *= RELIEF / dem.max()
+    return dem
+
+
+# Function that returns count random locations on a DEM of the given shape, as (name, file name, (row, column))
+# tuples in the form lcp_batch expects, with names starting with prefix.
+def random_sites(shape, count, rng, prefix):
+    rows = rng.integers(0, shape[0], count)
+    cols = rng.integers(0, shape[1], count)
+    return [(prefix + str(n), prefix + str(n), (int(row), int(col))) for n, (row, col) in enumerate(zip(rows, cols))]
+
+
+# Function that returns the peak resident memory of this process and its finished child processes in megabytes, or
+# None where the resource module is not available (Windows).
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+
+# Function that returns the name a case is stored under in the baseline.
+def case_name(size, sources, destinations, workers):
+    return str(size) + 'x' + str(size) + '_' + str(sources) + 'x' + str(destinations) + '_w' + str(workers)
+
+
+# Function that runs one case of the benchmark in the current process: every pair of sources and destinations on a
+# fractal DEM of size x size cells, with the named cost function. The edge costs are kept in a grid cache in the
+# scratch folder of the case, as with grid_cache_folder in the main script, so they are memory mapped from disk rather
+# than held in memory. Returns a dictionary of the measurements.
+def run_case(size, sources, destinations, workers, seed, cost_function):
+    rng = np.random.default_rng(seed + 1)
+    dem = fractal_dem(size, seed)
+    source_sites = random_sites(dem.shape, sources, rng, 's')
+    destination_sites = random_sites(dem.shape, destinations, rng, 'd')
+    cost_model = lcp_costs.cost_function(cost_function)
+    timer = lcp_timing.StageTimer()
+    scratch = tempfile.mkdtemp(prefix='lcp_benchmark_')
+    pairs = 0
+    start = time.perf_counter()
+    try:
+        result_buffer = lcp_results.ResultBuffer(os.path.join(scratch, 'results.csv'))
+        for result in lcp_stream.least_cost_paths(dem, CELLSIZE, cost_model, source_sites, destination_sites,
+                                                  workers=workers, scratch=os.path.join(scratch, 'workers'),
+                                                  cache_folder=os.path.join(scratch, 'cache'), timer=timer):
+            with timer.stage('table_write'):
+                result_buffer.add(*result)
+            pairs += 1
+        with timer.stage('table_write') as record:
+            result_buffer.close()
+            record['bytes_written'] = os.path.getsize(result_buffer.path)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    seconds = time.perf_counter() - start
+    return {'case': case_name(size, sources, destinations, workers), 'cells': int(dem.size), 'pairs': pairs,
+            'seconds': seconds, 'pairs_per_second': pairs / seconds, 'peak_rss_mb': peak_rss_mb(),
+            'stages': dict((stage, totals[1]) for stage, totals in timer.totals.items())}
+
+
+# Function that runs a case in a new python process, so that its peak memory is not mixed up with the cases run before
+# it, and returns its measurements.
+def run_case_process(size, sources, destinations, workers, seed, cost_function):
+    case = json.dumps([size, sources, destinations, workers, seed, cost_function])
+    command = [sys.executable, os.path.abspath(__file__), '--run-case', case]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Function that compares the measurements of each case with the baseline. Returns a list of messages, one for each
+# case that ran more than tolerance (a fraction) slower, or used more than tolerance more memory, than its baseline.
+def compare(results, baseline, tolerance):
+    regressions = []
+    for result in results:
+        reference = baseline.get(result['case'])
+        if reference is None:
+            continue
+        if result['pairs_per_second'] < reference['pairs_per_second'] * (1.0 - tolerance):
+            regressions.append(result['case'] + ': ' + format(result['pairs_per_second'], '.3f') + ' pairs/s, baseline '
+                               + format(reference['pairs_per_second'], '.3f'))
+        if result['peak_rss_mb'] is not None and reference.get('peak_rss_mb') is not None and \
+                result['peak_rss_mb'] > reference['peak_rss_mb'] * (1.0 + tolerance):
+            regressions.append(result['case'] + ': peak memory ' + format(result['peak_rss_mb'], '.1f')
+                               + ' MB, baseline ' + format(reference['peak_rss_mb'], '.1f') + ' MB')
+    return regressions
+
+
+# Function that prints the measurements of a case, with the change from the baseline where there is one.
+def report(result, reference):
+    def change(value, base):
+        return '' if base is None or value is None or not base else ' ({:+.1f}%)'.format(100.0 * (value - base) / base)
+
+    reference = reference or {}
+    print(result['case'] + ': ' + str(result['pairs']) + ' pairs over ' + str(result['cells']) + ' cells in '
+          + format(result['seconds'], '.2f') + ' s')
+    print('  pairs/s         ' + format(result['pairs_per_second'], '.3f')
+          + change(result['pairs_per_second'], reference.get('pairs_per_second')))
+    if result['peak_rss_mb'] is not None:
+        print('  peak memory     ' + format(result['peak_rss_mb'], '.1f') + ' MB'
+              + change(result['peak_rss_mb'], reference.get('peak_rss_mb')))
+    for stage, seconds in sorted(result['stages'].items(), key=lambda item: -item[1]):
+        print('  {:<16}{:.3f} s'.format(stage, seconds) + change(seconds, reference.get('stages', {}).get(stage)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the numpy backend of the least cost path analysis on '
+                                                 'synthetic fractal DEMs.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024],
+                        help='DEM sizes to run, in cells along each side (for example 1024 4096)')
+    parser.add_argument('--sources', type=int, default=8, help='number of source locations')
+    parser.add_argument('--destinations', type=int, default=8, help='number of destination locations')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=1, help='seed for the DEMs and locations')
+    parser.add_argument('--cost-function', default='tobler', choices=sorted(lcp_costs.COST_FUNCTIONS),
+                        help='built in cost function to use')
+    parser.add_argument('--baseline', help='JSON file with baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save the results to the baseline file instead of comparing with it')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='fraction by which a case may be slower or use more memory than its baseline')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    arguments = parser.parse_args(argv)
+    if arguments.save_baseline and arguments.baseline is None:
+        parser.error('--save-baseline needs --baseline')
+
+    if arguments.run_case is not None:
+        print(json.dumps(run_case(*json.loads(arguments.run_case))))
+        return 0
+
+    baseline = {}
+    if arguments.baseline is not None and not arguments.save_baseline and os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    results = []
+    for size in arguments.sizes:
+        result = run_case_process(size, arguments.sources, arguments.destinations, arguments.workers, arguments.seed,
+                                  arguments.cost_function)
+        report(result, baseline.get(result['case']))
+        results.append(result)
+
+    if arguments.save_baseline:
+        saved = {}
+        if os.path.exists(arguments.baseline):
+            with open(arguments.baseline) as baseline_file:
+                saved = json.load(baseline_file)
+        saved.update((result['case'], result) for result in results)
+        with open(arguments.baseline, 'w') as baseline_file:
+            json.dump(saved, baseline_file, indent=2, sort_keys=True)
+        print('Saved baseline for ' + ', '.join(result['case'] for result in results) + ' to ' + arguments.baseline)
+        return 0
+
+    regressions = compare(results, baseline, arguments.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
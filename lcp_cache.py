@@ -0,0 +1,159 @@
+"""python module that keeps pathdistance and backlink grids calculated by the numpy backend on disk between runs, so
+    that a source location is only searched again when the DEM, the cost table, or the location itself changes. Grids
+    are stored under a key made from a hash of the DEM, its cell size, and the cost table (which is all the edge costs
+    depend on), the source cell, and the maximum cost of the search, in the compact form written by lcp_grids. The cache
+    folder can be given a size limit, in which case the grids used least recently are deleted first once the limit is
+    passed. The edge costs of each DEM and cost table are kept in the same folder, so that the slope and vertical
+    factor of every move are only calculated the first time a DEM is used with a cost table, and so is the landmark
+    index used to answer lists of pairs, which only has to be built once for a DEM and cost table and is then reused
+    with any set of locations."""
+
+import hashlib
+import os
+import uuid
+
+import numpy as np
+
+import lcp_costs
+import lcp_engine
+import lcp_grids
+
+
+class GridCache(object):
+    # folder is created if it doesn't exist. max_bytes is the size limit for all grids in the folder, or None for no
+    # limit. compress = True compresses the grids, which makes them smaller but slower to save and load.
+    def __init__(self, folder, max_bytes=None, compress=False):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.compress = compress
+        os.makedirs(folder, exist_ok=True)
+
+    # Returns the key of the grids for a search from source_cell, a (row, column) tuple, over the edge costs with the
+    # given fingerprint, the key of the edge costs from edge_cost_key().
+    @staticmethod
+    def key(fingerprint, source_cell, max_cost=None):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update((fingerprint + '|' + str(tuple(source_cell)) + '|' + str(max_cost)).encode())
+        return digest.hexdigest()
+
+    # Returns the key of the edge costs for a DEM, its cell size, and a vertical factor table from
+    # lcp_engine.read_vf_table or cost function from lcp_costs. The DEM can be a memory mapped array. The key is also
+    # the fingerprint that grids and landmarks calculated over those edge costs are stored under; it is calculated once
+    # per run, and hashes the DEM, which is much smaller than its edge costs. The DEM is hashed block_rows rows at a
+    # time, as float64 whatever its dtype, so a DEM of another dtype is never copied whole.
+    @staticmethod
+    def edge_cost_key(dem, cellsize, vf_table, block_rows=1024):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update((str(np.shape(dem)) + '|' + repr(float(cellsize)) + '|' + lcp_engine.WEIGHTS_DTYPE).encode())
+        for top in range(0, np.shape(dem)[0], block_rows):
+            digest.update(np.ascontiguousarray(dem[top:top + block_rows], dtype='float64').data)
+        if callable(vf_table):
+            digest.update(lcp_costs.describe(vf_table).encode())
+        else:
+            for values in vf_table:
+                digest.update(np.ascontiguousarray(values, dtype='float64').data)
+        return digest.hexdigest()
+
+    # Returns the edge costs from lcp_engine.edge_costs for a DEM, cell size, and vertical factor table, as a read only
+    # memory mapped array. They are read from the cache if they are in it, and otherwise calculated and added to it. key
+    # is their key from edge_cost_key(), if it has already been calculated.
+    def edge_costs(self, dem, cellsize, vf_table, key=None):
+        if key is None:
+            key = self.edge_cost_key(dem, cellsize, vf_table)
+        weights_file = os.path.join(self.folder, key + '.weights.npy')
+        try:
+            weights = np.load(weights_file, mmap_mode='r')
+            os.utime(weights_file)
+            return weights
+        except (OSError, ValueError):
+            pass
+        temporary_file = weights_file + '.' + uuid.uuid4().hex + '.tmp'
+        weights = np.lib.format.open_memmap(temporary_file, mode='w+', dtype=lcp_engine.WEIGHTS_DTYPE,
+                                            shape=(8, np.size(dem)))
+        lcp_engine.edge_costs(dem, cellsize, vf_table, out=weights)
+        weights.flush()
+        # the memory map has to be closed before the file can be renamed on Windows
+        del weights
+        os.replace(temporary_file, weights_file)
+        weights = np.load(weights_file, mmap_mode='r')
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes, keep=(weights_file,))
+        return weights
+
+    # Returns the landmark costs from lcp_engine.build_landmarks for the edge costs with the given fingerprint and
+    # number of landmarks, as a read only memory mapped array of shape (2, count, cells) holding the forward and
+    # backward costs, or None if they are not in the cache.
+    def load_landmarks(self, fingerprint, count):
+        landmark_file = os.path.join(self.folder, fingerprint + '.' + str(count) + '.landmarks.npy')
+        try:
+            landmarks = np.load(landmark_file, mmap_mode='r')
+            os.utime(landmark_file)
+        except (OSError, ValueError):
+            return None
+        return landmarks
+
+    # Stores the forward and backward landmark costs for the edge costs with the given fingerprint.
+    def save_landmarks(self, fingerprint, forward, backward):
+        landmark_file = os.path.join(self.folder, fingerprint + '.' + str(len(forward)) + '.landmarks.npy')
+        temporary_file = landmark_file + '.' + uuid.uuid4().hex + '.tmp'
+        with open(temporary_file, 'wb') as temporary:
+            np.save(temporary, np.stack((forward, backward)))
+        os.replace(temporary_file, landmark_file)
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes, keep=(landmark_file,))
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + '.grids.npz')
+
+    # Returns True if grids are stored under key.
+    def contains(self, key):
+        return os.path.exists(self._path(key))
+
+    # Returns the (pathdistance, backlink) grids stored under key, or None if they are not in the cache. Pathdistance is
+    # returned as float32. Marks the grids as used, for the size limit.
+    def load(self, key):
+        grid_file = self._path(key)
+        try:
+            grids = lcp_grids.load_grids(grid_file)
+            os.utime(grid_file)
+        except (OSError, ValueError, KeyError):
+            return None
+        return grids
+
+    # Stores a pair of grids under key. The file is written under a temporary name and then renamed, so that grids
+    # being written by one process are never read by another. Removes the least recently used grids if the cache has
+    # grown past its size limit.
+    def save(self, key, accumulated, backlink):
+        grid_file = self._path(key)
+        temporary_file = grid_file + '.' + uuid.uuid4().hex + '.tmp'
+        lcp_grids.save_grids(temporary_file, accumulated, backlink, self.compress)
+        os.replace(temporary_file, grid_file)
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes, keep=(grid_file,))
+
+    # Deletes the least recently used grids, edge costs and landmarks until the cache is no larger than max_bytes. Files
+    # in keep, those just written and about to be used, are never deleted, even if they alone are larger than max_bytes.
+    def evict(self, max_bytes, keep=()):
+        entries = []
+        total = 0
+        for file_name in os.listdir(self.folder):
+            if not file_name.endswith(('.grids.npz', '.weights.npy', '.landmarks.npy')):
+                continue
+            grid_file = os.path.join(self.folder, file_name)
+            try:
+                size = os.path.getsize(grid_file)
+                entries.append((os.path.getmtime(grid_file), size, grid_file))
+            except OSError:
+                continue
+            total += size
+        for last_used, size, grid_file in sorted(entries):
+            if total <= max_bytes:
+                break
+            if grid_file in keep:
+                continue
+            try:
+                os.remove(grid_file)
+            except OSError:
+                # still open in another process on Windows; it will be removed on a later pass
+                continue
+            total -= size
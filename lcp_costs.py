@@ -0,0 +1,89 @@
+"""python module with built in cost functions for the numpy backend, as an alternative to a slope/cost table. Each
+    function calculates the cost of moving between neighbouring cells straight from its published formula, for whole
+    arrays of moves at once, given the horizontal distance and the rise of each move in metres. The functions are
+    selected by name with cost_function(), and write_vf_table() samples any of them into a table that VfTable can read,
+    so the same cost model can also be used with the arcpy backend."""
+
+import functools
+import math
+
+import numpy as np
+
+
+# Tobler's hiking function (Tobler 1993). Walking speed in km/h is 6 * exp(-3.5 * |dh/dx + 0.05|), where dh/dx is the
+# slope of the move, and off_path = True slows it to three fifths of that, as Tobler suggests for walking off paths.
+# Returns the time taken for each move in hours, over its horizontal distance, as in the original formula. The time is
+# worked out as distance times the reciprocal of the speed, which becomes infinite on slopes so steep that the speed
+# itself would be rounded to zero.
+def tobler(horizontal, rise, off_path=False):
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        hours = horizontal / 1000.0 / 6.0 * np.exp(3.5 * np.abs(rise / horizontal + 0.05))
+    if off_path:
+        hours = hours / 0.6
+    return hours
+
+
+# Pandolf et al. (1977) metabolic rate of walking with a load, with the correction of Santee et al. (2003) for downhill
+# grades. body_mass and load are in kg, speed in m/s, and terrain is the terrain factor (1.0 for a treadmill or paved
+# road, higher for rougher ground). Returns the energy used for each move in kilocalories, as metabolic rate times the
+# time taken to walk its surface distance at speed. The metabolic rate is never taken to be lower than the rate of
+# standing still with the load, which the downhill correction can otherwise fall below on steep descents.
+def pandolf(horizontal, rise, body_mass=70.0, load=0.0, speed=1.25, terrain=1.0):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grade = 100.0 * rise / horizontal
+    weight = body_mass + load
+    standing = 1.5 * body_mass + 2.0 * weight * (load / body_mass) ** 2
+    rate = standing + terrain * weight * (1.5 * speed ** 2 + 0.35 * speed * grade)
+    correction = terrain * (grade * weight * speed / 3.5 - weight * (grade + 6.0) ** 2 / body_mass + 25.0 - speed ** 2)
+    rate = np.where(grade < 0, rate - correction, rate)
+    rate = np.maximum(rate, standing)
+    seconds = np.sqrt(horizontal * horizontal + rise * rise) / speed
+    return rate * seconds / 4184.0
+
+
+# Minetti et al. (2002) energy cost of walking on gradients. The cost in J per kg of body mass per metre walked is
+# 280.5i^5 - 58.7i^4 - 76.8i^3 + 51.9i^2 + 19.6i + 2.5, where i is the gradient (rise over horizontal distance).
+# Returns the energy used for each move in J per kg of body mass, over its surface distance. Like moves beyond the end
+# of a slope/cost table, moves steeper than the gradients Minetti measured (+/- max_gradient) are impassable.
+def minetti(horizontal, rise, max_gradient=0.45):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        i = rise / horizontal
+    per_metre = ((((280.5 * i - 58.7) * i - 76.8) * i + 51.9) * i + 19.6) * i + 2.5
+    cost = per_metre * np.sqrt(horizontal * horizontal + rise * rise)
+    return np.where(np.abs(i) <= max_gradient, cost, np.inf)
+
+
+COST_FUNCTIONS = {'tobler': tobler, 'pandolf': pandolf, 'minetti': minetti}
+
+
+# Function that returns the built in cost function with the given name, with any of its keyword parameters set, such
+# as cost_function('pandolf', load=20.0). The result can be passed to lcp_engine in place of a slope/cost table.
+def cost_function(name, **parameters):
+    try:
+        function = COST_FUNCTIONS[name.lower()]
+    except KeyError:
+        raise ValueError('Unknown cost function ' + str(name) + '. Use one of: ' + ', '.join(sorted(COST_FUNCTIONS))
+                         + '.')
+    return functools.partial(function, **parameters)
+
+
+# Function that returns a text description of a cost function from cost_function(), such as "pandolf(load=20.0)",
+# which identifies it in cache keys and the progress journal.
+def describe(cost_model):
+    parameters = ', '.join(name + '=' + repr(value) for name, value in sorted(cost_model.keywords.items()))
+    return cost_model.func.__name__ + '(' + parameters + ')'
+
+
+# Function that writes a cost function to path as a slope/cost table for VfTable, with one row for every step degrees
+# of slope. The factor for each angle is the cost of a move one metre long over the surface, which PathDistance then
+# multiplies by the surface distance of every move. Angles where the cost function is impassable are left out, which
+# VfTable treats the same way.
+def write_vf_table(cost_model, path, step=1.0):
+    angles = np.arange(-90.0 + step, 90.0, step)
+    radians = np.radians(angles)
+    factors = cost_model(np.cos(radians), np.sin(radians))
+    with open(path, 'w') as table_file:
+        for angle, factor in zip(angles, factors):
+            if math.isfinite(factor):
+                table_file.write(repr(float(angle)) + ', ' + repr(float(factor)) + '\n')
+    return path
@@ -0,0 +1,600 @@
+"""python module that reproduces the pathdistance and backlink rasters of arcpy.sa.PathDistance with NumPy, so that
+    least cost path analysis can run without a Spatial Analyst license or a Windows machine.  The digital elevation
+    model is handled as a 2D array, the cost table as the same slope/cost text file passed to VfTable (or as one of the
+    cost functions in lcp_costs), and the accumulated cost surface is grown outward from the source cells with a heap
+    based Dijkstra search over the eight neighbours of every cell.  Outputs follow the ArcGIS conventions: accumulated
+    cost in the units of the cost table, and backlink values of 0 for source cells and 1 through 8 for the direction of
+    the next cell on the way back to the source, clockwise starting with east."""
+
+import heapq
+import math
+import tempfile
+
+import numpy as np
+
+# Row and column offsets for the eight neighbours of a cell, in ArcGIS backlink order (east, southeast, south,
+# southwest, west, northwest, north, northeast). Direction index k corresponds to backlink value k + 1.
+ROW_OFFSETS = (0, 1, 1, 1, 0, -1, -1, -1)
+COL_OFFSETS = (1, 1, 0, -1, -1, -1, 0, 1)
+
+BACKLINK_SOURCE = 0
+BACKLINK_NODATA = 15  # fits in four bits, so backlink grids can be packed two cells to a byte
+# Edge costs are stored as float32, which halves the size of the largest array of an analysis; searches still add them
+# up in float64.
+WEIGHTS_DTYPE = 'float32'
+
+
+# Function that reads a vertical factor table, the same ASCII file handed to VfTable(cost_table). Each line holds a
+# vertical relative moving angle in degrees and the cost factor for that angle, separated by a comma or whitespace.
+def read_vf_table(cost_table):
+    angles = []
+    factors = []
+    with open(cost_table) as table_file:
+        for line in table_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            values = line.replace(',', ' ').split()
+            angles.append(float(values[0]))
+            factors.append(float(values[1]))
+    if len(angles) < 2:
+        raise ValueError('Vertical factor table ' + str(cost_table) + ' needs at least two slope/cost rows.')
+    order = np.argsort(angles)
+    return np.asarray(angles, dtype='float64')[order], np.asarray(factors, dtype='float64')[order]
+
+
+# Function that interpolates the vertical factor table for an array of slope angles. Like VfTable, angles outside the
+# range covered by the table get an infinite factor, which makes those moves impassable.
+def vertical_factor(angles, vf_table):
+    table_angles, table_factors = vf_table
+    factor = np.interp(angles, table_angles, table_factors)
+    factor[(angles < table_angles[0]) | (angles > table_angles[-1])] = np.inf
+    return factor
+
+
+# Function that calculates the cost of moves over a horizontal distance with the given rise, for an array of rises.
+# cost_model is either a vertical factor table from read_vf_table, in which case the cost is the surface distance of
+# the move multiplied by the vertical factor for its slope angle, or a cost function from lcp_costs, which is called
+# with the horizontal distance and rise directly.
+def move_costs(horizontal, rise, cost_model):
+    if callable(cost_model):
+        return cost_model(horizontal, rise)
+    angle = np.degrees(np.arctan(rise / horizontal))
+    return np.sqrt(horizontal * horizontal + rise * rise) * vertical_factor(angle, cost_model)
+
+
+# Function that returns the (row slice, column slice) pair selecting every cell that has a neighbour in direction k,
+# and the matching pair selecting those neighbours.
+def _neighbour_slices(k, rows, cols):
+    dr, dc = ROW_OFFSETS[k], COL_OFFSETS[k]
+    from_cells = (slice(max(0, -dr), rows - max(0, dr)), slice(max(0, -dc), cols - max(0, dc)))
+    to_cells = (slice(max(0, dr), rows - max(0, -dr)), slice(max(0, dc), cols - max(0, -dc)))
+    return from_cells, to_cells
+
+
+# Function that checks whether a vertical factor table gives the same factor going uphill and downhill at every slope,
+# in which case the cost of moving between two cells is the same in both directions and least cost paths are symmetric.
+# A cost function from lcp_costs is checked at every whole degree of slope instead.
+def is_symmetric(vf_table, tolerance=1e-9):
+    if callable(vf_table):
+        radians = np.radians(np.arange(0.0, 90.0))
+        uphill, downhill = vf_table(np.cos(radians), np.sin(radians)), vf_table(np.cos(radians), -np.sin(radians))
+    else:
+        angles = np.concatenate((vf_table[0], -vf_table[0]))
+        uphill, downhill = vertical_factor(angles, vf_table), vertical_factor(-angles, vf_table)
+    with np.errstate(invalid='ignore'):
+        same = (uphill == downhill) | (np.abs(uphill - downhill) <= tolerance * np.abs(uphill))
+    return bool(np.all(same))
+
+
+# Function that calculates the cost of moving from every cell to each of its eight neighbours. Cost is the surface
+# distance between the two cell centres multiplied by the vertical factor for the slope angle of the move, matching
+# PathDistance run with the DEM as both surface raster and vertical raster and no cost raster. vf_table can also be a
+# cost function from lcp_costs (see move_costs). Moves off the edge of
+# the grid, or into or out of NoData (NaN) cells, get an infinite cost. Returns an array of WEIGHTS_DTYPE and shape
+# (8, rows * cols); each block is calculated in float64 and rounded once when stored.
+# The DEM is read block_rows rows at a time, so it can be a memory mapped array larger than the available memory, and
+# out can be a memory mapped (8, rows * cols) array the costs are written into instead of a new array.
+def edge_costs(dem, cellsize, vf_table, out=None, block_rows=1024):
+    rows, cols = np.shape(dem)
+    weights = np.empty((8, rows * cols), dtype=WEIGHTS_DTYPE) if out is None else out
+    for top in range(0, rows, block_rows):
+        bottom = min(rows, top + block_rows)
+        # the block is read with one extra row above and below, which hold the neighbours of its first and last rows
+        first, last = max(0, top - 1), min(rows, bottom + 1)
+        block_costs = _block_edge_costs(np.asarray(dem[first:last], dtype='float64'), cellsize, vf_table)
+        # moves too costly for float32, which only steep slopes reach, become infinite and so impassable
+        with np.errstate(over='ignore'):
+            weights[:, top * cols:bottom * cols] = block_costs[:, top - first:bottom - first].reshape(8, -1)
+    return weights
+
+
+# Function that calculates the cost of every move within a block of DEM rows, as an array of shape (8, rows, cols).
+def _block_edge_costs(dem, cellsize, vf_table):
+    rows, cols = dem.shape
+    costs = np.full((8, rows, cols), np.inf)
+    for k in range(8):
+        horizontal = cellsize * (math.sqrt(2.0) if ROW_OFFSETS[k] and COL_OFFSETS[k] else 1.0)
+        from_cells, to_cells = _neighbour_slices(k, rows, cols)
+        rise = dem[to_cells] - dem[from_cells]
+        with np.errstate(invalid='ignore'):
+            cost = move_costs(horizontal, rise, vf_table)
+        cost[~np.isfinite(cost)] = np.inf
+        costs[k][from_cells] = cost
+    return costs
+
+
+# Function that reverses the direction of every move in an array of edge costs from edge_costs(). In the result, the
+# cost of moving from a cell to its neighbour in direction k is the cost of moving from that neighbour back to the cell.
+# A search from a cell over the reversed costs gives the accumulated cost of travelling from every other cell to it.
+# As with edge_costs, out can be a memory mapped array to write the reversed costs into.
+def reverse_edge_costs(weights, shape, out=None):
+    rows, cols = shape
+    reversed_weights = np.empty(np.shape(weights), dtype=weights.dtype) if out is None else out
+    for k in range(8):
+        from_cells, to_cells = _neighbour_slices(k, rows, cols)
+        reversed_weights[k] = np.inf
+        reversed_weights[k].reshape(rows, cols)[from_cells] = weights[(k + 4) % 8].reshape(rows, cols)[to_cells]
+    return reversed_weights
+
+
+# Function that converts arrays of map coordinates into the rows and columns of the DEM cells containing them. xmin and
+# ymax are the coordinates of the upper left corner of the DEM, and shape its (rows, columns).
+def xy_to_cells(x, y, xmin, ymax, cellsize, shape):
+    x, y = np.asarray(x, dtype='float64'), np.asarray(y, dtype='float64')
+    rows = np.floor((ymax - y) / cellsize).astype('int64')
+    cols = np.floor((x - xmin) / cellsize).astype('int64')
+    outside = ~xy_inside(x, y, xmin, ymax, cellsize, shape)
+    if outside.any():
+        raise ValueError('Locations ' + ', '.join(str((float(x[n]), float(y[n]))) for n in np.flatnonzero(outside))
+                         + ' fall outside the extent of the DEM.')
+    return rows, cols
+
+
+# Function that returns a boolean array that is True for the map coordinates that fall inside the extent of the DEM,
+# with the arguments of xy_to_cells.
+def xy_inside(x, y, xmin, ymax, cellsize, shape):
+    rows = np.floor((ymax - np.asarray(y, dtype='float64')) / cellsize)
+    cols = np.floor((np.asarray(x, dtype='float64') - xmin) / cellsize)
+    return (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+
+
+# Function that calculates the accumulated cost (pathdistance) and backlink grids from one or more source cells.
+# sources is a list of (row, column) tuples. Cells that cannot be reached keep an accumulated cost of infinity and a
+# backlink value of BACKLINK_NODATA. Passing precomputed weights from edge_costs() skips the slope calculation.
+# If targets, a list of (row, column) tuples, is given, the search stops as soon as the final cost of every target is
+# known, and only cells settled up to that point are filled in. Cells whose accumulated cost would exceed max_cost are
+# never reached, like the maximum_distance option of PathDistance. If scratch, a folder, is given, the grids of the
+# search are memory mapped files in it rather than arrays in memory (see scratch_array).
+def path_distance(dem, cellsize, vf_table, sources, weights=None, targets=None, max_cost=None, scratch=None):
+    rows, cols = np.shape(dem)
+    if weights is None:
+        weights = edge_costs(dem, cellsize, vf_table)
+    accumulated = scratch_array(rows * cols, 'float64', np.inf, scratch)
+    backlink = scratch_array(rows * cols, 'uint8', BACKLINK_NODATA, scratch)
+    settled = scratch_array(rows * cols, 'bool', False, scratch)
+
+    # memoryviews index like python lists, which keeps the inner loop free of numpy scalar overhead
+    cost_view = memoryview(accumulated)
+    link_view = memoryview(backlink)
+    done_view = memoryview(settled)
+    weight_views = [memoryview(weights[k]) for k in range(8)]
+    steps = [ROW_OFFSETS[k] * cols + COL_OFFSETS[k] for k in range(8)]
+    # a cell reached by moving in direction k points back along the opposite direction, (k + 4) % 8
+    back_codes = [(k + 4) % 8 + 1 for k in range(8)]
+
+    heap = []
+    for row, col in sources:
+        index = row * cols + col
+        cost_view[index] = 0.0
+        link_view[index] = BACKLINK_SOURCE
+        heap.append((0.0, index))
+    heapq.heapify(heap)
+
+    remaining = 0
+    if targets is not None:
+        is_target = scratch_array(rows * cols, 'bool', False, scratch)
+        is_target[[row * cols + col for row, col in targets]] = True
+        target_view = memoryview(is_target)
+        remaining = int(is_target.sum())
+    limit = math.inf if max_cost is None else max_cost
+
+    heappush, heappop, inf = heapq.heappush, heapq.heappop, math.inf
+    while heap:
+        cost, index = heappop(heap)
+        if done_view[index]:
+            continue
+        done_view[index] = True
+        if remaining and target_view[index]:
+            remaining -= 1
+            if not remaining:
+                break
+        for k in range(8):
+            weight = weight_views[k][index]
+            if weight == inf:
+                continue
+            neighbour = index + steps[k]
+            new_cost = cost + weight
+            if new_cost < cost_view[neighbour] and new_cost <= limit:
+                cost_view[neighbour] = new_cost
+                link_view[neighbour] = back_codes[k]
+                heappush(heap, (new_cost, neighbour))
+
+    # after an early stop, cells still waiting in the heap only hold provisional costs
+    if heap:
+        accumulated[~settled] = np.inf
+        backlink[~settled] = BACKLINK_NODATA
+
+    return accumulated.reshape(rows, cols), backlink.reshape(rows, cols)
+
+
+# Function that returns a 1D array of size cells of dtype, filled with fill. If scratch, a folder, is given, the array
+# is memory mapped from an unnamed temporary file in it, so that only the parts of it a search reaches are held in
+# memory. The file has no name to clean up: it is deleted by the operating system when the array is.
+def scratch_array(size, dtype, fill, scratch=None):
+    if scratch is None:
+        return np.full(size, fill, dtype=dtype)
+    with tempfile.TemporaryFile(dir=scratch) as backing:
+        array = np.memmap(backing, dtype=dtype, mode='w+', shape=(size,))
+    if fill:
+        array[:] = fill
+    return array
+
+
+# Function that repairs the pathdistance and backlink grids of a search after the DEM has been edited in the cells
+# marked True in changed, a boolean grid, instead of searching the whole DEM again. weights are the edge costs of the
+# edited DEM. Every move into or out of a changed cell may have a new cost, so cells reached through such a move, and
+# every cell whose path to the source passes through one of them, lose their cost. The search then starts again from
+# the cells around them, and from cells that the changed moves make cheaper to reach, and only spreads as far as costs
+# actually change. Returns the repaired grids and the number of cells whose cost was recalculated.
+def repair_path_distance(weights, accumulated, backlink, changed, max_cost=None):
+    rows, cols = np.shape(backlink)
+    accumulated = np.array(accumulated, dtype='float64').ravel()
+    backlink = np.array(backlink, dtype='uint8').ravel()
+    changed = np.asarray(changed, dtype='bool')
+    index_type = 'int32' if rows * cols < 2 ** 31 else 'int64'
+    steps = np.zeros(256, dtype=index_type)
+    for k in range(8):
+        steps[k + 1] = ROW_OFFSETS[k] * cols + COL_OFFSETS[k]
+    reached = backlink != BACKLINK_NODATA
+    parent = np.arange(rows * cols, dtype=index_type)
+    parent[reached] += steps[backlink[reached]]
+
+    # the move into a cell from the cell it was reached from has changed if either end of it is a changed cell
+    flat_changed = changed.ravel()
+    invalid = reached & (backlink != BACKLINK_SOURCE) & (flat_changed | flat_changed[parent])
+    # spreads the loss to every cell downstream, by pointer jumping as in allocate()
+    for _ in range(64):
+        invalid |= invalid[parent]
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            break
+        parent = jumped
+    else:
+        raise ValueError('Backlink grid contains a loop and cannot be traced back to a source.')
+    parent = jumped = None
+    accumulated[invalid] = np.inf
+    backlink[invalid] = BACKLINK_NODATA
+
+    # cells that may get a new cost: those that lost theirs, and the changed cells and their neighbours, which are the
+    # ends of every changed move. Each starts from its cheapest move in from a neighbour that kept its cost.
+    near_changed = changed.copy()
+    for k in range(8):
+        from_cells, to_cells = _neighbour_slices(k, rows, cols)
+        near_changed[to_cells] |= changed[from_cells]
+    cells = np.flatnonzero((invalid | near_changed.ravel()) & (backlink != BACKLINK_SOURCE))
+    cell_rows, cell_cols = np.divmod(cells, cols)
+    best = np.full(cells.size, np.inf)
+    best_links = np.zeros(cells.size, dtype='uint8')
+    for k in range(8):
+        # the neighbour that reaches each cell by moving in direction k
+        from_rows, from_cols = cell_rows - ROW_OFFSETS[k], cell_cols - COL_OFFSETS[k]
+        inside = np.flatnonzero((from_rows >= 0) & (from_rows < rows) & (from_cols >= 0) & (from_cols < cols))
+        neighbours = from_rows[inside] * cols + from_cols[inside]
+        cost = accumulated[neighbours] + np.asarray(weights[k])[neighbours]
+        better = cost < best[inside]
+        best[inside[better]] = cost[better]
+        best_links[inside[better]] = (k + 4) % 8 + 1
+    limit = math.inf if max_cost is None else max_cost
+    improved = (best < accumulated[cells]) & (best <= limit)
+    accumulated[cells[improved]] = best[improved]
+    backlink[cells[improved]] = best_links[improved]
+    heap = list(zip(best[improved].tolist(), cells[improved].tolist()))
+    heapq.heapify(heap)
+
+    cost_view = memoryview(accumulated)
+    link_view = memoryview(backlink)
+    weight_views = [memoryview(np.ascontiguousarray(weights[k])) for k in range(8)]
+    move_steps = [ROW_OFFSETS[k] * cols + COL_OFFSETS[k] for k in range(8)]
+    back_codes = [(k + 4) % 8 + 1 for k in range(8)]
+    heappush, heappop, inf = heapq.heappush, heapq.heappop, math.inf
+    recalculated = 0
+    while heap:
+        cost, index = heappop(heap)
+        # costs lowered after an entry was pushed leave the entry behind in the heap
+        if cost > cost_view[index]:
+            continue
+        recalculated += 1
+        for k in range(8):
+            weight = weight_views[k][index]
+            if weight == inf:
+                continue
+            neighbour = index + move_steps[k]
+            new_cost = cost + weight
+            if new_cost < cost_view[neighbour] and new_cost <= limit:
+                cost_view[neighbour] = new_cost
+                link_view[neighbour] = back_codes[k]
+                heappush(heap, (new_cost, neighbour))
+
+    return accumulated.reshape(rows, cols), backlink.reshape(rows, cols), recalculated
+
+
+# Function that picks count landmark cells for goal directed (ALT) searches, and calculates the accumulated cost from
+# each landmark to every cell and from every cell to each landmark. Landmarks are picked one at a time as the cell with
+# the highest accumulated cost from the landmarks picked so far, the first as the one farthest from start, a (row,
+# column) tuple; landmarks on the edges of the DEM give the tightest bounds. Without a start, the search starts from
+# the passable cell nearest the middle of the DEM, so the landmarks only depend on the DEM and cost model and can be
+# reused with any locations. reversed_weights are the edge costs from reverse_edge_costs(weights). Returns the list of
+# landmark cells and two arrays of shape (count, rows * cols) holding the forward and backward accumulated costs.
+def build_landmarks(dem, weights, reversed_weights, count, start=None):
+    rows, cols = np.shape(dem)
+    if start is None:
+        passable = np.zeros(rows * cols, dtype='bool')
+        for k in range(8):
+            passable |= np.isfinite(weights[k])
+        row, col = np.divmod(np.arange(rows * cols), cols)
+        distance = np.where(passable, (row - rows // 2) ** 2 + (col - cols // 2) ** 2, rows * rows + cols * cols)
+        start = divmod(int(np.argmin(distance)), cols)
+    forward = np.empty((count, rows * cols))
+    backward = np.empty((count, rows * cols))
+    nearest = path_distance(dem, None, None, [start], weights=weights)[0].ravel()
+    cells = []
+    for n in range(count):
+        cell = divmod(int(np.argmax(np.where(np.isfinite(nearest), nearest, -1.0))), cols)
+        cells.append(cell)
+        forward[n] = path_distance(dem, None, None, [cell], weights=weights)[0].ravel()
+        backward[n] = path_distance(dem, None, None, [cell], weights=reversed_weights)[0].ravel()
+        nearest = forward[n].copy() if n == 0 else np.minimum(nearest, forward[n])
+    return cells, forward, backward
+
+
+# Function that finds the least cost path from source to target, both (row, column) tuples, with an A* search that
+# settles cells in order of accumulated cost plus a lower bound on the remaining cost to the target. landmarks holds the
+# forward and backward landmark costs of build_landmarks, such as the (2, count, cells) array kept by lcp_cache; by the
+# triangle inequality, the cost from a cell v to the target is at least cost(L, target) - cost(L, v) and cost(v, L) -
+# cost(target, L) for every landmark L. The bound is only worked out for the cells the search reaches, and cells that
+# cannot reach the target at all are never queued. Without landmarks it is a Dijkstra search that stops at the target.
+# Only cells that could lie on a cheaper path than the bound allows are visited, which is usually a narrow band between
+# the two locations, so the state of the search is kept in dictionaries holding those cells rather than in grids the
+# size of the DEM. Returns the path as an array of flat cell indices from the target back to the source, as
+# trace_paths does, its cost, rounded as there, and the number of cells the search settled; the path is None and its
+# cost infinity if the target cannot be reached within max_cost.
+def astar_path(dem, weights, source, target, landmarks=None, max_cost=None):
+    cols = np.shape(dem)[1]
+    weight_views = [memoryview(weights[k]) for k in range(8)]
+    steps = [ROW_OFFSETS[k] * cols + COL_OFFSETS[k] for k in range(8)]
+    back_codes = [(k + 4) % 8 + 1 for k in range(8)]
+    start = source[0] * cols + source[1]
+    goal = target[0] * cols + target[1]
+
+    # each landmark contributes (costs from it, its cost to the target) and (costs to it, the target's cost to it)
+    bounds_from = []
+    if landmarks is not None:
+        for n in range(len(landmarks[0])):
+            forward, backward = memoryview(np.asarray(landmarks[0][n])), memoryview(np.asarray(landmarks[1][n]))
+            bounds_from.append((forward, forward[goal], backward, backward[goal]))
+    bounds = {}
+
+    limit = math.inf if max_cost is None else max_cost
+    accumulated = {start: 0.0}
+    backlink = {start: BACKLINK_SOURCE}
+    settled = set()
+    heap = [(0.0, 0.0, start)]
+
+    heappush, heappop, inf = heapq.heappush, heapq.heappop, math.inf
+    while heap:
+        estimate, cost, index = heappop(heap)
+        if index in settled:
+            continue
+        settled.add(index)
+        if index == goal:
+            break
+        for k in range(8):
+            weight = weight_views[k][index]
+            if weight == inf:
+                continue
+            neighbour = index + steps[k]
+            new_cost = cost + weight
+            if new_cost < accumulated.get(neighbour, inf) and new_cost <= limit:
+                bound = bounds.get(neighbour)
+                if bound is None:
+                    bound = 0.0
+                    # differences of two infinite costs are NaN, which say nothing and fail every comparison
+                    for forward, forward_goal, backward, backward_goal in bounds_from:
+                        value = forward_goal - forward[neighbour]
+                        if value > bound:
+                            bound = value
+                        value = backward[neighbour] - backward_goal
+                        if value > bound:
+                            bound = value
+                    bounds[neighbour] = bound
+                if bound == inf:
+                    continue
+                accumulated[neighbour] = new_cost
+                backlink[neighbour] = back_codes[k]
+                heappush(heap, (new_cost + bound, new_cost, neighbour))
+
+    if goal not in settled:
+        return None, math.inf, len(settled)
+    path = [goal]
+    index = goal
+    while backlink[index] != BACKLINK_SOURCE:
+        index += steps[backlink[index] - 1]
+        path.append(index)
+    return np.array(path, dtype='int64'), float(np.float32(accumulated[goal])), len(settled)
+
+
+# Function that follows the backlink grid from many destination cells back to the source in one batched pass, moving
+# every unfinished path one cell per step. cells is a list of (row, column) tuples. Returns a list with one array of
+# flat cell indices per destination, ordered from the destination to the source (None where the destination cannot
+# be reached), and an array with the accumulated cost at each destination. Costs are rounded to float32, the precision
+# lcp_grids saves grids at, so that a path traced from a new search and from saved grids reports the same cost.
+def trace_paths(accumulated, backlink, cells):
+    rows, cols = np.shape(backlink)
+    links = np.asarray(backlink).ravel()
+    steps = np.zeros(256, dtype='int64')
+    for k in range(8):
+        steps[k + 1] = ROW_OFFSETS[k] * cols + COL_OFFSETS[k]
+
+    current = np.array([row * cols + col for row, col in cells], dtype='int64')
+    costs = np.asarray(accumulated).ravel()[current].astype('float32').astype('float64')
+    reachable = links[current] != BACKLINK_NODATA
+    walker_ids = [np.flatnonzero(reachable)]
+    positions = [current[reachable]]
+    active = walker_ids[0][links[positions[0]] != BACKLINK_SOURCE]
+
+    # a valid backlink grid leads every reachable cell to a source in fewer moves than there are cells
+    for _ in range(rows * cols):
+        if active.size == 0:
+            break
+        current[active] += steps[links[current[active]]]
+        walker_ids.append(active)
+        positions.append(current[active])
+        active = active[links[current[active]] != BACKLINK_SOURCE]
+    else:
+        raise ValueError('Backlink grid contains a loop and cannot be traced back to a source.')
+
+    walker_ids = np.concatenate(walker_ids)
+    positions = np.concatenate(positions)
+    order = np.argsort(walker_ids, kind='stable')
+    counts = np.bincount(walker_ids, minlength=len(current))
+    split = np.split(positions[order], np.cumsum(counts)[:-1])
+    paths = [path if reachable[i] else None for i, path in enumerate(split)]
+    return paths, costs
+
+
+# Function that finds which source every cell of a backlink grid leads back to, for grids from a search started at
+# several sources at once. sources is the list of (row, column) tuples the search was started from. Returns an int32
+# grid holding the index in sources of the source each cell is allocated to, the one with the least cost path to it,
+# and -1 for cells that were not reached. Instead of tracing every cell, each cell repeatedly jumps to the cell its
+# current target leads to, doubling the distance covered each round, so the number of rounds only grows with the
+# logarithm of the longest path.
+def allocate(backlink, sources):
+    rows, cols = np.shape(backlink)
+    links = np.asarray(backlink).ravel()
+    index_type = 'int32' if rows * cols < 2 ** 31 else 'int64'
+    steps = np.zeros(256, dtype=index_type)
+    for k in range(8):
+        steps[k + 1] = ROW_OFFSETS[k] * cols + COL_OFFSETS[k]
+    reached = links != BACKLINK_NODATA
+    parent = np.arange(rows * cols, dtype=index_type)
+    parent[reached] += steps[links[reached]]
+    # 64 rounds cover paths longer than any grid has cells, so a grid that hasn't settled by then has a loop
+    for _ in range(64):
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            break
+        parent = jumped
+    else:
+        raise ValueError('Backlink grid contains a loop and cannot be traced back to a source.')
+    owner = np.full(rows * cols, -1, dtype='int32')
+    # where two sources share a cell, the cell goes to the first of them
+    for n, (row, col) in reversed(list(enumerate(sources))):
+        owner[row * cols + col] = n
+    allocation = np.full(rows * cols, -1, dtype='int32')
+    allocation[reached] = owner[parent[reached]]
+    return allocation.reshape(rows, cols)
+
+
+# Function that follows backlinks, a flat memoryview of a backlink grid, from the cell with flat index index back to the
+# source, with steps the change in flat index for each backlink value. Returns the list of flat cell indices passed.
+def _trace_cell(links, steps, index, cells):
+    path = [index]
+    link = links[index]
+    while link != BACKLINK_SOURCE:
+        index += steps[link]
+        path.append(index)
+        link = links[index]
+        if len(path) > cells:
+            raise ValueError('Backlink grid contains a loop and cannot be traced back to a source.')
+    return path
+
+
+# Function that finds up to count diverse least cost paths between two locations that are all within stretch (a
+# fraction, such as 0.1 for 10%) of the least cost. forward and forward_backlink are the grids of a search from the
+# source, and backward and backward_backlink those of a search from the destination over reverse_edge_costs, which hold
+# the cost from every cell to the destination. The least cost of a path through a cell is forward + backward, which is
+# the least cost corridor between the two locations. Paths are picked through the cells of the corridor in order of
+# their cost, the first being the least cost path itself. A path is only kept if it never visits a cell twice and no
+# more than max_overlap of its cells lie on paths kept before it, and cells on a path that was already traced are not
+# tried again. Returns a list of (path, cost) tuples in order of cost, with each path as an array of flat cell indices
+# from the destination to the source, as from trace_paths. As there, both grids are taken at float32 precision, and
+# the cost of each path is rounded to float32, so that the least cost path costs the same as from trace_paths.
+def alternative_paths(forward, forward_backlink, backward, backward_backlink, count, stretch=0.1, max_overlap=0.5):
+    rows, cols = np.shape(forward_backlink)
+    total = np.asarray(forward, dtype='float32').ravel().astype('float64')
+    total += np.asarray(backward, dtype='float32').ravel()
+    best = total.min()
+    if not math.isfinite(best):
+        return []
+    candidates = np.flatnonzero(total <= best * (1.0 + stretch))
+    candidates = candidates[np.argsort(total[candidates], kind='stable')]
+    # single paths are traced in a plain loop over memoryviews, which is much faster than trace_paths for one path
+    forward_links = memoryview(np.ascontiguousarray(forward_backlink, dtype='uint8').ravel())
+    backward_links = memoryview(np.ascontiguousarray(backward_backlink, dtype='uint8').ravel())
+    steps = [0] + [ROW_OFFSETS[k] * cols + COL_OFFSETS[k] for k in range(8)]
+    traced = np.zeros(rows * cols, dtype='bool')
+    kept = np.zeros(rows * cols, dtype='bool')
+    paths = []
+    for index in candidates.tolist():
+        if traced[index]:
+            continue
+        to_source = _trace_cell(forward_links, steps, index, rows * cols)
+        to_destination = _trace_cell(backward_links, steps, index, rows * cols)
+        path = np.array(to_destination[::-1] + to_source[1:], dtype='int64')
+        traced[path] = True
+        if np.unique(path).size != path.size or np.count_nonzero(kept[path]) > max_overlap * path.size:
+            continue
+        kept[path] = True
+        paths.append((path, float(np.float32(total[index]))))
+        if len(paths) >= count:
+            break
+    return paths
+
+
+# Function that turns a traced path of flat cell indices into a compact list of (x, y) vertices at cell centres, keeping
+# only the two ends of the path and the cells where it changes direction.
+def path_vertices(path, xmin, ymax, cellsize, cols):
+    path = np.asarray(path)
+    if path.size > 2:
+        turns = np.flatnonzero(np.diff(path, 2) != 0) + 1
+        path = path[np.concatenate(([0], turns, [path.size - 1]))]
+    rows, columns = np.divmod(path, cols)
+    x = xmin + (columns + 0.5) * cellsize
+    y = ymax - (rows + 0.5) * cellsize
+    return list(zip(x.tolist(), y.tolist()))
+
+
+# Function that measures the length of traced paths in map units, as the sum of the steps between the centres of
+# successive cells: cellsize for orthogonal steps and cellsize * sqrt(2) for diagonal ones. If dem is given, the
+# length is measured over the surface instead, adding the rise of every step. All paths are measured together in one
+# vectorized pass. paths is a list of arrays of flat cell indices as returned by trace_paths; None entries get NaN.
+def path_lengths(paths, cellsize, cols, dem=None):
+    lengths = np.full(len(paths), np.nan)
+    measured = [n for n, path in enumerate(paths) if path is not None]
+    if not measured:
+        return lengths
+    cells = np.concatenate([np.asarray(paths[n], dtype='int64') for n in measured])
+    sizes = np.array([len(paths[n]) for n in measured])
+    rows, columns = np.divmod(cells, cols)
+    diagonal = (np.diff(rows) != 0) & (np.diff(columns) != 0)
+    steps = np.where(diagonal, cellsize * math.sqrt(2.0), float(cellsize))
+    if dem is not None:
+        rise = np.diff(np.asarray(dem).ravel()[cells])
+        steps = np.sqrt(steps * steps + rise * rise)
+    # steps that join the last cell of one path to the first cell of the next are not part of either path
+    ends = np.cumsum(sizes)[:-1] - 1
+    steps[ends] = 0.0
+    totals = np.add.reduceat(np.concatenate((steps, [0.0])), np.concatenate(([0], np.cumsum(sizes)[:-1])))
+    lengths[measured] = totals
+    return lengths
@@ -0,0 +1,54 @@
+"""python module that stores the pathdistance and backlink grids of the numpy backend in a compact form. Accumulated
+    cost is kept as float32 rather than float64, and since backlink values (0 through 8, and BACKLINK_NODATA) fit in
+    four bits, backlinks are packed two cells to a byte. A pair of grids then takes 4.5 bytes per cell instead of 9,
+    and both can be compressed with zlib on top of that, which works well on backlink grids with their long runs of
+    equal directions. Each pair of grids is saved as a single .npz file."""
+
+import numpy as np
+
+import lcp_engine
+
+# Memory needed by one search per cell of the DEM: the float64 accumulated cost, the backlink and settled flags held
+# while searching, and the compact copy of the grids made when they are saved.
+SEARCH_BYTES_PER_CELL = 8 + 1 + 1 + 4.5
+
+
+# Function that packs a backlink grid into an array of bytes holding two cells each, the first cell in the low four
+# bits. A grid with an odd number of cells is padded with BACKLINK_NODATA.
+def pack_backlink(backlink):
+    links = np.asarray(backlink, dtype='uint8').ravel()
+    if links.size % 2:
+        links = np.append(links, np.uint8(lcp_engine.BACKLINK_NODATA))
+    return links[0::2] | (links[1::2] << 4)
+
+
+# Function that unpacks an array of bytes from pack_backlink into a backlink grid of the given (rows, columns) shape.
+def unpack_backlink(packed, shape):
+    packed = np.asarray(packed, dtype='uint8')
+    links = np.empty(packed.size * 2, dtype='uint8')
+    links[0::2] = packed & 15
+    links[1::2] = packed >> 4
+    return links[:shape[0] * shape[1]].reshape(shape)
+
+
+# Function that saves a pair of pathdistance and backlink grids to path, a .npz file, compressed if compress is True.
+def save_grids(path, accumulated, backlink, compress=False):
+    save = np.savez_compressed if compress else np.savez
+    # a file object keeps numpy from adding a second .npz to names that already end in one
+    with open(path, 'wb') as grid_file:
+        save(grid_file, shape=np.array(np.shape(accumulated), dtype='int64'),
+             accumulated=np.asarray(accumulated, dtype='float32'), backlink=pack_backlink(backlink))
+
+
+# Function that reads a pair of grids saved by save_grids. Returns the accumulated cost as a float32 grid, with infinity
+# for cells that were not reached, and the unpacked backlink grid.
+def load_grids(path):
+    with np.load(path) as grids:
+        shape = tuple(int(size) for size in grids['shape'])
+        return grids['accumulated'].reshape(shape), unpack_backlink(grids['backlink'], shape)
+
+
+# Function that returns how many searches on a DEM of the given shape fit in memory_limit bytes at the same time, and
+# at least one.
+def searches_in_memory(shape, memory_limit):
+    return max(1, int(memory_limit // (SEARCH_BYTES_PER_CELL * shape[0] * shape[1])))
@@ -0,0 +1,70 @@
+"""python module with a progress journal for long least cost path analyses. Every finished pair of locations is appended
+    to the journal as one line of JSON and flushed to disk straight away, so that when a run is interrupted the next
+    run can read back which pairs are already done, rebuild the master table from the journal, and carry on with the
+    remaining pairs only. The first line of the journal records the settings of the run that created it; a journal
+    written with other settings is set aside instead of being resumed."""
+
+import json
+import os
+import time
+
+
+class Journal(object):
+    # path is the journal file, created if it doesn't exist. settings is a dictionary of strings and numbers describing
+    # the run, such as the paths of the DEM, cost table and feature classes. sync = False skips the fsync after each
+    # pair, which is faster but can lose the last pairs if the computer itself crashes.
+    def __init__(self, path, settings, sync=True):
+        self.path = path
+        self.sync = sync
+        self.records = []
+        self.completed = set()
+        settings = json.loads(json.dumps(settings))
+        if os.path.exists(path):
+            header = self._read()
+            if header != {'settings': settings}:
+                os.replace(path, path + '.' + str(int(time.time())) + '.old')
+                self.records = []
+                self.completed = set()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._file.tell() == 0:
+            self._append({'settings': settings})
+
+    # Reads the journal, skipping a last line cut short by a crash and trimming it from the file so that new lines are
+    # appended after the last complete one. Returns the header.
+    def _read(self):
+        with open(self.path, 'rb') as journal_file:
+            content = journal_file.read()
+        complete = content[:content.rfind(b'\n') + 1]
+        if len(complete) != len(content):
+            with open(self.path, 'r+b') as journal_file:
+                journal_file.truncate(len(complete))
+        lines = complete.decode('utf-8').splitlines()
+        if not lines:
+            return None
+        for line in lines[1:]:
+            record = json.loads(line)
+            self.records.append(record)
+            self.completed.add(tuple(record['key']))
+        return json.loads(lines[0])
+
+    def _append(self, entry):
+        # a single write of a whole line, so a crash leaves at most one partial line at the end of the file
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    # Returns True if the pair with the given key, a tuple of strings, has already been recorded.
+    def is_done(self, key):
+        return tuple(key) in self.completed
+
+    # Records a finished pair. row holds the values written to the master table for it, or None if the pair has no row
+    # in the table, such as a destination that cannot be reached.
+    def record(self, key, row):
+        entry = {'key': list(key), 'row': None if row is None else list(row)}
+        self._append(entry)
+        self.records.append(entry)
+        self.completed.add(tuple(key))
+
+    def close(self):
+        self._file.close()
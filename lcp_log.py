@@ -0,0 +1,133 @@
+"""python module that keeps the event log of a least cost path analysis. Every event is a structured record with a
+    level, a message, and fields that identify it, such as the source and destination of the pair, the stage of the
+    analysis, the ArcGIS error code (for example 010151 or 010240) and the time taken. Logging an event only puts its
+    record on a queue; a background thread writes the records to the log file in batches, as plain text or as one line
+    of JSON each, so the analysis never waits on the disk. Events below the chosen level are left out of the log, and
+    progress messages are printed at most once every progress_interval seconds, so that runs with thousands of pairs
+    are not slowed down by printing a line for each of them."""
+
+import json
+import queue
+import re
+import threading
+import time
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+SEPARATOR = '-' * 90
+FIELD_ORDER = ('source', 'destination', 'stage', 'code', 'seconds')
+
+
+# Function that returns the six digit code of an ArcGIS error message, such as '010151' for
+# 'ERROR 010151: No features found in ...', or None if the message has no code.
+def error_code(error):
+    match = re.search(r'ERROR (\d{6})', str(error))
+    return match.group(1) if match else None
+
+
+class EventLog(object):
+    # path is the log file, appended to if it exists. Events below level ('debug', 'info', 'warning' or 'error') are
+    # not written to it. json_lines = True writes each event as a line of JSON instead of text. Progress messages are
+    # printed at most once every progress_interval seconds.
+    def __init__(self, path, level='info', json_lines=False, progress_interval=1.0):
+        self.path = path
+        self.level = LEVELS[level.lower()]
+        self.json_lines = json_lines
+        self.progress_interval = progress_interval
+        self._last_progress = None
+        self._skipped = 0
+        self._queue = queue.Queue()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._write, name='lcp_log', daemon=True)
+        self._thread.start()
+
+    # Writes lines of text to the log as they are, such as the header at the start of a run.
+    def header(self, *lines):
+        if not self.json_lines:
+            self._queue.put('\n'.join(lines) + '\n')
+
+    # Logs an event at level with message and fields. An exception or ArcGIS message passed as error is logged as
+    # text, with its error code as code unless code is given. The message, and the error if there is one, are printed
+    # as well unless echo is False.
+    def event(self, level, message, echo=True, **fields):
+        error = fields.pop('error', None)
+        if error is not None:
+            fields['error'] = str(error).strip()
+            if fields.get('code') is None:
+                fields['code'] = error_code(error)
+        if echo:
+            print(message)
+            if error is not None:
+                print(fields['error'])
+        if LEVELS[level] >= self.level:
+            record = {'time': time.time(), 'level': level, 'message': message}
+            record.update((name, value) for name, value in fields.items() if value is not None)
+            self._queue.put(record)
+
+    def debug(self, message, **fields):
+        self.event('debug', message, **fields)
+
+    def info(self, message, **fields):
+        self.event('info', message, **fields)
+
+    def warning(self, message, **fields):
+        self.event('warning', message, **fields)
+
+    def error(self, message, **fields):
+        self.event('error', message, **fields)
+
+    # Logs a progress message at the debug level, and prints it if progress_interval seconds have passed since the
+    # last one printed, with the number of progress messages left unprinted in between.
+    def progress(self, message, **fields):
+        now = time.perf_counter()
+        if self._last_progress is None or now - self._last_progress >= self.progress_interval:
+            print(message + (' (' + str(self._skipped) + ' more since the last update)' if self._skipped else ''))
+            self._last_progress = now
+            self._skipped = 0
+        else:
+            self._skipped += 1
+        self.event('debug', message, echo=False, **fields)
+
+    # Formats a record as a line of text, followed by its error message and a separator if it has one.
+    @staticmethod
+    def _format(record):
+        names = [name for name in FIELD_ORDER if name in record] + sorted(
+            name for name in record if name not in FIELD_ORDER + ('time', 'level', 'message', 'error'))
+        text = time.asctime(time.localtime(record['time'])) + ': ' + record['level'].upper() + ' ' + record['message']
+        if names:
+            text += ' [' + ', '.join(name + '=' + (format(record[name], '.3f') if name == 'seconds' else
+                                                   str(record[name])) for name in names) + ']'
+        text += '\n'
+        if 'error' in record:
+            text += record['error'] + '\n' + SEPARATOR + '\n'
+        return text
+
+    # Runs in the background thread, writing everything on the queue to the log file until close() is called. Records
+    # that arrive together are written together, and the file is flushed once the queue is empty.
+    def _write(self):
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in items:
+                if item is None:
+                    continue
+                if isinstance(item, str):
+                    self._file.write(item)
+                elif self.json_lines:
+                    self._file.write(json.dumps(item, default=str) + '\n')
+                else:
+                    self._file.write(self._format(item))
+            self._file.flush()
+            if None in items:
+                return
+
+    # Writes every event still on the queue, stops the background thread and closes the log file.
+    def close(self):
+        if self._file is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._file.close()
+            self._file = None
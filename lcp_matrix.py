@@ -0,0 +1,84 @@
+"""python module that stores the results of a least cost path analysis as a dense cost matrix and distance matrix, with
+    a row for every source location and a column for every destination. Both matrices are float32 .npy files opened as
+    memory maps, so each pair is written in place as soon as it is finished, and other programs can open the finished
+    matrices with numpy.load(path, mmap_mode='r') without copying them into memory. Unlike master.xls, they have no
+    limit on the number of pairs. Pairs not yet calculated hold NaN, and pairs with no least cost path hold infinity
+    in the cost matrix. The names of the rows and columns are kept in a .json label index beside the matrices."""
+
+import json
+import math
+
+import numpy as np
+
+
+# Function that returns the paths of the cost matrix, distance matrix, and label index saved under prefix.
+def matrix_files(prefix):
+    return prefix + '_cost.npy', prefix + '_distance.npy', prefix + '_labels.json'
+
+
+class CostMatrix(object):
+    # prefix is the path the files are saved under, such as OUTPUT\matrix for OUTPUT\matrix_cost.npy,
+    # OUTPUT\matrix_distance.npy and OUTPUT\matrix_labels.json. rows and columns are the labels of the source and
+    # destination locations, which need to be unique, and row_names and column_names optional longer names to save
+    # with them. If resume is True and matrices with the same labels are already saved under prefix, they are opened
+    # and added to, so that a resumed run keeps the pairs finished before; otherwise new matrices filled with NaN
+    # replace them.
+    def __init__(self, prefix, rows, columns, row_names=None, column_names=None, resume=False):
+        self.cost_file, self.distance_file, self.labels_file = matrix_files(prefix)
+        self.rows = dict((str(label), n) for n, label in enumerate(rows))
+        self.columns = dict((str(label), n) for n, label in enumerate(columns))
+        if len(self.rows) != len(rows) or len(self.columns) != len(columns):
+            raise ValueError('Row and column labels of a cost matrix need to be unique.')
+        labels = {'rows': [str(label) for label in rows], 'columns': [str(label) for label in columns],
+                  'row_names': None if row_names is None else [str(name) for name in row_names],
+                  'column_names': None if column_names is None else [str(name) for name in column_names]}
+        shape = (len(rows), len(columns))
+        self.cost = self.distance = None
+        if resume:
+            try:
+                with open(self.labels_file) as labels_file:
+                    saved_labels = json.load(labels_file)
+                if saved_labels == labels:
+                    cost = np.load(self.cost_file, mmap_mode='r+')
+                    distance = np.load(self.distance_file, mmap_mode='r+')
+                    if cost.shape == shape and distance.shape == shape:
+                        self.cost, self.distance = cost, distance
+            except (OSError, ValueError):
+                pass
+        if self.cost is None:
+            self.cost = np.lib.format.open_memmap(self.cost_file, mode='w+', dtype='float32', shape=shape)
+            self.distance = np.lib.format.open_memmap(self.distance_file, mode='w+', dtype='float32', shape=shape)
+            self.cost[:] = np.nan
+            self.distance[:] = np.nan
+            with open(self.labels_file, 'w') as labels_file:
+                json.dump(labels, labels_file)
+
+    # Stores the cost and distance of the pair from the source labelled row to the destination labelled column. A cost
+    # of None means the pair has no least cost path, and a distance that is None or 'NA' was not measured.
+    def set(self, row, column, cost, distance):
+        i, j = self.rows[str(row)], self.columns[str(column)]
+        self.cost[i, j] = math.inf if cost is None else float(cost)
+        try:
+            self.distance[i, j] = float(distance)
+        except (TypeError, ValueError):
+            self.distance[i, j] = math.nan
+
+    # Writes the pairs stored so far to disk, where other programs opening the matrices can see them.
+    def flush(self):
+        self.cost.flush()
+        self.distance.flush()
+
+    def close(self):
+        if self.cost is not None:
+            self.flush()
+        self.cost = self.distance = None
+
+
+# Function that opens the matrices saved under prefix without reading them into memory. Returns the cost matrix and
+# distance matrix as read only memory mapped arrays, and the label index as a dictionary with the row and column labels
+# (and names, if they were saved) as lists.
+def open_matrix(prefix):
+    cost_file, distance_file, labels_file = matrix_files(prefix)
+    with open(labels_file) as labels:
+        labels = json.load(labels)
+    return np.load(cost_file, mmap_mode='r'), np.load(distance_file, mmap_mode='r'), labels
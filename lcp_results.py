@@ -0,0 +1,127 @@
+"""python module that collects the results of a least cost path analysis (source name, destination name, path cost, and
+    linear distance of every pair) in memory, with cost and distance held in typed arrays, and writes them to disk in
+    large batches instead of one row at a time. Results can be written as .csv, which needs nothing beyond python
+    itself, or as .parquet or .feather, which need the pyarrow package. Distances that could not be measured are held
+    as NaN and written as empty values."""
+
+import csv
+import math
+import os
+from array import array
+
+FIELDS = ['Source', 'Dest', 'PathCost', 'Distance']
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.feather': 'feather', '.arrow': 'feather'}
+
+
+# Function that imports pyarrow for the parquet and feather formats, which are optional.
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Writing results as .parquet or .feather needs the pyarrow package. Install it, or save the '
+                          'results as .csv instead.')
+    return pyarrow
+
+
+# Function that converts a distance into a float, with NaN for distances that were not calculated ('NA' or None).
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class ResultBuffer(object):
+    # path is the output file; its extension sets the format unless file_format ('csv', 'parquet' or 'feather') is
+    # given. Results are written out every batch_size rows, and any existing file at path is replaced.
+    def __init__(self, path, file_format=None, batch_size=10000):
+        self.path = path
+        self.file_format = file_format or FORMATS.get(os.path.splitext(path)[1].lower())
+        if self.file_format not in FORMATS.values():
+            raise ValueError('Unknown results format for ' + str(path) + '. Use .csv, .parquet or .feather.')
+        self.batch_size = batch_size
+        self.count = 0
+        self._sources = []
+        self._destinations = []
+        self._costs = array('d')
+        self._distances = array('d')
+        self._file = None
+        self._writer = None
+        if self.file_format == 'csv':
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(FIELDS)
+        else:
+            pyarrow = _pyarrow()
+            self._schema = pyarrow.schema([(FIELDS[0], pyarrow.string()), (FIELDS[1], pyarrow.string()),
+                                           (FIELDS[2], pyarrow.float64()), (FIELDS[3], pyarrow.float64())])
+            if self.file_format == 'parquet':
+                self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+            else:
+                self._writer = pyarrow.ipc.new_file(path, self._schema)
+
+    def add(self, source, destination, cost, distance):
+        self._sources.append(str(source))
+        self._destinations.append(str(destination))
+        self._costs.append(float(cost))
+        self._distances.append(_as_float(distance))
+        self.count += 1
+        if len(self._costs) >= self.batch_size:
+            self.flush()
+
+    # Writes all buffered results to the output file.
+    def flush(self):
+        if not self._costs:
+            return
+        if self.file_format == 'csv':
+            distances = ['' if math.isnan(distance) else distance for distance in self._distances]
+            self._writer.writerows(zip(self._sources, self._destinations, self._costs, distances))
+            self._file.flush()
+        else:
+            pyarrow = _pyarrow()
+            batch = pyarrow.record_batch([pyarrow.array(self._sources, pyarrow.string()),
+                                          pyarrow.array(self._destinations, pyarrow.string()),
+                                          pyarrow.array(self._costs, pyarrow.float64()),
+                                          pyarrow.array(self._distances, pyarrow.float64())], schema=self._schema)
+            if self.file_format == 'parquet':
+                self._writer.write_table(pyarrow.Table.from_batches([batch]))
+            else:
+                self._writer.write_batch(batch)
+        self._sources = []
+        self._destinations = []
+        self._costs = array('d')
+        self._distances = array('d')
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+        elif self._writer is not None:
+            self._writer.close()
+        self._file = None
+        self._writer = None
+
+
+# Function that reads back a results file written by ResultBuffer. Yields (source, destination, cost, distance) rows,
+# with None for distances that were not calculated.
+def read_results(path, file_format=None):
+    file_format = file_format or FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format == 'csv':
+        with open(path, newline='', encoding='utf-8') as results_file:
+            reader = csv.reader(results_file)
+            next(reader)
+            for source, destination, cost, distance in reader:
+                yield source, destination, float(cost), float(distance) if distance else None
+        return
+    pyarrow = _pyarrow()
+    if file_format == 'parquet':
+        table = pyarrow.parquet.read_table(path)
+    else:
+        with pyarrow.ipc.open_file(path) as reader:
+            table = reader.read_all()
+    for batch in table.to_batches():
+        columns = [column.to_pylist() for column in batch.columns]
+        for source, destination, cost, distance in zip(*columns):
+            yield source, destination, cost, None if distance is None or math.isnan(distance) else distance
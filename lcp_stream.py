@@ -0,0 +1,539 @@
+"""python module with a library entry point to the numpy backend of the least cost path analysis, which needs neither
+    ArcGIS nor the module level settings of the main script. least_cost_paths() is a generator that yields one
+    PathResult (source, destination, cost, distance) at a time, as soon as the search it comes from has finished, so
+    that callers can stream results into their own tables or analyses, or stop early without waiting for the whole
+    run. Stopping the generator also stops the searches still running in worker processes.
+
+    The module also runs from the command line, taking the settings of the main script as arguments, with the DEM as an
+    ESRI ASCII grid (.asc) or a .npy array and the locations as .csv files with a name and x and y coordinates:
+        python lcp_stream.py dem.asc sites.csv sites.csv --cost-function tobler --workers 4 -o results.csv
+    Results are written to the output file in the format of its extension (.csv, .parquet or .feather), or printed as
+    .csv rows as they are calculated if no output file is given."""
+
+import argparse
+import collections
+import csv
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+import lcp_batch
+import lcp_cache
+import lcp_costs
+import lcp_engine
+import lcp_results
+import lcp_timing
+
+PathResult = collections.namedtuple('PathResult', ['source', 'destination', 'cost', 'distance'])
+TracedPath = collections.namedtuple('TracedPath', ['source', 'destination', 'cost', 'distance', 'path'])
+CorridorResult = collections.namedtuple('CorridorResult', ['source', 'destination', 'cost', 'corridor', 'paths'])
+AlternativePath = collections.namedtuple('AlternativePath', ['rank', 'cost', 'distance', 'overlap', 'path'])
+
+
+# Function that reads an ESRI ASCII grid. Returns the DEM as a float64 array, with NaN for NoData cells, and the x
+# coordinate of its left edge, the y coordinate of its top edge, and its cell size.
+def read_ascii_grid(path):
+    header = {}
+    with open(path) as grid_file:
+        while True:
+            position = grid_file.tell()
+            line = grid_file.readline()
+            parts = line.split()
+            if len(parts) != 2 or not parts[0][0].isalpha():
+                grid_file.seek(position)
+                break
+            header[parts[0].lower()] = float(parts[1])
+        dem = np.loadtxt(grid_file, dtype='float64', ndmin=2)
+    rows, cols, cellsize = int(header['nrows']), int(header['ncols']), header['cellsize']
+    if dem.shape != (rows, cols):
+        raise ValueError('ASCII grid ' + str(path) + ' holds ' + str(dem.shape) + ' cells instead of the '
+                         + str((rows, cols)) + ' given in its header.')
+    if 'nodata_value' in header:
+        dem[dem == header['nodata_value']] = np.nan
+    # xllcenter and yllcenter give the centre of the lower left cell instead of its corner
+    xmin = header['xllcorner'] if 'xllcorner' in header else header['xllcenter'] - cellsize / 2.0
+    ymin = header['yllcorner'] if 'yllcorner' in header else header['yllcenter'] - cellsize / 2.0
+    return dem, xmin, ymin + rows * cellsize, cellsize
+
+
+# Function that reads the locations in a .csv file with a header row. Returns a list of (name, name, (row, column))
+# tuples in the form lcp_batch expects, with the cell of the DEM holding each location. Stops if two locations share a
+# name, as read_locations does in the main script.
+def read_sites(path, xmin, ymax, cellsize, shape, name_field='name', x_field='x', y_field='y'):
+    names, x, y = [], [], []
+    with open(path, newline='') as csv_file:
+        for row in csv.DictReader(csv_file):
+            names.append(row[name_field].strip())
+            x.append(float(row[x_field]))
+            y.append(float(row[y_field]))
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError('Names ' + ', '.join(duplicates) + ' in ' + str(path) + ' are used by more than one location. '
+                         'Names need to be unique.')
+    rows, cols = lcp_engine.xy_to_cells(x, y, xmin, ymax, cellsize, shape)
+    return list(zip(names, names, zip(rows.tolist(), cols.tolist())))
+
+
+# Function that reads a .csv file listing pairs of locations, such as pairs_file in the main script, with the file name
+# of a location in sources and of a location in destinations on each row. A first row that doesn't hold file names is
+# taken as a header. Returns the pairs as a list of (source, destination) location tuples, in the order of the file.
+# Stops if a file name is not found among the locations.
+def read_pairs(path, sources, destinations):
+    sources = dict((location[1], location) for location in sources)
+    destinations = dict((location[1], location) for location in destinations)
+    pairs = []
+    missing = []
+    with open(path, newline='') as csv_file:
+        for row_number, row in enumerate(csv.reader(csv_file)):
+            if not row:
+                continue
+            source, destination = (value.strip() for value in row[:2])
+            if source in sources and destination in destinations:
+                pairs.append((sources[source], destinations[destination]))
+            elif row_number > 0:
+                missing.append(source + ', ' + destination)
+    if missing:
+        raise ValueError('Pairs in ' + str(path) + ' with names not found among the locations: ' + '; '.join(missing))
+    return pairs
+
+
+# Function that yields a PathResult for every path in a batch traced from one source, measuring the lengths of all of
+# them at once. Destinations that cannot be reached get an infinite cost and a NaN distance. With with_paths = True,
+# it yields a TracedPath instead, holding the source and destination location tuples and the traced path.
+def _path_results(source, destinations, paths, costs, cellsize, dem, surface_distance, timer, with_paths=False):
+    with timer.stage('length', source=source[1]) as record:
+        distances = lcp_engine.path_lengths(paths, cellsize, np.shape(dem)[1], dem if surface_distance else None)
+        record['cells'] = sum(len(path) for path in paths if path is not None)
+    for destination, path, cost, distance in zip(destinations, paths, costs, distances):
+        cost = math.inf if path is None else float(cost)
+        if with_paths:
+            yield TracedPath(source, destination, cost, float(distance), path)
+        else:
+            yield PathResult(source[0], destination[0], cost, float(distance))
+
+
+# Generator that calculates the least cost paths from every location in sources to every location in destinations,
+# and yields a PathResult for each pair as soon as it is known, in the order of sources and then destinations.
+# Locations are (name, file name, (row, column)) tuples, as returned by read_sites. cost_model is a vertical factor
+# table from lcp_engine.read_vf_table or a cost function from lcp_costs.cost_function. Cost is infinite, and distance
+# NaN, for pairs with no least cost path.
+# If pairs, a list of (source, destination) location tuples, is given instead of sources and destinations, only those
+# pairs are calculated, with a landmark guided search for each (see lcp_batch.run_pairs), and results come in the order
+# of pairs.
+# workers, max_cost, stop_at_destinations, symmetric, reverse and landmarks work as in lcp_batch. With round_trip =
+# True, the paths from every destination back to every source follow once the paths from the sources are done.
+# surface_distance = True measures distances over the surface of the DEM. cache_folder keeps grids, edge costs and
+# landmarks between runs, as grid_cache_folder does in the main script, with cache_limit_gb its size limit. weights are
+# optional edge costs from lcp_engine.edge_costs, which are calculated if not given, and fingerprint their key from
+# GridCache.edge_cost_key, if it has already been calculated. timer is an optional lcp_timing.StageTimer that records
+# the time taken by every stage.
+# on_error is called with the source, the destination (None if the error affects every destination of the source)
+# and the exception when a search fails, and the generator carries on with the next one; if on_error is None, the
+# exception is raised instead.
+# completed is an optional set of (source file name, destination file name) tuples of pairs finished by an earlier run,
+# in the direction of travel, which are skipped. on_grids, if given, is called with each source and the .npz file its
+# pathdistance and backlink grids are saved in with lcp_grids, before the results of that source are yielded; the
+# file is left for on_grids to remove. With with_paths = True, a TracedPath is yielded in place of each PathResult.
+def least_cost_paths(dem, cellsize, cost_model, sources=None, destinations=None, pairs=None, workers=1, max_cost=None,
+                     stop_at_destinations=False, symmetric=False, reverse=False, round_trip=False, landmarks=8,
+                     surface_distance=False, cache_folder=None, cache_limit_gb=None, compress_grids=False,
+                     memory_limit_gb=None, scratch=None, timer=None, on_error=None, weights=None, fingerprint=None,
+                     completed=None, on_grids=None, with_paths=False):
+    timer = timer if timer is not None else lcp_timing.StageTimer()
+    completed = completed or set()
+    cache = None
+    if cache_folder is not None:
+        cache_limit = None if cache_limit_gb is None else int(cache_limit_gb * 1024 ** 3)
+        cache = lcp_cache.GridCache(cache_folder, cache_limit, compress_grids)
+        if fingerprint is None:
+            fingerprint = cache.edge_cost_key(dem, cellsize, cost_model)
+    if weights is None:
+        with timer.stage('edge_costs', cells=int(np.size(dem))):
+            if cache is not None:
+                weights = cache.edge_costs(dem, cellsize, cost_model, fingerprint)
+            else:
+                weights = lcp_engine.edge_costs(dem, cellsize, cost_model)
+
+    def failed(source, destination, error):
+        if on_error is None:
+            raise RuntimeError('Least cost path from ' + str(source[0])
+                               + ('' if destination is None else ' to ' + str(destination[0])) + ' failed: '
+                               + str(error)) from error
+        on_error(source[0], None if destination is None else destination[0], error)
+
+    if pairs is not None:
+        directions = [pairs] + ([[(destination, source) for source, destination in pairs]] if round_trip else [])
+        for direction in directions:
+            done = set(n for n, (source, destination) in enumerate(direction)
+                       if (source[1], destination[1]) in completed)
+            for pair_index, path, cost, error, stages in lcp_batch.run_pairs(dem, weights, direction, workers=workers,
+                                                                             scratch=scratch, landmarks=landmarks,
+                                                                             max_cost=max_cost, completed=done,
+                                                                             cache=cache, fingerprint=fingerprint):
+                source, destination = direction[pair_index]
+                for stage in stages:
+                    timer.add(source=source[1], destination=destination[1], **stage)
+                if error is not None:
+                    failed(source, destination, error)
+                    continue
+                for result in _path_results(source, [destination], [path], [cost], cellsize, dem, surface_distance,
+                                            timer, with_paths):
+                    yield result
+        return
+
+    directions = [(sources, destinations)] + ([(destinations, sources)] if round_trip else [])
+    for from_locations, to_locations in directions:
+        use_symmetric = symmetric and from_locations == to_locations and lcp_engine.is_symmetric(cost_model)
+        use_reverse = reverse and len(to_locations) < len(from_locations)
+        done = set((i, j) for i, source in enumerate(from_locations) for j, destination in enumerate(to_locations)
+                   if (source[1], destination[1]) in completed)
+        results = lcp_batch.run_sources(dem, weights, from_locations, to_locations, workers=workers, scratch=scratch,
+                                        stop_at_destinations=stop_at_destinations, max_cost=max_cost,
+                                        save_grids=on_grids is not None, symmetric=use_symmetric, reverse=use_reverse,
+                                        cache=cache, fingerprint=fingerprint, completed=done,
+                                        compress_grids=compress_grids,
+                                        memory_limit=None if memory_limit_gb is None else memory_limit_gb * 1024 ** 3)
+        for source_index, destination_indices, paths, costs, grid_file, error, stages in results:
+            source = from_locations[source_index]
+            for stage in stages:
+                timer.add(source=source[1], **stage)
+            if error is not None:
+                failed(source, None, error)
+            if grid_file is not None:
+                on_grids(source, grid_file)
+            if paths is None:
+                continue
+            for result in _path_results(source, [to_locations[j] for j in destination_indices], paths, costs,
+                                        cellsize, dem, surface_distance, timer, with_paths):
+                yield result
+        # pairs of locations calculated once for both directions need no second pass
+        if use_symmetric:
+            break
+
+
+# Function that finds the location in sources with the least cost path to each location in destinations, with a
+# single search started from every source at once instead of a search from each of them. Arguments are as for
+# least_cost_paths; weights are optional edge costs from lcp_engine.edge_costs, which are calculated if not given.
+# Returns the allocation grid from lcp_engine.allocate, with the index in sources of the nearest source to every cell,
+# the accumulated cost grid of the search, with the cost from the nearest source to every cell, and a list with a
+# PathResult for each destination in order, holding its nearest source. Destinations that no source can reach get
+# None as their source, an infinite cost and a NaN distance. With with_paths = True, the list holds a TracedPath for
+# each destination instead, with the location tuple of its nearest source, since names need not be unique.
+def nearest_sources(dem, cellsize, cost_model, sources, destinations, weights=None, max_cost=None,
+                    surface_distance=False, timer=None, with_paths=False):
+    timer = timer if timer is not None else lcp_timing.StageTimer()
+    if weights is None:
+        with timer.stage('edge_costs', cells=int(np.size(dem))):
+            weights = lcp_engine.edge_costs(dem, cellsize, cost_model)
+    with timer.stage('path_distance') as record:
+        accumulated, backlink = lcp_engine.path_distance(dem, None, None, [location[2] for location in sources],
+                                                         weights=weights, max_cost=max_cost)
+        record['cells'] = int(np.count_nonzero(backlink != lcp_engine.BACKLINK_NODATA))
+    with timer.stage('allocation', cells=int(np.size(dem))):
+        allocation = lcp_engine.allocate(backlink, [location[2] for location in sources])
+    with timer.stage('trace_paths') as record:
+        paths, costs = lcp_engine.trace_paths(accumulated, backlink, [location[2] for location in destinations])
+        record['cells'] = sum(len(path) for path in paths if path is not None)
+    with timer.stage('length') as record:
+        distances = lcp_engine.path_lengths(paths, cellsize, np.shape(dem)[1], dem if surface_distance else None)
+    results = []
+    for destination, path, cost, distance in zip(destinations, paths, costs, distances):
+        nearest = None if path is None else sources[allocation[destination[2]]]
+        cost = math.inf if path is None else float(cost)
+        if with_paths:
+            results.append(TracedPath(nearest, destination, cost, float(distance), path))
+        else:
+            results.append(PathResult(None if nearest is None else nearest[0], destination[0], cost, float(distance)))
+    return allocation, accumulated, results
+
+
+# Function that returns the pathdistance and backlink grids of a search from cell over weights, from cache, a
+# lcp_cache.GridCache, if they are in it, and otherwise calculates them and adds them to it. fingerprint identifies the
+# weights in the cache. weights can be a function returning the weights, which is then only called if the grids have
+# to be calculated. The search grids are memory mapped in scratch, as with lcp_engine.path_distance.
+def _cached_grids(cache, fingerprint, dem, weights, cell, max_cost, timer, scratch=None):
+    key = cache.key(fingerprint, cell, max_cost)
+    with timer.stage('grid_cache_load'):
+        grids = cache.load(key)
+    if grids is not None:
+        return grids
+    with timer.stage('path_distance') as record:
+        grids = lcp_engine.path_distance(dem, None, None, [cell], weights=weights() if callable(weights) else weights,
+                                         max_cost=max_cost, scratch=scratch)
+        record['cells'] = int(np.count_nonzero(grids[1] != lcp_engine.BACKLINK_NODATA))
+    with timer.stage('grid_cache_save'):
+        cache.save(key, *grids)
+    return grids
+
+
+# Generator that calculates the least cost corridor and up to count diverse near optimal paths for every pair of
+# locations in pairs, a list of (source, destination) location tuples, and yields a CorridorResult for each pair in
+# order. The corridor is a float32 grid holding, for every cell whose best path between the pair costs no more than
+# stretch (a fraction, such as 0.1 for 10%) above the least cost, the cost of that path, and infinity elsewhere. paths
+# is a list of AlternativePath tuples in order of cost, from lcp_engine.alternative_paths, with the first being the
+# least cost path, and overlap the fraction of each path's cells that lie on the paths before it.
+# The corridor needs a search from the source and a search from the destination over reversed edge costs. Both are
+# kept in the grid cache in cache_folder, so that grids of sources calculated by earlier runs are reused, and each
+# location is only searched once however many pairs it is in; without a cache_folder, a temporary one is used for the
+# run. If moves cost the same in both directions, the grids of a search from the destination are used in place of the
+# reversed search. Other arguments are as for least_cost_paths and nearest_sources.
+def corridors(dem, cellsize, cost_model, pairs, stretch=0.1, count=3, max_overlap=0.5, weights=None, max_cost=None,
+              surface_distance=False, cache_folder=None, cache_limit_gb=None, compress_grids=False, scratch=None,
+              timer=None):
+    timer = timer if timer is not None else lcp_timing.StageTimer()
+    created_scratch = scratch is None
+    if created_scratch:
+        scratch = tempfile.mkdtemp(prefix='lcp_')
+    reversed_weights = []
+    try:
+        if cache_folder is None:
+            cache = lcp_cache.GridCache(os.path.join(scratch, 'corridor_cache'), compress=compress_grids)
+        else:
+            cache_limit = None if cache_limit_gb is None else int(cache_limit_gb * 1024 ** 3)
+            cache = lcp_cache.GridCache(cache_folder, cache_limit, compress_grids)
+        fingerprint = cache.edge_cost_key(dem, cellsize, cost_model)
+        if weights is None:
+            with timer.stage('edge_costs', cells=int(np.size(dem))):
+                weights = cache.edge_costs(dem, cellsize, cost_model, fingerprint)
+        symmetric = lcp_engine.is_symmetric(cost_model)
+
+        # the reversed edge costs are written straight to disk, and only the first time a reversed search is needed
+        def reverse_weights():
+            if not reversed_weights:
+                with timer.stage('edge_costs', cells=int(np.size(dem))):
+                    out = np.lib.format.open_memmap(os.path.join(scratch, 'weights_reversed.npy'), mode='w+',
+                                                    dtype=weights.dtype, shape=np.shape(weights))
+                    reversed_weights.append(lcp_engine.reverse_edge_costs(weights, np.shape(dem), out=out))
+            return reversed_weights[0]
+
+        for source, destination in pairs:
+            forward = _cached_grids(cache, fingerprint, dem, weights, source[2], max_cost, timer, scratch)
+            if symmetric:
+                backward = _cached_grids(cache, fingerprint, dem, weights, destination[2], max_cost, timer, scratch)
+            else:
+                backward = _cached_grids(cache, fingerprint + '|reversed', dem, reverse_weights, destination[2],
+                                         max_cost, timer, scratch)
+            with timer.stage('corridor', source=source[1], destination=destination[1]) as record:
+                total = np.asarray(forward[0], dtype='float32') + np.asarray(backward[0], dtype='float32')
+                paths = lcp_engine.alternative_paths(forward[0], forward[1], backward[0], backward[1], count, stretch,
+                                                     max_overlap)
+                if paths:
+                    # the costs of cells along a path differ by the float32 rounding of the two grids, which must not
+                    # leave cells of the least cost path itself out of a corridor with no stretch
+                    limit = paths[0][1] * (1.0 + stretch) * (1.0 + 4 * np.finfo('float32').eps)
+                    total[total > limit] = np.inf
+                else:
+                    total[:] = np.inf
+                record['cells'] = int(np.count_nonzero(np.isfinite(total)))
+            distances = lcp_engine.path_lengths([path for path, cost in paths], cellsize, np.shape(dem)[1],
+                                                dem if surface_distance else None)
+            alternatives = []
+            on_paths = np.zeros(np.size(dem), dtype='bool')
+            for rank, ((path, cost), distance) in enumerate(zip(paths, distances), 1):
+                overlap = float(np.count_nonzero(on_paths[path])) / path.size
+                on_paths[path] = True
+                alternatives.append(AlternativePath(rank, cost, float(distance), overlap, path))
+            yield CorridorResult(source[0], destination[0], paths[0][1] if paths else math.inf, total, alternatives)
+    finally:
+        # the memory map has to be closed before its file can be removed on Windows
+        del reversed_weights[:]
+        weights = cache = None
+        if created_scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+        else:
+            shutil.rmtree(os.path.join(scratch, 'corridor_cache'), ignore_errors=True)
+            if os.path.exists(os.path.join(scratch, 'weights_reversed.npy')):
+                os.remove(os.path.join(scratch, 'weights_reversed.npy'))
+
+
+# Function that repairs the grids of searches from cells, a list of (row, column) tuples, kept in the grid cache in
+# cache_folder for previous_dem, so that they hold the grids of the same searches over dem, an edited copy of it with
+# the same shape, such as one with a new road or reservoir. changed is a boolean grid marking every cell whose
+# elevation was edited; if it is None, the cells where the two DEMs differ are used. Each search is only repeated
+# around the edited cells, with lcp_engine.repair_path_distance, and the repaired grids are added to the cache for dem,
+# where least_cost_paths, nearest_sources and corridors with the same cache_folder and max_cost find them. Cells whose
+# grids are already cached for dem, or were never cached for previous_dem, are left alone. Other arguments are as for
+# least_cost_paths. Returns the number of grids repaired.
+def repair_cached_grids(previous_dem, dem, cellsize, cost_model, cells, cache_folder, cache_limit_gb=None,
+                        compress_grids=False, max_cost=None, changed=None, timer=None):
+    timer = timer if timer is not None else lcp_timing.StageTimer()
+    if np.shape(previous_dem) != np.shape(dem):
+        raise ValueError('The edited DEM needs the same number of rows and columns as the previous DEM.')
+    cache_limit = None if cache_limit_gb is None else int(cache_limit_gb * 1024 ** 3)
+    cache = lcp_cache.GridCache(cache_folder, cache_limit, compress_grids)
+    # the grids of previous_dem are only looked up by key, so its edge costs are never needed
+    previous_fingerprint = cache.edge_cost_key(previous_dem, cellsize, cost_model)
+    fingerprint = cache.edge_cost_key(dem, cellsize, cost_model)
+    with timer.stage('edge_costs', cells=int(np.size(dem))):
+        weights = cache.edge_costs(dem, cellsize, cost_model, fingerprint)
+    if changed is None:
+        previous_dem, dem = np.asarray(previous_dem), np.asarray(dem)
+        changed = (previous_dem != dem) & ~(np.isnan(previous_dem) & np.isnan(dem))
+    repaired = 0
+    for cell in cells:
+        key = cache.key(fingerprint, cell, max_cost)
+        if cache.contains(key):
+            continue
+        with timer.stage('grid_cache_load'):
+            grids = cache.load(cache.key(previous_fingerprint, cell, max_cost))
+        if grids is None:
+            continue
+        with timer.stage('repair', source=str(tuple(cell))) as record:
+            accumulated, backlink, record['cells'] = lcp_engine.repair_path_distance(weights, grids[0], grids[1],
+                                                                                     changed, max_cost)
+        with timer.stage('grid_cache_save'):
+            cache.save(key, accumulated, backlink)
+        repaired += 1
+    return repaired
+
+
+# Function that parses a key=value argument of --cost-parameter into a (name, float value) pair.
+def _cost_parameter(text):
+    name, _, value = text.partition('=')
+    try:
+        return name.strip(), float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Cost parameters need to be given as name=number, not ' + text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Calculate least cost paths between two sets of locations over a DEM '
+                                                 'with the numpy backend, without ArcGIS.')
+    parser.add_argument('dem', help='DEM as an ESRI ASCII grid (.asc) or a .npy array')
+    parser.add_argument('fc_one', help='.csv file with the source locations')
+    parser.add_argument('fc_two', help='.csv file with the destination locations')
+    parser.add_argument('-o', '--output', help='results file (.csv, .parquet or .feather), or none to print .csv rows')
+    parser.add_argument('--cellsize', type=float, help='cell size of a .npy DEM')
+    parser.add_argument('--xmin', type=float, default=0.0, help='x coordinate of the left edge of a .npy DEM')
+    parser.add_argument('--ymax', type=float, help='y coordinate of the top edge of a .npy DEM (default: rows * '
+                                                   'cellsize)')
+    parser.add_argument('--name-field', default='name', help='column of the location files holding their names')
+    parser.add_argument('--x-field', default='x', help='column of the location files holding their x coordinates')
+    parser.add_argument('--y-field', default='y', help='column of the location files holding their y coordinates')
+    cost = parser.add_mutually_exclusive_group(required=True)
+    cost.add_argument('--cost-table', help='slope/cost table, as handed to VfTable')
+    cost.add_argument('--cost-function', choices=sorted(lcp_costs.COST_FUNCTIONS), help='built in cost function')
+    parser.add_argument('--cost-parameter', type=_cost_parameter, action='append', default=[], metavar='NAME=VALUE',
+                        help='parameter of the cost function, such as load=20; can be given more than once')
+    parser.add_argument('--pairs-file', help='.csv file listing the pairs of locations to calculate by name')
+    parser.add_argument('--round-trip', action='store_true', help='also calculate paths from fc_two to fc_one')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--max-cost', type=float, help='maximum accumulated cost searched from each source')
+    parser.add_argument('--stop-at-destinations', action='store_true',
+                        help='stop each search once every destination is reached')
+    parser.add_argument('--symmetric', action='store_true',
+                        help='calculate each pair once if fc_one and fc_two are the same file and costs are symmetric')
+    parser.add_argument('--reverse-search', action='store_true',
+                        help='search from the destinations when there are fewer of them than sources')
+    parser.add_argument('--surface-distance', action='store_true', help='measure distances over the DEM surface')
+    parser.add_argument('--nearest', action='store_true',
+                        help='only find the nearest location in fc_one to each location in fc_two, with one search')
+    parser.add_argument('--allocation-grid', help='.npy file to save the allocation grid of --nearest to')
+    parser.add_argument('--landmarks', type=int, default=8, help='number of landmarks for --pairs-file searches')
+    parser.add_argument('--grid-cache-folder', help='folder keeping grids, edge costs and landmarks between runs')
+    parser.add_argument('--grid-cache-limit-gb', type=float, default=50, help='size limit of the grid cache')
+    parser.add_argument('--compress-grids', action='store_true', help='compress the grids kept in the cache')
+    parser.add_argument('--previous-dem', help='DEM that the grids in the grid cache were calculated for, of which '
+                                               'dem is an edited copy; the grids are repaired instead of searching '
+                                               'again')
+    parser.add_argument('--memory-limit-gb', type=float, help='most memory searches running at once may use')
+    parser.add_argument('--limit', type=int, help='stop after this many results')
+    parser.add_argument('--trace', help='JSON lines file to write the time taken by each stage to')
+    arguments = parser.parse_args(argv)
+
+    if arguments.previous_dem is not None and arguments.grid_cache_folder is None:
+        parser.error('--previous-dem needs --grid-cache-folder')
+    if arguments.dem.lower().endswith('.npy'):
+        if arguments.cellsize is None:
+            parser.error('a .npy DEM needs --cellsize')
+        dem = np.load(arguments.dem, mmap_mode='r')
+        cellsize, xmin = arguments.cellsize, arguments.xmin
+        ymax = arguments.ymax if arguments.ymax is not None else dem.shape[0] * cellsize
+    else:
+        dem, xmin, ymax, cellsize = read_ascii_grid(arguments.dem)
+    if arguments.previous_dem is None:
+        previous_dem = None
+    elif arguments.previous_dem.lower().endswith('.npy'):
+        previous_dem = np.load(arguments.previous_dem, mmap_mode='r')
+    else:
+        previous_dem = read_ascii_grid(arguments.previous_dem)[0]
+    if arguments.cost_function is not None:
+        cost_model = lcp_costs.cost_function(arguments.cost_function, **dict(arguments.cost_parameter))
+    else:
+        cost_model = lcp_engine.read_vf_table(arguments.cost_table)
+    fields = (arguments.name_field, arguments.x_field, arguments.y_field)
+    sources = read_sites(arguments.fc_one, xmin, ymax, cellsize, dem.shape, *fields)
+    destinations = read_sites(arguments.fc_two, xmin, ymax, cellsize, dem.shape, *fields)
+    pairs = read_pairs(arguments.pairs_file, sources, destinations) if arguments.pairs_file is not None else None
+
+    def report_error(source, destination, error):
+        sys.stderr.write('Failed to calculate the least cost path from ' + str(source)
+                         + ('' if destination is None else ' to ' + str(destination)) + ': ' + str(error) + '\n')
+
+    timer = lcp_timing.StageTimer(arguments.trace)
+    if previous_dem is not None:
+        cells = [location[2] for location in sources]
+        if arguments.round_trip:
+            cells += [location[2] for location in destinations]
+        repaired = repair_cached_grids(previous_dem, dem, cellsize, cost_model, cells, arguments.grid_cache_folder,
+                                       arguments.grid_cache_limit_gb, arguments.compress_grids, arguments.max_cost,
+                                       timer=timer)
+        sys.stderr.write('Repaired the cached grids of ' + str(repaired) + ' locations for the edited DEM.\n')
+    if arguments.nearest:
+        allocation, accumulated, nearest = nearest_sources(dem, cellsize, cost_model, sources, destinations,
+                                                           max_cost=arguments.max_cost,
+                                                           surface_distance=arguments.surface_distance, timer=timer)
+        if arguments.allocation_grid is not None:
+            np.save(arguments.allocation_grid, allocation)
+    if arguments.output is not None:
+        result_buffer = lcp_results.ResultBuffer(arguments.output)
+        write = result_buffer.add
+    else:
+        result_buffer = None
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(lcp_results.FIELDS)
+
+        def write(source, destination, cost, distance):
+            writer.writerow((source, destination, cost, '' if math.isnan(distance) else distance))
+            sys.stdout.flush()
+
+    if arguments.nearest:
+        results = iter(nearest)
+    else:
+        symmetric = arguments.symmetric and os.path.abspath(arguments.fc_one) == os.path.abspath(arguments.fc_two)
+        results = least_cost_paths(dem, cellsize, cost_model, sources, destinations, pairs, workers=arguments.workers,
+                                   max_cost=arguments.max_cost, stop_at_destinations=arguments.stop_at_destinations,
+                                   symmetric=symmetric, reverse=arguments.reverse_search,
+                                   round_trip=arguments.round_trip, landmarks=arguments.landmarks,
+                                   surface_distance=arguments.surface_distance,
+                                   cache_folder=arguments.grid_cache_folder,
+                                   cache_limit_gb=arguments.grid_cache_limit_gb,
+                                   compress_grids=arguments.compress_grids, memory_limit_gb=arguments.memory_limit_gb,
+                                   timer=timer, on_error=report_error)
+    unreachable = 0
+    try:
+        for count, result in enumerate(results, 1):
+            # as in the main script, pairs with no least cost path are left out of the results
+            if math.isinf(result.cost):
+                unreachable += 1
+            else:
+                write(*result)
+            if arguments.limit is not None and count >= arguments.limit:
+                break
+    finally:
+        if not arguments.nearest:
+            results.close()
+        if result_buffer is not None:
+            result_buffer.close()
+        timer.close()
+    if unreachable:
+        sys.stderr.write(str(unreachable) + ' pairs have no least cost path and were left out of the results.\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
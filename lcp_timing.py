@@ -0,0 +1,72 @@
+"""python module that times the stages of a least cost path analysis, such as calculating pathdistance rasters,
+    tracing cost paths, converting them to polylines, measuring their length, and writing results. Each timed stage can
+    be written to a trace file as one line of JSON when it ends, with its duration, the number of cells it expanded and
+    the number of bytes it wrote where those are known, and any other fields that identify it, such as the source and
+    destination. The trace file is buffered, so that runs with thousands of short stages do not wait on the disk after
+    each of them, and is flushed when the timer is closed. Totals are kept for every stage, for a summary at the end of
+    the run."""
+
+import contextlib
+import json
+import time
+
+
+class StageTimer(object):
+    # path is the JSON lines trace file, appended to if it exists, or None to only keep totals. keep_records = True
+    # also keeps every record in the records list, for timers whose records are handed on to another timer.
+    # buffer_size is the number of bytes of the trace held in memory before they are written out.
+    def __init__(self, path=None, keep_records=False, buffer_size=1024 * 1024):
+        self.path = path
+        self.keep_records = keep_records
+        self.records = []
+        self.totals = {}
+        self._file = open(path, 'a', encoding='utf-8', buffering=buffer_size) if path is not None else None
+
+    # Context manager that times the stage called name. Yields a dictionary holding fields, to which cells and
+    # bytes_written, or any other fields, can be added inside the with block. The stage is recorded even if the block
+    # raises an exception.
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        record = dict(fields)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.add(name, time.perf_counter() - start, **record)
+
+    # Records a stage timed elsewhere, such as in a worker process. cells and bytes_written are None, or left out, for
+    # stages that ended before they were known, which add nothing to the totals.
+    def add(self, stage, seconds, cells=0, bytes_written=0, **fields):
+        totals = self.totals.setdefault(stage, [0, 0.0, 0, 0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] += cells or 0
+        totals[3] += bytes_written or 0
+        if self._file is None and not self.keep_records:
+            return
+        record = {'stage': stage, 'seconds': seconds, 'cells': cells, 'bytes_written': bytes_written}
+        record.update(fields)
+        if self.keep_records:
+            self.records.append(record)
+        if self._file is not None:
+            record['time'] = time.time()
+            self._file.write(json.dumps(record, default=str) + '\n')
+
+    # Returns a list of lines summarising every stage, with the stages taking the most time in total first.
+    def summary(self):
+        lines = ['{:<20}{:>10}{:>14}{:>12}{:>16}{:>16}'.format('Stage', 'Count', 'Total (s)', 'Mean (s)', 'Cells',
+                                                                'Bytes written')]
+        for stage, (count, seconds, cells, bytes_written) in sorted(self.totals.items(), key=lambda item: -item[1][1]):
+            lines.append('{:<20}{:>10}{:>14.3f}{:>12.4f}{:>16}{:>16}'.format(stage, count, seconds, seconds / count,
+                                                                            cells, bytes_written))
+        return lines
+
+    # Writes the totals of every stage to the trace file, and closes it, which flushes the stages still held in its
+    # buffer.
+    def close(self):
+        if self._file is not None:
+            totals = dict((stage, {'count': count, 'seconds': seconds, 'cells': cells, 'bytes_written': written})
+                          for stage, (count, seconds, cells, written) in self.totals.items())
+            self._file.write(json.dumps({'summary': totals}) + '\n')
+            self._file.close()
+            self._file = None
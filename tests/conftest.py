@@ -0,0 +1,7 @@
+"""python module that puts the folder holding the lcp modules on the import path, so that the tests can import them
+    from any working directory."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,111 @@
+"""python module that tests lcp_batch: results from a pool of worker processes match a serial run, in the same order,
+    and stopping a run early leaves nothing behind in its scratch folder."""
+
+import os
+
+import numpy as np
+import pytest
+
+import lcp_batch
+import lcp_cache
+import lcp_engine
+
+TABLE = (np.array([-60.0, 0.0, 60.0]), np.array([6.0, 1.0, 6.0]))
+
+
+# Function that returns a small rough DEM and its edge costs.
+def small_dem():
+    dem = np.random.default_rng(3).uniform(0.0, 30.0, (24, 30))
+    return dem, lcp_engine.edge_costs(dem, 10.0, TABLE)
+
+
+# Function that returns a location at each of cells, in the (name, file name, (row, column)) form of lcp_batch.
+def sites(prefix, cells):
+    return [(prefix + str(n), prefix + str(n), cell) for n, cell in enumerate(cells)]
+
+
+def test_workers_match_a_serial_run(tmp_path):
+    dem, weights = small_dem()
+    sources = sites('s', [(0, 0), (12, 15), (23, 29)])
+    destinations = sites('d', [(5, 5), (20, 3), (1, 28)])
+    serial = list(lcp_batch.run_sources(dem, weights, sources, destinations, workers=1))
+    parallel = list(lcp_batch.run_sources(dem, weights, sources, destinations, workers=2,
+                                          scratch=str(tmp_path / 'scratch')))
+    assert [result[0] for result in parallel] == [0, 1, 2]
+    for one, other in zip(serial, parallel):
+        assert one[1] == other[1]
+        np.testing.assert_array_equal(one[3], other[3])
+        for path, other_path in zip(one[2], other[2]):
+            np.testing.assert_array_equal(path, other_path)
+    pairs = [(sources[0], destinations[1]), (sources[2], destinations[0])]
+    costs = [result[2] for result in lcp_batch.run_pairs(dem, weights, pairs, workers=2, landmarks=2)]
+    assert costs == pytest.approx([serial[0][3][1], serial[2][3][0]], rel=1e-9)
+
+
+@pytest.mark.parametrize('use_cache', [False, True])
+def test_reverse_search_matches_forward_search(tmp_path, use_cache):
+    dem, weights = small_dem()
+    sources = sites('s', [(0, 0), (12, 15), (23, 29), (3, 20)])
+    destinations = sites('d', [(5, 5), (20, 3)])
+    forward = list(lcp_batch.run_sources(dem, weights, sources, destinations))
+    cache = lcp_cache.GridCache(str(tmp_path / 'cache')) if use_cache else None
+    # with a cache, the second run loads the grids of the reversed searches the first one saved
+    for _ in range(2 if use_cache else 1):
+        reverse = list(lcp_batch.run_sources(dem, weights, sources, destinations, reverse=True, cache=cache,
+                                             fingerprint='fp' if use_cache else None))
+        assert [result[0] for result in reverse] == [0, 1, 2, 3]
+        for one, other in zip(forward, reverse):
+            assert list(one[1]) == list(other[1])
+            assert other[3] == pytest.approx(one[3], rel=1e-6)
+            for path, other_path in zip(one[2], other[2]):
+                # paths run from the destination back to the source either way
+                assert (path[0], path[-1]) == (other_path[0], other_path[-1])
+
+
+def test_symmetric_run_matches_a_full_run():
+    dem, weights = small_dem()
+    assert lcp_engine.is_symmetric(TABLE)
+    locations = sites('s', [(0, 0), (12, 15), (23, 29), (3, 20)])
+    full = list(lcp_batch.run_sources(dem, weights, locations, locations))
+    symmetric = list(lcp_batch.run_sources(dem, weights, locations, locations, symmetric=True))
+    assert [result[0] for result in symmetric] == [0, 1, 2, 3]
+    for i, (one, other) in enumerate(zip(full, symmetric)):
+        # pairs of a location with itself are skipped, and every other pair is handed back with both of its locations
+        others = [j for j in range(len(locations)) if j != i]
+        assert list(other[1]) == others
+        assert list(other[3]) == pytest.approx([one[3][j] for j in others], rel=1e-6)
+        for j, path in zip(others, other[2]):
+            assert (path[0], path[-1]) == (one[2][j][0], one[2][j][-1])
+
+
+# Grid cache whose landmarks are always gone by the time they are read back, as when another run sharing the folder
+# evicts them.
+class ForgetfulCache(lcp_cache.GridCache):
+    def load_landmarks(self, fingerprint, count):
+        return None
+
+
+def test_pairs_with_a_cache_too_small_for_the_landmarks(tmp_path):
+    dem, weights = small_dem()
+    sources = sites('s', [(0, 0), (12, 15)])
+    destinations = sites('d', [(23, 29), (5, 20)])
+    serial = list(lcp_batch.run_sources(dem, weights, sources, destinations))
+    pairs = [(source, destination) for source in sources for destination in destinations]
+    for workers, cache_type in ((1, lcp_cache.GridCache), (2, lcp_cache.GridCache), (1, ForgetfulCache)):
+        cache = cache_type(str(tmp_path / 'cache'), max_bytes=1)
+        results = list(lcp_batch.run_pairs(dem, weights, pairs, workers=workers, landmarks=2, cache=cache,
+                                           fingerprint='fp', scratch=str(tmp_path / 'scratch')))
+        assert [result[3] for result in results] == [None] * len(pairs)
+        assert [result[2] for result in results] == pytest.approx([cost for result in serial for cost in result[3]],
+                                                                  rel=1e-9)
+
+
+def test_stopping_early_cleans_up(tmp_path):
+    dem, weights = small_dem()
+    scratch = tmp_path / 'scratch'
+    scratch.mkdir()
+    locations = sites('s', [(row, 3) for row in range(0, 24, 2)])
+    results = lcp_batch.run_sources(dem, weights, locations, locations, workers=2, scratch=str(scratch))
+    assert next(results)[0] == 0
+    results.close()
+    assert [name for name in os.listdir(str(scratch)) if not name.startswith('worker_')] == []
@@ -0,0 +1,89 @@
+"""python module that tests lcp_cache: grids and edge costs are stored under keys made from the DEM, cell size and cost
+    model, and found again by later runs."""
+
+import os
+
+import numpy as np
+
+import lcp_cache
+import lcp_costs
+import lcp_engine
+import lcp_stream
+import lcp_timing
+
+COST_MODEL = lcp_costs.cost_function('tobler')
+
+
+# Function that returns a small rough DEM and two sets of locations on it.
+def small_study():
+    dem = np.random.default_rng(5).uniform(0.0, 40.0, (30, 30))
+    sources = [('s0', 's0', (2, 3)), ('s1', 's1', (25, 20))]
+    destinations = [('d0', 'd0', (10, 28)), ('d1', 'd1', (29, 0))]
+    return dem, sources, destinations
+
+
+def test_edge_cost_key_depends_on_dem_cellsize_and_cost_model():
+    dem, sources, destinations = small_study()
+    key = lcp_cache.GridCache.edge_cost_key(dem, 10.0, COST_MODEL)
+    assert key == lcp_cache.GridCache.edge_cost_key(dem.copy(), 10.0, COST_MODEL)
+    assert key == lcp_cache.GridCache.edge_cost_key(np.asarray(dem, dtype='float64'), 10, COST_MODEL)
+    edited = dem.copy()
+    edited[4, 4] += 1.0
+    assert key != lcp_cache.GridCache.edge_cost_key(edited, 10.0, COST_MODEL)
+    assert key != lcp_cache.GridCache.edge_cost_key(dem, 20.0, COST_MODEL)
+    assert key != lcp_cache.GridCache.edge_cost_key(dem, 10.0, lcp_costs.cost_function('tobler', load=20))
+    # the key does not depend on how many rows are hashed at a time, and a float32 DEM hashes as its float64 values
+    assert key == lcp_cache.GridCache.edge_cost_key(dem, 10.0, COST_MODEL, block_rows=7)
+    single = dem.astype('float32')
+    assert (lcp_cache.GridCache.edge_cost_key(single, 10.0, COST_MODEL, block_rows=4)
+            == lcp_cache.GridCache.edge_cost_key(single.astype('float64'), 10.0, COST_MODEL))
+
+
+def test_entries_just_written_outlive_a_limit_smaller_than_them(tmp_path):
+    dem, sources, destinations = small_study()
+    cache = lcp_cache.GridCache(str(tmp_path / 'cache'), max_bytes=1)
+    key = cache.edge_cost_key(dem, 10.0, COST_MODEL)
+    weights = cache.edge_costs(dem, 10.0, COST_MODEL, key)
+    np.testing.assert_array_equal(weights, lcp_engine.edge_costs(dem, 10.0, COST_MODEL))
+    grids = lcp_engine.path_distance(dem, None, None, [(2, 3)], weights=weights)
+    cache.save(cache.key(key, (2, 3)), *grids)
+    assert cache.contains(cache.key(key, (2, 3)))
+    # the weights were the least recently used entry, so saving the grids made room by deleting them
+    assert not os.path.exists(os.path.join(cache.folder, key + '.weights.npy'))
+    cache.save_landmarks(key, np.zeros((2, dem.size)), np.ones((2, dem.size)))
+    assert cache.load_landmarks(key, 2).shape == (2, 2, dem.size)
+    assert not cache.contains(cache.key(key, (2, 3)))
+
+
+def test_repaired_grids_match_a_new_search(tmp_path):
+    dem, sources, destinations = small_study()
+    folder = str(tmp_path / 'cache')
+    list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations, cache_folder=folder))
+    edited = dem.copy()
+    edited[8:12, 10:14] = 0.0
+    cells = [source[2] for source in sources]
+    assert lcp_stream.repair_cached_grids(dem, edited, 10.0, COST_MODEL, cells, folder) == len(sources)
+    # grids already repaired are left alone
+    assert lcp_stream.repair_cached_grids(dem, edited, 10.0, COST_MODEL, cells, folder) == 0
+    timer = lcp_timing.StageTimer()
+    repaired = list(lcp_stream.least_cost_paths(edited, 10.0, COST_MODEL, sources, destinations, cache_folder=folder,
+                                                timer=timer))
+    assert 'path_distance' not in timer.totals
+    searched = list(lcp_stream.least_cost_paths(edited, 10.0, COST_MODEL, sources, destinations))
+    assert [result[:2] for result in repaired] == [result[:2] for result in searched]
+    np.testing.assert_allclose([result.cost for result in repaired], [result.cost for result in searched], rtol=1e-6)
+    np.testing.assert_allclose([result.distance for result in repaired], [result.distance for result in searched])
+
+
+def test_later_runs_load_grids_instead_of_searching(tmp_path):
+    dem, sources, destinations = small_study()
+    folder = str(tmp_path / 'cache')
+    first = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations, cache_folder=folder))
+    timer = lcp_timing.StageTimer()
+    second = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations, cache_folder=folder,
+                                              timer=timer))
+    assert 'path_distance' not in timer.totals
+    assert timer.totals['grid_cache_load'][0] == len(sources)
+    assert [result[:2] for result in second] == [result[:2] for result in first]
+    # costs are reported at the precision grids are saved at, so loaded grids give exactly the costs of a new search
+    assert [result.cost for result in second] == [result.cost for result in first]
@@ -0,0 +1,69 @@
+"""python module that tests lcp_costs: each built in cost function gives the cost worked out by hand from its published
+    formula for moves on flat ground, uphill and downhill, and samples into a slope/cost table without warnings."""
+
+import math
+import warnings
+
+import numpy as np
+import pytest
+
+import lcp_costs
+import lcp_engine
+
+# moves 1000 m long over flat ground, up a rise of 100 m, and down a fall of 100 m
+HORIZONTAL = np.array([1000.0, 1000.0, 1000.0])
+RISE = np.array([0.0, 100.0, -100.0])
+
+
+def test_tobler_by_hand():
+    # 6 * exp(-3.5 * |slope + 0.05|) km/h over 1 km: flat at 6 * exp(-0.175), uphill at 6 * exp(-0.525), and downhill
+    # at 6 * exp(-0.175) again, as the fastest walking is at a slope of -0.05
+    hours = [math.exp(0.175) / 6.0, math.exp(0.525) / 6.0, math.exp(0.175) / 6.0]
+    assert lcp_costs.tobler(HORIZONTAL, RISE).tolist() == pytest.approx(hours)
+    assert lcp_costs.tobler(HORIZONTAL, RISE, off_path=True).tolist() == pytest.approx([h / 0.6 for h in hours])
+    # the fastest slope itself is walked at 6 km/h
+    assert lcp_costs.tobler(np.array([1000.0]), np.array([-50.0]))[0] == pytest.approx(1.0 / 6.0)
+
+
+def test_pandolf_and_santee_by_hand():
+    # 70 kg without a load at 1.25 m/s on a treadmill: standing 1.5 * 70 = 105 W, plus walking
+    # 70 * 1.5 * 1.25 ** 2 = 164.0625 W, plus 70 * 0.35 * 1.25 * grade = 30.625 W per percent of grade
+    walking = 105.0 + 164.0625
+    # downhill at -10%, the Santee correction is -10 * 70 * 1.25 / 3.5 - 70 * (-10 + 6) ** 2 / 70 + 25 - 1.25 ** 2 W,
+    # which is taken off the rate
+    correction = -250.0 - 16.0 + 25.0 - 1.5625
+    rates = [walking, walking + 306.25, walking - 306.25 - correction]
+    seconds = [800.0, math.sqrt(1000.0 ** 2 + 100.0 ** 2) / 1.25, math.sqrt(1000.0 ** 2 + 100.0 ** 2) / 1.25]
+    kilocalories = [rate * time / 4184.0 for rate, time in zip(rates, seconds)]
+    assert lcp_costs.pandolf(HORIZONTAL, RISE).tolist() == pytest.approx(kilocalories)
+
+
+def test_pandolf_never_falls_below_standing():
+    # at 0.5 m/s and a grade of -7%, the corrected rate of 105 + 26.25 - 85.75 - (-70 - 1 + 25 - 0.25) = 91.75 W would
+    # be below the 105 W of standing still
+    assert lcp_costs.pandolf(np.array([1000.0]), np.array([-70.0]), speed=0.5)[0] == pytest.approx(
+        105.0 * math.sqrt(1000.0 ** 2 + 70.0 ** 2) / 0.5 / 4184.0)
+
+
+def test_minetti_by_hand():
+    # 280.5i^5 - 58.7i^4 - 76.8i^3 + 51.9i^2 + 19.6i + 2.5 J/kg/m, at i = 0, 0.1 and -0.1
+    per_metre = [2.5, 0.002805 - 0.00587 - 0.0768 + 0.519 + 1.96 + 2.5,
+                 -0.002805 - 0.00587 + 0.0768 + 0.519 - 1.96 + 2.5]
+    metres = [1000.0, math.sqrt(1000.0 ** 2 + 100.0 ** 2), math.sqrt(1000.0 ** 2 + 100.0 ** 2)]
+    assert lcp_costs.minetti(HORIZONTAL, RISE).tolist() == pytest.approx([c * m for c, m in zip(per_metre, metres)])
+    # gradients steeper than Minetti measured are impassable
+    assert lcp_costs.minetti(np.array([1000.0, 1000.0]), np.array([460.0, -460.0])).tolist() == [math.inf, math.inf]
+
+
+@pytest.mark.parametrize('name', sorted(lcp_costs.COST_FUNCTIONS))
+def test_vf_table_samples_the_cost_per_metre(tmp_path, name):
+    cost_model = lcp_costs.cost_function(name)
+    path = str(tmp_path / 'table.txt')
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        lcp_costs.write_vf_table(cost_model, path, step=0.1)
+    angles, factors = lcp_engine.read_vf_table(path)
+    assert np.all(np.isfinite(factors))
+    # each factor is the cost of a move one metre long over the surface at its angle
+    radians = np.radians(angles)
+    np.testing.assert_allclose(factors, cost_model(np.cos(radians), np.sin(radians)), rtol=1e-12)
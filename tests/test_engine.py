@@ -0,0 +1,305 @@
+"""python module that tests lcp_engine against small reference grids: costs worked out by hand on flat ground, and on
+    rough ground a brute force all pairs search (Floyd-Warshall) over edge costs calculated one move at a time, without
+    the vectorized code under test."""
+
+import math
+
+import numpy as np
+import pytest
+
+import lcp_engine
+
+CELLSIZE = 10.0
+FLAT_TABLE = (np.array([-90.0, 90.0]), np.array([1.0, 1.0]))
+SLOPE_TABLE = (np.array([-60.0, -30.0, 0.0, 30.0, 60.0]), np.array([8.0, 2.0, 1.0, 3.0, 12.0]))
+
+
+# Function that returns a small rough DEM with a wall of NoData cells with a gap in it, which paths have to go around.
+def rough_dem():
+    rng = np.random.default_rng(7)
+    dem = rng.uniform(0.0, 12.0, (7, 8))
+    dem[1:6, 4] = np.nan
+    return dem
+
+
+# Function that calculates the cost of the move from cell (r0, c0) to its neighbour (r1, c1) on its own, as
+# PathDistance does: the surface distance of the move times the vertical factor for its slope angle.
+def move_cost(dem, r0, c0, r1, c1, vf_table):
+    horizontal = CELLSIZE * (math.sqrt(2.0) if r0 != r1 and c0 != c1 else 1.0)
+    rise = dem[r1, c1] - dem[r0, c0]
+    if math.isnan(rise):
+        return math.inf
+    angle = math.degrees(math.atan(rise / horizontal))
+    angles, factors = vf_table
+    if angle < angles[0] or angle > angles[-1]:
+        return math.inf
+    return math.sqrt(horizontal * horizontal + rise * rise) * float(np.interp(angle, angles, factors))
+
+
+# Function that returns the least cost between every pair of cells of dem, from a Floyd-Warshall search over the costs
+# of single moves, as an array of shape (cells, cells).
+def reference_costs(dem, vf_table):
+    rows, cols = dem.shape
+    costs = np.full((rows * cols, rows * cols), np.inf)
+    np.fill_diagonal(costs, 0.0)
+    for r0 in range(rows):
+        for c0 in range(cols):
+            for dr, dc in zip(lcp_engine.ROW_OFFSETS, lcp_engine.COL_OFFSETS):
+                r1, c1 = r0 + dr, c0 + dc
+                if 0 <= r1 < rows and 0 <= c1 < cols:
+                    costs[r0 * cols + c0, r1 * cols + c1] = move_cost(dem, r0, c0, r1, c1, vf_table)
+    for k in range(rows * cols):
+        costs = np.minimum(costs, costs[:, k:k + 1] + costs[k:k + 1, :])
+    return costs
+
+
+def test_read_vf_table(tmp_path):
+    table_file = tmp_path / 'vf.txt'
+    table_file.write_text('# slope, factor\n30, 5\n-30 5\n\n0 1\n')
+    angles, factors = lcp_engine.read_vf_table(str(table_file))
+    assert angles.tolist() == [-30.0, 0.0, 30.0]
+    assert factors.tolist() == [5.0, 1.0, 5.0]
+
+
+def test_map_coordinates_to_cells():
+    # a 3 by 4 DEM of 10 m cells with its upper left corner at (100, 50)
+    x, y = [100.0, 139.9, 115.0, 95.0, 120.0], [50.0, 20.1, 35.0, 40.0, 19.0]
+    inside = lcp_engine.xy_inside(x, y, 100.0, 50.0, CELLSIZE, (3, 4))
+    assert inside.tolist() == [True, True, True, False, False]
+    rows, cols = lcp_engine.xy_to_cells(x[:3], y[:3], 100.0, 50.0, CELLSIZE, (3, 4))
+    assert list(zip(rows.tolist(), cols.tolist())) == [(0, 0), (2, 3), (1, 1)]
+    with pytest.raises(ValueError):
+        lcp_engine.xy_to_cells(x, y, 100.0, 50.0, CELLSIZE, (3, 4))
+
+
+def test_flat_costs_and_backlinks_by_hand():
+    accumulated, backlink = lcp_engine.path_distance(np.zeros((4, 5)), CELLSIZE, FLAT_TABLE, [(0, 0)])
+    # on flat ground with a factor of 1 the cost is the octile distance: diagonal moves first, then straight ones
+    for row in range(4):
+        for col in range(5):
+            diagonal, straight = min(row, col), abs(row - col)
+            assert accumulated[row, col] == pytest.approx(CELLSIZE * (diagonal * math.sqrt(2.0) + straight))
+    assert backlink[0, 0] == lcp_engine.BACKLINK_SOURCE
+    # cells along the top row point west, back to the source; cells on the diagonal point northwest
+    assert backlink[0, 3] == 5
+    assert backlink[2, 2] == 6
+    assert backlink[3, 0] == 7
+
+
+@pytest.mark.parametrize('vf_table', [FLAT_TABLE, SLOPE_TABLE])
+def test_path_distance_matches_reference(vf_table):
+    dem = rough_dem()
+    rows, cols = dem.shape
+    reference = reference_costs(dem, vf_table)
+    for source in [(0, 0), (3, 6), (6, 2)]:
+        accumulated, backlink = lcp_engine.path_distance(dem, CELLSIZE, vf_table, [source])
+        expected = reference[source[0] * cols + source[1]].reshape(rows, cols)
+        assert np.array_equal(np.isinf(accumulated), np.isinf(expected))
+        reached = np.isfinite(expected)
+        np.testing.assert_allclose(accumulated[reached], expected[reached], rtol=1e-6)
+        assert np.all(backlink[~reached] == lcp_engine.BACKLINK_NODATA)
+        assert np.all(backlink[1:6, 4] == lcp_engine.BACKLINK_NODATA)
+
+
+def test_search_in_scratch_files_matches_search_in_memory(tmp_path):
+    dem = rough_dem()
+    weights = lcp_engine.edge_costs(dem, CELLSIZE, SLOPE_TABLE)
+    assert weights.dtype == np.dtype(lcp_engine.WEIGHTS_DTYPE)
+    in_memory = lcp_engine.path_distance(dem, None, None, [(2, 2)], weights=weights, targets=[(5, 6)])
+    on_disk = lcp_engine.path_distance(dem, None, None, [(2, 2)], weights=weights, targets=[(5, 6)],
+                                       scratch=str(tmp_path))
+    assert isinstance(on_disk[0], np.memmap)
+    np.testing.assert_array_equal(on_disk[0], in_memory[0])
+    np.testing.assert_array_equal(on_disk[1], in_memory[1])
+    # the files behind the grids have no names, so nothing is left to clean up
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_backlinks_lead_back_along_least_cost_moves():
+    dem = rough_dem()
+    rows, cols = dem.shape
+    accumulated, backlink = lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, [(3, 1)])
+    for row in range(rows):
+        for col in range(cols):
+            link = backlink[row, col]
+            if link in (lcp_engine.BACKLINK_SOURCE, lcp_engine.BACKLINK_NODATA):
+                continue
+            previous = row + lcp_engine.ROW_OFFSETS[link - 1], col + lcp_engine.COL_OFFSETS[link - 1]
+            step = move_cost(dem, previous[0], previous[1], row, col, SLOPE_TABLE)
+            assert accumulated[row, col] == pytest.approx(accumulated[previous] + step, rel=1e-6)
+
+
+def test_several_sources_take_the_cheapest():
+    dem = rough_dem()
+    cols = dem.shape[1]
+    reference = reference_costs(dem, SLOPE_TABLE)
+    sources = [(0, 0), (6, 7)]
+    accumulated, backlink = lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, sources)
+    expected = np.minimum(*(reference[row * cols + col] for row, col in sources)).reshape(dem.shape)
+    reached = np.isfinite(expected)
+    np.testing.assert_allclose(accumulated[reached], expected[reached], rtol=1e-6)
+    assert all(backlink[cell] == lcp_engine.BACKLINK_SOURCE for cell in sources)
+
+
+def test_early_stop_settles_targets_only_as_far_as_needed():
+    dem = rough_dem()
+    full, _ = lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, [(0, 0)])
+    targets = [(2, 2), (0, 3)]
+    accumulated, backlink = lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, [(0, 0)], targets=targets)
+    for target in targets:
+        assert accumulated[target] == full[target]
+    # every settled cell is final, and every cell costing more than the last target was never settled
+    settled = np.isfinite(accumulated)
+    np.testing.assert_array_equal(accumulated[settled], full[settled])
+    assert not np.any(settled & (full > max(full[target] for target in targets)))
+    assert np.all(backlink[~settled] == lcp_engine.BACKLINK_NODATA)
+
+
+def test_max_cost_leaves_costlier_cells_unreached():
+    dem = rough_dem()
+    full, _ = lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, [(0, 0)])
+    limit = float(np.median(full[np.isfinite(full)]))
+    accumulated, backlink = lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, [(0, 0)], max_cost=limit)
+    inside = full <= limit
+    np.testing.assert_array_equal(accumulated[inside], full[inside])
+    assert np.all(np.isinf(accumulated[~inside]))
+    assert np.all(backlink[~inside] == lcp_engine.BACKLINK_NODATA)
+
+
+@pytest.mark.parametrize('count', [0, 1, 3])
+def test_astar_matches_dijkstra(count):
+    dem = rough_dem()
+    dem[0, 7] = np.nan
+    weights = lcp_engine.edge_costs(dem, CELLSIZE, SLOPE_TABLE)
+    landmarks = None
+    if count:
+        reversed_weights = lcp_engine.reverse_edge_costs(weights, dem.shape)
+        _, forward, backward = lcp_engine.build_landmarks(dem, weights, reversed_weights, count)
+        landmarks = np.stack((forward, backward))
+    for source in [(0, 0), (6, 6)]:
+        accumulated, backlink = lcp_engine.path_distance(dem, None, None, [source], weights=weights)
+        for target in [(6, 7), (3, 3), (0, 6), (0, 7), source]:
+            paths, costs = lcp_engine.trace_paths(accumulated, backlink, [target])
+            path, cost, expanded = lcp_engine.astar_path(dem, weights, source, target, landmarks)
+            assert cost == costs[0]
+            if paths[0] is None:
+                assert path is None
+                continue
+            assert path[0] == target[0] * dem.shape[1] + target[1]
+            assert path[-1] == source[0] * dem.shape[1] + source[1]
+            assert expanded <= np.count_nonzero(np.isfinite(accumulated))
+    # the cell farthest from the last source cannot be reached for half its cost
+    reached = np.where(np.isfinite(accumulated), accumulated, -1.0)
+    far = divmod(int(np.argmax(reached)), dem.shape[1])
+    limit = float(reached.max()) / 2.0
+    assert lcp_engine.astar_path(dem, weights, (6, 6), far, landmarks, max_cost=limit)[:2] == (None, math.inf)
+
+
+def test_allocate_matches_separate_searches():
+    dem = rough_dem()
+    dem[6, 7] = np.nan
+    sources = [(0, 0), (6, 6), (2, 7), (0, 0)]
+    accumulated, backlink = lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, sources)
+    allocation = lcp_engine.allocate(backlink, sources)
+    separate = np.stack([lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, [source])[0] for source in sources])
+    reached = np.isfinite(accumulated)
+    assert np.all(allocation[~reached] == -1)
+    # every reached cell goes to a source whose own search reaches it for the least cost, and a shared cell to the first
+    owner_costs = np.take_along_axis(separate, np.maximum(allocation, 0)[None], axis=0)[0]
+    np.testing.assert_allclose(owner_costs[reached], separate.min(axis=0)[reached], rtol=1e-9)
+    assert not np.any(allocation == 3)
+    assert [allocation[source] for source in sources[:3]] == [0, 1, 2]
+
+
+@pytest.mark.parametrize('max_cost', [None, 60.0])
+def test_repair_matches_a_new_search(max_cost):
+    dem = rough_dem()
+    weights = lcp_engine.edge_costs(dem, CELLSIZE, SLOPE_TABLE)
+    grids = lcp_engine.path_distance(dem, None, None, [(3, 1)], weights=weights, max_cost=max_cost)
+    # a cut through the ridge, a new NoData cell, and a raised cell on the far side of it
+    edited = dem.copy()
+    edited[3, 4] = 0.5 * (edited[3, 3] + edited[3, 5])
+    edited[0, 2] = np.nan
+    edited[5, 6] += 8.0
+    changed = edited != dem
+    changed |= np.isnan(edited) != np.isnan(dem)
+    edited_weights = lcp_engine.edge_costs(edited, CELLSIZE, SLOPE_TABLE)
+    expected, _ = lcp_engine.path_distance(edited, None, None, [(3, 1)], weights=edited_weights, max_cost=max_cost)
+    # the grids may come straight from a search, or at float32 precision from the grid cache
+    for accumulated, tolerance in ((grids[0], 1e-9), (grids[0].astype('float32'), 1e-6)):
+        repaired, backlink, cells = lcp_engine.repair_path_distance(edited_weights, accumulated, grids[1], changed,
+                                                                    max_cost)
+        assert 0 < cells < dem.size
+        assert np.array_equal(np.isinf(repaired), np.isinf(expected))
+        reached = np.isfinite(expected)
+        np.testing.assert_allclose(repaired[reached], expected[reached], rtol=tolerance)
+        assert np.all(backlink[~reached] == lcp_engine.BACKLINK_NODATA)
+        # the repaired backlinks still lead every reached cell back to the source
+        reached_cells = [divmod(int(index), dem.shape[1]) for index in np.flatnonzero(reached)]
+        paths, costs = lcp_engine.trace_paths(repaired, backlink, reached_cells)
+        assert all(path[-1] == 3 * dem.shape[1] + 1 for path in paths)
+
+
+def test_trace_paths_follow_backlinks_to_the_source():
+    dem = rough_dem()
+    rows, cols = dem.shape
+    dem[6, 7] = np.nan
+    accumulated, backlink = lcp_engine.path_distance(dem, CELLSIZE, SLOPE_TABLE, [(3, 1)])
+    cells = [(0, 7), (6, 0), (3, 1), (6, 7)]
+    paths, costs = lcp_engine.trace_paths(accumulated, backlink, cells)
+    for (row, col), path, cost in zip(cells, paths, costs):
+        if (row, col) == (6, 7):
+            assert path is None
+            assert math.isinf(cost)
+            continue
+        assert path[0] == row * cols + col
+        assert path[-1] == 3 * cols + 1
+        assert cost == pytest.approx(accumulated[row, col], rel=1e-6)
+        # the cost of the moves along the path, from the source out, adds up to the cost of the destination
+        steps = [divmod(int(index), cols) for index in path[::-1]]
+        total = sum(move_cost(dem, r0, c0, r1, c1, SLOPE_TABLE) for (r0, c0), (r1, c1) in zip(steps, steps[1:]))
+        assert total == pytest.approx(cost, rel=1e-6)
+    assert paths[2].tolist() == [3 * cols + 1]
+
+
+def test_path_lengths_by_hand():
+    cols = 5
+    # three moves east, then one southeast: 3 cell widths and one cell diagonal
+    path = np.array([0, 1, 2, 3, cols + 4])
+    dem = np.zeros((2, cols))
+    dem[1, 4] = 10.0
+    lengths = lcp_engine.path_lengths([path, None, np.array([7])], CELLSIZE, cols)
+    assert lengths[0] == pytest.approx(3 * CELLSIZE + math.sqrt(2.0) * CELLSIZE)
+    assert math.isnan(lengths[1])
+    assert lengths[2] == 0.0
+    surface = lcp_engine.path_lengths([path], CELLSIZE, cols, dem)
+    assert surface[0] == pytest.approx(3 * CELLSIZE + math.sqrt(2.0 * CELLSIZE ** 2 + 10.0 ** 2))
+
+
+def test_alternative_paths_start_with_the_least_cost_path():
+    dem = np.random.default_rng(9).uniform(0.0, 12.0, (12, 14))
+    rows, cols = dem.shape
+    weights = lcp_engine.edge_costs(dem, CELLSIZE, SLOPE_TABLE)
+    source, destination = (1, 2), (10, 11)
+    forward = lcp_engine.path_distance(dem, None, None, [source], weights=weights)
+    backward = lcp_engine.path_distance(dem, None, None, [destination],
+                                        weights=lcp_engine.reverse_edge_costs(weights, dem.shape))
+    costs = lcp_engine.trace_paths(forward[0], forward[1], [destination])[1]
+    stretch, max_overlap = 0.2, 0.8
+    paths = lcp_engine.alternative_paths(forward[0], forward[1], backward[0], backward[1], 4, stretch, max_overlap)
+    assert len(paths) > 1
+    assert paths[0][1] == pytest.approx(costs[0], rel=1e-6)
+    assert [cost for path, cost in paths] == sorted(cost for path, cost in paths)
+    kept = set()
+    for path, cost in paths:
+        assert cost <= paths[0][1] * (1.0 + stretch)
+        assert cost == float(np.float32(cost))
+        assert path[0] == destination[0] * cols + destination[1]
+        assert path[-1] == source[0] * cols + source[1]
+        assert len(set(path.tolist())) == path.size
+        assert len(kept.intersection(path.tolist())) <= max_overlap * path.size
+        kept.update(path.tolist())
+        # the cost of the moves along the path, from the source out, adds up to the cost of the path
+        steps = [divmod(int(index), cols) for index in path[::-1]]
+        total = sum(move_cost(dem, r0, c0, r1, c1, SLOPE_TABLE) for (r0, c0), (r1, c1) in zip(steps, steps[1:]))
+        assert total == pytest.approx(cost, rel=1e-6)
@@ -0,0 +1,33 @@
+"""python module that tests lcp_grids: backlink grids packed two cells to a byte unpack to the same grid, and saved
+    grids load back with the costs a new search reports."""
+
+import numpy as np
+import pytest
+
+import lcp_engine
+import lcp_grids
+
+
+@pytest.mark.parametrize('shape', [(4, 6), (5, 7), (1, 1)])
+def test_backlinks_pack_two_cells_to_a_byte(shape):
+    values = list(range(9)) + [lcp_engine.BACKLINK_NODATA]
+    backlink = np.random.default_rng(2).choice(values, size=shape).astype('uint8')
+    packed = lcp_grids.pack_backlink(backlink)
+    assert packed.size == (backlink.size + 1) // 2
+    np.testing.assert_array_equal(lcp_grids.unpack_backlink(packed, shape), backlink)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_saved_grids_load_back(tmp_path, compress):
+    dem = np.random.default_rng(4).uniform(0.0, 50.0, (9, 11))
+    dem[3, 3] = np.nan
+    table = (np.array([-60.0, 0.0, 60.0]), np.array([5.0, 1.0, 5.0]))
+    accumulated, backlink = lcp_engine.path_distance(dem, 10.0, table, [(4, 5)])
+    grid_file = str(tmp_path / 'grids.npz')
+    lcp_grids.save_grids(grid_file, accumulated, backlink, compress)
+    loaded, loaded_backlink = lcp_grids.load_grids(grid_file)
+    np.testing.assert_array_equal(loaded_backlink, backlink)
+    np.testing.assert_array_equal(loaded, accumulated.astype('float32'))
+    cells = [(0, 0), (8, 10), (3, 3)]
+    assert (lcp_engine.trace_paths(loaded, loaded_backlink, cells)[1].tolist()
+            == lcp_engine.trace_paths(accumulated, backlink, cells)[1].tolist())
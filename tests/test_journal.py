@@ -0,0 +1,54 @@
+"""python module that tests lcp_journal: a resumed run reads back the pairs finished before, a line cut short by a
+    crash is dropped, and a journal written with other settings is set aside."""
+
+import os
+
+import lcp_journal
+
+SETTINGS = {'fc_one': 'sites', 'fc_two': 'sites', 'dem': 'dem.tif', 'max_cost': None}
+
+
+def test_resume_reads_back_finished_pairs(tmp_path):
+    path = str(tmp_path / 'progress.jsonl')
+    journal = lcp_journal.Journal(path, SETTINGS, sync=False)
+    journal.record(('sites', 'a', 'b'), ('A', 'B', 12.5, 300.0))
+    journal.record(('sites', 'a', 'c'), None)
+    journal.close()
+
+    resumed = lcp_journal.Journal(path, SETTINGS, sync=False)
+    assert resumed.is_done(('sites', 'a', 'b'))
+    assert resumed.is_done(['sites', 'a', 'c'])
+    assert not resumed.is_done(('sites', 'b', 'a'))
+    assert [record['row'] for record in resumed.records] == [['A', 'B', 12.5, 300.0], None]
+    resumed.record(('sites', 'b', 'a'), ('B', 'A', 13.0, 301.0))
+    resumed.close()
+    assert len(lcp_journal.Journal(path, SETTINGS, sync=False).completed) == 3
+
+
+def test_torn_last_line_is_dropped_and_trimmed(tmp_path):
+    path = str(tmp_path / 'progress.jsonl')
+    journal = lcp_journal.Journal(path, SETTINGS, sync=False)
+    journal.record(('sites', 'a', 'b'), ('A', 'B', 12.5, 300.0))
+    journal.close()
+    with open(path, 'ab') as journal_file:
+        journal_file.write(b'{"key": ["sites", "a", "c"], "row": ["A", "C", 1')
+
+    resumed = lcp_journal.Journal(path, SETTINGS, sync=False)
+    assert resumed.completed == {('sites', 'a', 'b')}
+    resumed.record(('sites', 'a', 'c'), ('A', 'C', 14.0, 320.0))
+    resumed.close()
+    # the new record starts on a line of its own, so the journal reads back whole
+    assert lcp_journal.Journal(path, SETTINGS, sync=False).completed == {('sites', 'a', 'b'), ('sites', 'a', 'c')}
+
+
+def test_other_settings_start_a_new_journal(tmp_path):
+    path = str(tmp_path / 'progress.jsonl')
+    journal = lcp_journal.Journal(path, SETTINGS, sync=False)
+    journal.record(('sites', 'a', 'b'), ('A', 'B', 12.5, 300.0))
+    journal.close()
+
+    changed = dict(SETTINGS, max_cost=1000)
+    fresh = lcp_journal.Journal(path, changed, sync=False)
+    assert not fresh.completed
+    fresh.close()
+    assert any(name.startswith('progress.jsonl.') and name.endswith('.old') for name in os.listdir(str(tmp_path)))
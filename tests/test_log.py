@@ -0,0 +1,36 @@
+"""python module that tests lcp_log: every event logged is on disk, in order, once the log is closed, whether it is
+    written as text or as lines of JSON, and events below the chosen level are left out."""
+
+import json
+
+import lcp_log
+
+
+def test_every_event_is_written_in_order(tmp_path):
+    path = str(tmp_path / 'log.jsonl')
+    log = lcp_log.EventLog(path, 'debug', json_lines=True)
+    for n in range(2000):
+        log.event('debug', 'pair ' + str(n), echo=False, source='s' + str(n), seconds=0.5)
+    log.close()
+    with open(path, encoding='utf-8') as log_file:
+        records = [json.loads(line) for line in log_file]
+    assert [record['message'] for record in records] == ['pair ' + str(n) for n in range(2000)]
+    assert records[-1]['source'] == 's1999' and records[-1]['level'] == 'debug'
+
+
+def test_text_log_keeps_the_header_and_leaves_out_lower_levels(tmp_path, capsys):
+    path = str(tmp_path / 'log.txt')
+    log = lcp_log.EventLog(path, 'warning')
+    log.header(lcp_log.SEPARATOR, 'Event log')
+    log.info('left out')
+    log.warning('no path', source='a', destination='b')
+    log.error('failed', stage='vectorize', error='ERROR 010151: No features found.')
+    log.close()
+    with open(path, encoding='utf-8') as log_file:
+        lines = log_file.read().splitlines()
+    assert lines[:2] == [lcp_log.SEPARATOR, 'Event log']
+    assert lines[2].endswith('WARNING no path [source=a, destination=b]')
+    assert lines[3].endswith('ERROR failed [stage=vectorize, code=010151]')
+    assert lines[4:] == ['ERROR 010151: No features found.', lcp_log.SEPARATOR]
+    # events are printed whatever the level of the log
+    assert capsys.readouterr().out.splitlines() == ['left out', 'no path', 'failed', 'ERROR 010151: No features found.']
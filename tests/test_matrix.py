@@ -0,0 +1,68 @@
+"""python module that tests lcp_matrix: pairs are stored under the labels of their row and column, a resumed run keeps
+    the pairs stored before, and pairs not yet calculated read back as NaN and pairs without a path as infinity."""
+
+import math
+
+import numpy as np
+import pytest
+
+import lcp_matrix
+
+ROWS = ['a', 'b', 'c']
+COLUMNS = ['x', 'y']
+
+
+def test_pairs_are_stored_under_their_labels(tmp_path):
+    prefix = str(tmp_path / 'matrix')
+    matrix = lcp_matrix.CostMatrix(prefix, ROWS, COLUMNS, ['Site A', 'Site B', 'Site C'])
+    matrix.set('b', 'y', 12.5, 300.0)
+    matrix.set('c', 'x', None, None)
+    matrix.set('a', 'x', 7.25, 'NA')
+    matrix.close()
+    cost, distance, labels = lcp_matrix.open_matrix(prefix)
+    assert labels['rows'] == ROWS and labels['columns'] == COLUMNS
+    assert labels['row_names'] == ['Site A', 'Site B', 'Site C'] and labels['column_names'] is None
+    assert cost[1, 1] == 12.5 and distance[1, 1] == 300.0
+    # a pair without a least cost path is infinite, and a distance that was not measured is NaN
+    assert math.isinf(cost[2, 0]) and math.isnan(distance[2, 0])
+    assert cost[0, 0] == 7.25 and math.isnan(distance[0, 0])
+    # pairs not yet calculated are NaN in both matrices
+    assert np.isnan(cost[0, 1]) and np.isnan(distance[0, 1])
+    assert np.count_nonzero(np.isnan(cost)) == 3
+
+
+def test_a_row_is_filled_pair_by_pair(tmp_path):
+    prefix = str(tmp_path / 'matrix')
+    matrix = lcp_matrix.CostMatrix(prefix, ROWS, COLUMNS)
+    for n, column in enumerate(COLUMNS):
+        matrix.set('c', column, 10.0 + n, 100.0 + n)
+    matrix.flush()
+    # other programs see the row once it is flushed, while the matrix is still open
+    cost, distance, labels = lcp_matrix.open_matrix(prefix)
+    assert cost[2].tolist() == [10.0, 11.0] and distance[2].tolist() == [100.0, 101.0]
+    assert np.all(np.isnan(cost[:2]))
+    matrix.close()
+
+
+def test_resume_keeps_the_pairs_stored_before(tmp_path):
+    prefix = str(tmp_path / 'matrix')
+    matrix = lcp_matrix.CostMatrix(prefix, ROWS, COLUMNS)
+    matrix.set('a', 'y', 12.5, 300.0)
+    matrix.close()
+
+    resumed = lcp_matrix.CostMatrix(prefix, ROWS, COLUMNS, resume=True)
+    resumed.set('b', 'x', 4.0, 40.0)
+    resumed.close()
+    cost = lcp_matrix.open_matrix(prefix)[0]
+    assert cost[0, 1] == 12.5 and cost[1, 0] == 4.0
+    # matrices saved with other labels, or a run that is not resumed, start over
+    for columns, resume in ((['x', 'z'], True), (COLUMNS, False)):
+        lcp_matrix.CostMatrix(prefix, ROWS, columns, resume=resume).close()
+        assert np.all(np.isnan(lcp_matrix.open_matrix(prefix)[0]))
+
+
+def test_labels_need_to_be_unique_and_known(tmp_path):
+    with pytest.raises(ValueError):
+        lcp_matrix.CostMatrix(str(tmp_path / 'matrix'), ['a', 'a'], COLUMNS)
+    with pytest.raises(KeyError):
+        lcp_matrix.CostMatrix(str(tmp_path / 'matrix'), ROWS, COLUMNS).set('d', 'x', 1.0, 1.0)
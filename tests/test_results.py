@@ -0,0 +1,42 @@
+"""python module that tests lcp_results: rows written through a ResultBuffer in batches read back unchanged in every
+    format, with distances that were not measured read back as None."""
+
+import math
+
+import pytest
+
+import lcp_results
+
+ROWS = [('a', 'b', 12.5, 300.0), ('a', 'c', math.inf, None), ('b', 'c', 7.25, 'NA'), ('c', 'a', 0.0, 0.0)]
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.parquet', '.feather'])
+def test_rows_read_back_in_every_format(tmp_path, extension):
+    if extension != '.csv':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / ('results' + extension))
+    buffer = lcp_results.ResultBuffer(path, batch_size=3)
+    for row in ROWS:
+        buffer.add(*row)
+    buffer.close()
+    assert buffer.count == len(ROWS)
+    expected = [(source, destination, cost, lcp_results._as_float(distance)) for source, destination, cost, distance
+                in ROWS]
+    expected = [row[:3] + (None if math.isnan(row[3]) else row[3],) for row in expected]
+    assert list(lcp_results.read_results(path)) == expected
+
+
+def test_rows_are_written_every_batch(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    buffer = lcp_results.ResultBuffer(path, batch_size=2)
+    for row in ROWS[:3]:
+        buffer.add(*row)
+    # the first batch of two rows is on disk, the third row waits in memory for the next batch
+    assert len(list(lcp_results.read_results(path))) == 2
+    buffer.close()
+    assert len(list(lcp_results.read_results(path))) == 3
+
+
+def test_unknown_format_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        lcp_results.ResultBuffer(str(tmp_path / 'results.xlsx'))
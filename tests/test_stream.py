@@ -0,0 +1,165 @@
+"""python module that tests lcp_stream: least_cost_paths skips pairs finished before, hands over the grids of every
+    source, and traces the same paths whether it yields names or whole locations."""
+
+import os
+
+import numpy as np
+import pytest
+
+import lcp_costs
+import lcp_engine
+import lcp_results
+import lcp_stream
+
+COST_MODEL = lcp_costs.cost_function('tobler')
+
+
+# Function that returns a small rough DEM and two sets of locations on it.
+def small_study():
+    dem = np.random.default_rng(11).uniform(0.0, 40.0, (20, 25))
+    sources = [('Site 0', 's0', (2, 3)), ('Site 1', 's1', (15, 20))]
+    destinations = [('Site 2', 'd0', (10, 24)), ('Site 3', 'd1', (19, 0)), ('Site 4', 'd2', (0, 12))]
+    return dem, sources, destinations
+
+
+def test_traced_paths_match_path_results():
+    dem, sources, destinations = small_study()
+    results = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations))
+    traced = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations, with_paths=True))
+    assert [(path.source[0], path.destination[0], path.cost, path.distance) for path in traced] == \
+        [tuple(result) for result in results]
+    cols = dem.shape[1]
+    for path in traced:
+        assert path.path[0] == path.destination[2][0] * cols + path.destination[2][1]
+        assert path.path[-1] == path.source[2][0] * cols + path.source[2][1]
+
+
+def test_completed_pairs_are_skipped(tmp_path):
+    dem, sources, destinations = small_study()
+    completed = {('s0', 'd1'), ('s1', 'd0'), ('s1', 'd2')}
+    results = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations, completed=completed,
+                                               scratch=str(tmp_path / 'scratch'), with_paths=True))
+    assert [(result.source[1], result.destination[1]) for result in results] == [('s0', 'd0'), ('s0', 'd2'),
+                                                                                  ('s1', 'd1')]
+    pairs = [(sources[0], destinations[1]), (sources[1], destinations[1]), (sources[0], destinations[2])]
+    results = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, pairs=pairs, completed=completed))
+    assert [(result.source, result.destination) for result in results] == [('Site 1', 'Site 3'), ('Site 0', 'Site 4')]
+
+
+def test_grids_are_handed_over_before_the_results_of_their_source(tmp_path):
+    dem, sources, destinations = small_study()
+    handed = []
+
+    def on_grids(source, grid_file):
+        assert os.path.exists(grid_file)
+        handed.append(source)
+        os.remove(grid_file)
+
+    for result in lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations, on_grids=on_grids,
+                                              scratch=str(tmp_path / 'scratch'), with_paths=True):
+        assert handed[-1] == result.source
+    assert handed == sources
+
+
+def test_read_pairs(tmp_path):
+    dem, sources, destinations = small_study()
+    pairs_file = tmp_path / 'pairs.csv'
+    pairs_file.write_text('from,to\ns1, d2\n\ns0,d0\n')
+    assert lcp_stream.read_pairs(str(pairs_file), sources, destinations) == [(sources[1], destinations[2]),
+                                                                             (sources[0], destinations[0])]
+    pairs_file.write_text('s0,d0\ns0,d9\n')
+    with pytest.raises(ValueError):
+        lcp_stream.read_pairs(str(pairs_file), sources, destinations)
+
+
+def test_nearest_sources_hands_back_whole_locations():
+    dem, sources, destinations = small_study()
+    dem[19, 0] = np.nan
+    # two sources may share a name, but not a file name
+    sources = [('Camp', 'c0', (2, 3)), ('Camp', 'c1', (15, 20))]
+    allocation, accumulated, results = lcp_stream.nearest_sources(dem, 10.0, COST_MODEL, sources, destinations,
+                                                                  with_paths=True)
+    for result in results:
+        if result.destination[1] == 'd1':
+            assert result.source is None and result.path is None
+            continue
+        assert result.source == sources[allocation[result.destination[2]]]
+        assert result.cost == float(np.float32(accumulated[result.destination[2]]))
+    names = lcp_stream.nearest_sources(dem, 10.0, COST_MODEL, sources, destinations)[2]
+    assert [result.source for result in names] == [None if result.source is None else 'Camp' for result in results]
+
+
+def test_round_trip_with_reverse_search_and_a_cache(tmp_path):
+    dem, sources, destinations = small_study()
+    sources = sources + [('Site 5', 's2', (7, 7)), ('Site 6', 's3', (12, 2))]
+    expected = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations, round_trip=True))
+    folder = str(tmp_path / 'cache')
+    # the second run loads the grids the first one cached, in both directions of travel
+    for _ in range(2):
+        results = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, sources, destinations, round_trip=True,
+                                                   reverse=True, cache_folder=folder))
+        assert [result[:2] for result in results] == [result[:2] for result in expected]
+        np.testing.assert_allclose([result.cost for result in results], [result.cost for result in expected],
+                                   rtol=1e-6)
+
+
+def test_command_line_reverse_search_matches_forward_search(tmp_path):
+    dem, sources, destinations = small_study()
+    np.save(str(tmp_path / 'dem.npy'), dem)
+    for file_name, locations in (('one.csv', sources), ('two.csv', destinations[:1])):
+        # cell centres of a DEM whose top edge is at y = 200
+        (tmp_path / file_name).write_text('name,x,y\n' + ''.join(
+            name + ',' + str(col * 10 + 5) + ',' + str(200 - row * 10 - 5) + '\n'
+            for name, short_name, (row, col) in locations))
+    outputs = []
+    for flags in ([], ['--reverse-search']):
+        output = str(tmp_path / ('results' + str(len(outputs)) + '.csv'))
+        assert lcp_stream.main([str(tmp_path / 'dem.npy'), str(tmp_path / 'one.csv'), str(tmp_path / 'two.csv'),
+                                '--cost-function', 'tobler', '--cellsize', '10', '--ymax', '200', '-o', output]
+                               + flags) in (0, None)
+        outputs.append(list(lcp_results.read_results(output)))
+    assert [row[:2] for row in outputs[1]] == [row[:2] for row in outputs[0]]
+    np.testing.assert_allclose([row[2] for row in outputs[1]], [row[2] for row in outputs[0]], rtol=1e-6)
+
+
+@pytest.mark.parametrize('name', ['tobler', 'pandolf'])
+def test_asymmetric_cost_model_is_not_mirrored(name):
+    dem, sources, destinations = small_study()
+    cost_model = lcp_costs.cost_function(name)
+    assert not lcp_engine.is_symmetric(cost_model)
+    locations = sources + destinations
+    full = list(lcp_stream.least_cost_paths(dem, 10.0, cost_model, locations, locations))
+    # costs differ between the two directions of a pair, so mirroring them would be wrong
+    costs = dict(((result.source, result.destination), result.cost) for result in full)
+    assert any(costs[a, b] != costs[b, a] for a, b in costs)
+    # the run falls back to calculating every pair, including those of a location with itself
+    assert list(lcp_stream.least_cost_paths(dem, 10.0, cost_model, locations, locations, symmetric=True)) == full
+
+
+def test_symmetric_cost_model_is_mirrored():
+    dem, sources, destinations = small_study()
+    table = (np.array([-60.0, 0.0, 60.0]), np.array([6.0, 1.0, 6.0]))
+    assert lcp_engine.is_symmetric(table)
+    locations = sources + destinations
+    full = list(lcp_stream.least_cost_paths(dem, 10.0, table, locations, locations))
+    results = list(lcp_stream.least_cost_paths(dem, 10.0, table, locations, locations, symmetric=True))
+    expected = [result for result in full if result.source != result.destination]
+    assert [result[:2] for result in results] == [result[:2] for result in expected]
+    np.testing.assert_allclose([result[2:] for result in results], [result[2:] for result in expected], rtol=1e-6)
+
+
+@pytest.mark.parametrize('stretch', [0.0, 0.1, 0.3])
+def test_corridors_hold_the_cells_within_stretch_of_the_least_cost(stretch):
+    dem, sources, destinations = small_study()
+    pairs = [(sources[0], destinations[0]), (sources[1], destinations[1])]
+    expected = list(lcp_stream.least_cost_paths(dem, 10.0, COST_MODEL, pairs=pairs))
+    results = list(lcp_stream.corridors(dem, 10.0, COST_MODEL, pairs, stretch=stretch))
+    assert [(result.source, result.destination) for result in results] == [result[:2] for result in expected]
+    for result, path_result in zip(results, expected):
+        assert result.cost == pytest.approx(path_result.cost, rel=1e-6)
+        assert result.paths[0].cost == result.cost
+        finite = result.corridor[np.isfinite(result.corridor)]
+        assert finite.size and finite.max() <= result.cost * (1.0 + stretch) * (1.0 + 1e-6)
+        for alternative in result.paths:
+            assert alternative.cost <= result.cost * (1.0 + stretch)
+            assert np.all(np.isfinite(result.corridor.ravel()[alternative.path]))
@@ -0,0 +1,51 @@
+"""python module that tests lcp_timing: nested stages are each timed in full, totals add up over every stage, and the
+    trace file holds a line for each stage and the totals once the timer is closed."""
+
+import json
+
+import pytest
+
+import lcp_timing
+
+
+def test_nested_stages_and_totals():
+    timer = lcp_timing.StageTimer(keep_records=True)
+    with timer.stage('outer', source='a') as outer:
+        for n in range(3):
+            with timer.stage('inner', cells=10) as record:
+                record['bytes_written'] = n
+        outer['cells'] = 5
+    timer.add('worker', 2.0, cells=None, destination='b')
+    # a stage is recorded when it ends, so inner stages come before the stage holding them
+    assert [record['stage'] for record in timer.records] == ['inner', 'inner', 'inner', 'outer', 'worker']
+    assert timer.records[3]['seconds'] >= sum(record['seconds'] for record in timer.records[:3])
+    assert timer.records[3]['source'] == 'a'
+    assert timer.totals['inner'][0] == 3 and timer.totals['inner'][2:] == [30, 3]
+    assert timer.totals['outer'][2:] == [5, 0]
+    # a stage that does not know how many cells it expanded adds none to the totals
+    assert timer.totals['worker'] == [1, 2.0, 0, 0]
+    lines = timer.summary()
+    assert [line.split()[0] for line in lines] == ['Stage', 'worker', 'outer', 'inner']
+
+
+def test_stage_is_recorded_when_its_block_raises():
+    timer = lcp_timing.StageTimer()
+    with pytest.raises(ValueError):
+        with timer.stage('failing'):
+            raise ValueError('failed')
+    assert timer.totals['failing'][0] == 1
+
+
+def test_trace_holds_every_stage_once_closed(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    timer = lcp_timing.StageTimer(path)
+    for n in range(100):
+        with timer.stage('trace_paths', source='s' + str(n)):
+            pass
+    # the trace is held in memory until the timer is closed
+    assert (tmp_path / 'trace.jsonl').read_text() == ''
+    timer.close()
+    with open(path, encoding='utf-8') as trace_file:
+        records = [json.loads(line) for line in trace_file]
+    assert [record['source'] for record in records[:-1]] == ['s' + str(n) for n in range(100)]
+    assert records[-1]['summary']['trace_paths']['count'] == 100